@@ -1,8 +1,21 @@
-from distutils.core import setup
+import sys
+
+# setuptools installs the ssapi command, plain distutils only the modules.
+try:
+   from setuptools import setup
+except ImportError:
+   from distutils.core import setup
+
+modules = [ 'ssapi', 'ssapi_bench', 'ssapi_cli', 'ssapi_exporter' ]
+
+# The asyncio API needs Python 3.7 or later.
+if sys.version_info >= ( 3, 7 ):
+   modules.append( 'ssapi_async' )
 
 setup( name = 'ssapi',
        version = '1.00',
-       py_modules = [ 'ssapi' ],
+       py_modules = modules,
+       entry_points = { 'console_scripts': [ 'ssapi = ssapi_cli:main' ] },
      )
 
 
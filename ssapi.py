@@ -25,193 +25,3465 @@
 
 from __future__ import print_function
 from subprocess import Popen, PIPE
+from collections import OrderedDict
+from array import array
+import os
+import re
 import sys
+import signal
+import contextlib
+import json
 import shlex
 import time
-import socket
-import inspect
+import functools
+import heapq
+import threading
 
+try:
+   import queue
+except ImportError:
+   import Queue as queue
 
-def execute_command( commandString=None, Debug=False ):
+try:
+   from shlex import quote as shell_quote
+except ImportError:
+   from pipes import quote as shell_quote
+
+try:
+   string_types = basestring
+except NameError:
+   string_types = str
+
+# NumPy is optional, it is only used by the capacity report.  It takes longer to
+# import than ssapi itself, so it is imported the first time a report is built.
+# False means it has not been imported yet, None that it is not installed.
+numpy = False
+
+
+def import_numpy():
+    """
+    Return the numpy module, or None if it is not installed.
+    """
+    global numpy
+    if numpy is False:
+       try:
+          import numpy as module
+       except ImportError:
+          module = None
+       numpy = module
+    return numpy
+
+
+# Commands that change cluster state, and the listing commands whose cached
+# output they make stale.  Entries are invalidated for the same device.
+cache_invalidations = { 'mmcrsnapshot':    ( 'mmlssnapshot', ),
+                        'mmdelsnapshot':   ( 'mmlssnapshot', ),
+                        'mmcrfileset':     ( 'mmlsfileset', ),
+                        'mmdelfileset':    ( 'mmlsfileset', 'mmlssnapshot' ),
+                        'mmlinkfileset':   ( 'mmlsfileset', ),
+                        'mmunlinkfileset': ( 'mmlsfileset', ),
+                        'mmchfileset':     ( 'mmlsfileset', ),
+                        'mmchfs':          ( 'mmlsfs', ),
+                        'mmadddisk':       ( 'mmlsfs', 'mmlsnsd', 'mmlspool' ),
+                        'mmdeldisk':       ( 'mmlsfs', 'mmlsnsd', 'mmlspool' ),
+                        'mmcrnsd':         ( 'mmlsnsd', ),
+                        'mmdelnsd':        ( 'mmlsnsd', ),
+                        'mmchmgr':         ( 'mmlsmgr', ),
+                        'mmchcluster':     ( 'mmlscluster', ),
+                        'mmaddnode':       ( 'mmlscluster', ),
+                        'mmdelnode':       ( 'mmlscluster', ),
+                        'mmsetquota':      ( 'mmrepquota', ),
+                        'mmedquota':       ( 'mmrepquota', ),
+                      }
+
+
+#-------------------------------------------------------------------------------------
+# Instrumentation
+#
+# Hooks are called with an event dictionary for every command ssapi runs and every
+# parse of a command's output:
+#
+#    { 'event': 'command_start', 'command', 'time' }
+#    { 'event': 'command_end', 'command', 'seconds', 'rc', 'stdout_bytes', 'stderr_bytes', 'cached' }
+#    { 'event': 'parse', 'parser', 'seconds' }
+#
+# For streamed commands the output is read while it is parsed, so the parse time
+# includes the command.  When no hook is registered the only cost is a check of
+# command_hooks.  LatencyHistogram is a hook that keeps per command histograms.
+#
+# An exception raised by a hook does not stop the command or the other hooks, it is
+# printed when the command was run with Debug.
+#-------------------------------------------------------------------------------------
+
+command_hooks = ()
+
+
+def add_hook( hook ):
+    """
+    Register a callable that is called with every instrumentation event.
+    """
+    global command_hooks
+    command_hooks = command_hooks + ( hook, )
+
+
+def remove_hook( hook ):
+    global command_hooks
+    command_hooks = tuple( h for h in command_hooks if h is not hook )
+
+
+def emit_event( event, Debug=False ):
+    for hook in command_hooks:
+        try:
+           hook( event )
+        except Exception as e:
+           if Debug:
+              print("DEBUG: Hook {} failed on {}: {}".format(hook, event['event'], e))
+
+
+def hook_command_start( commandString, Debug=False ):
+    """
+    Send the command_start event.  Returns the start time to pass to hook_command_end,
+    or None if there are no hooks.
+    """
+    if not command_hooks:
+       return None
+    start = time.time()
+    emit_event( { 'event': 'command_start', 'command': commandString, 'time': start }, Debug )
+    return start
+
+
+def hook_command_end( commandString, start, rc, stdout_bytes, stderr_bytes, cached=False, Debug=False ):
+    if start is None or not command_hooks:
+       return
+    emit_event( { 'event': 'command_end',
+                  'command': commandString,
+                  'seconds': time.time() - start,
+                  'rc': rc,
+                  'stdout_bytes': stdout_bytes,
+                  'stderr_bytes': stderr_bytes,
+                  'cached': cached,
+                }, Debug )
+
+
+def instrumented_parser( parser ):
+    """
+    Decorator for the parse_* functions that sends a parse event with their run time.
+    """
+    @functools.wraps( parser )
+    def wrapper( *args, **kwargs ):
+        if not command_hooks:
+           return parser( *args, **kwargs )
+        start = time.time()
+        result = parser( *args, **kwargs )
+        emit_event( { 'event': 'parse', 'parser': parser.__name__, 'seconds': time.time() - start } )
+        return result
+    return wrapper
+
+
+class LatencyHistogram:
+    """
+    A hook that keeps a latency histogram for every mm command, by command name, and
+    for every parser.  Cached results are counted but not added to the histograms.
+
+        histogram = ssapi.LatencyHistogram()
+        ssapi.add_hook( histogram )
+        ...
+        print( histogram.summary() )
+    """
+    # The upper bound of each bucket in seconds.  The last bucket holds the rest.
+    default_buckets = ( 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0 )
+
+    def __init__( self, buckets=None ):
+        self.buckets = tuple( buckets or self.default_buckets )
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def reset( self ):
+        self.commands = {}
+        self.parsers = {}
+        self.cached = {}
+
+
+    def add( self, table, name, seconds ):
+        entry = table.get( name )
+        if entry is None:
+           entry = table[name] = { 'count': 0, 'total': 0.0, 'min': None, 'max': None,
+                                   'buckets': [0] * ( len( self.buckets ) + 1 ) }
+        entry['count'] = entry['count'] + 1
+        entry['total'] = entry['total'] + seconds
+        if entry['min'] is None or seconds < entry['min']:
+           entry['min'] = seconds
+        if entry['max'] is None or seconds > entry['max']:
+           entry['max'] = seconds
+
+        idx = 0
+        while idx < len( self.buckets ) and seconds > self.buckets[idx]:
+            idx = idx + 1
+        entry['buckets'][idx] = entry['buckets'][idx] + 1
+
+
+    def __call__( self, event ):
+        if event['event'] == 'command_end':
+           name = os.path.basename( event['command'].split()[0] )
+           with self.lock:
+              if event['cached']:
+                 self.cached[name] = self.cached.get( name, 0 ) + 1
+              else:
+                 self.add( self.commands, name, event['seconds'] )
+        elif event['event'] == 'parse':
+           with self.lock:
+              self.add( self.parsers, event['parser'], event['seconds'] )
+
+
+    def percentile( self, entry, fraction ):
+        """
+        Return the upper bound of the bucket that holds the given fraction of the
+        samples, or None if it is in the last, unbounded bucket.
+        """
+        wanted = fraction * entry['count']
+        seen = 0
+        for ( idx, count ) in enumerate( entry['buckets'] ):
+            seen = seen + count
+            if seen >= wanted and count:
+               return self.buckets[idx] if idx < len( self.buckets ) else None
+        return None
+
+
+    def summary( self ):
+        """
+        Return a dictionary with the count, mean, min, max, p50, p90, p99 and bucket
+        counts of every command and parser, and the cached hit counts.
+        """
+        with self.lock:
+           result = { 'commands': {}, 'parsers': {}, 'cached': dict( self.cached ), 'buckets': self.buckets }
+           for ( kind, table ) in ( ( 'commands', self.commands ), ( 'parsers', self.parsers ) ):
+               for ( name, entry ) in table.items():
+                   result[kind][name] = { 'count': entry['count'],
+                                          'mean': entry['total'] / entry['count'],
+                                          'min': entry['min'],
+                                          'max': entry['max'],
+                                          'p50': self.percentile( entry, 0.50 ),
+                                          'p90': self.percentile( entry, 0.90 ),
+                                          'p99': self.percentile( entry, 0.99 ),
+                                          'buckets': list( entry['buckets'] ),
+                                        }
+           return result
+
+
+#-------------------------------------------------------------------------------------
+# Command backends
+#
+# Every command ssapi runs, and every GPFS configuration file it reads, goes through
+# the command backend.  The default runs the commands on this node.  The recording
+# and replay backends let the parsers be run and measured off-cluster:
+#
+#    ssapi.set_command_backend( ssapi.RecordingBackend( '/tmp/fixtures' ) )
+#    ssapi.set_command_backend( ssapi.ReplayBackend( '/tmp/fixtures' ) )
+#
+# ssapi_bench has a backend that generates large synthetic outputs.
+#-------------------------------------------------------------------------------------
+
+class CommandBackend:
+    """
+    The interface of a command backend.  A backend has to provide run(), and can
+    override stream(), read_file() and read_lines().
+    """
+    def run( self, shellCommand ):
+        """
+        Run the split command and return ( return code, stdout, stderr ).
+        """
+        raise NotImplementedError
+
+
+    def stream( self, shellCommand, status ):
+        """
+        A generator that yields the STDOUT lines of the split command, without the
+        newline.  When the command is done, set status.returncode and status.stderr.
+        """
+        ( status.returncode, outdata, status.stderr ) = self.run( shellCommand )
+        for line in outdata.splitlines():
+            yield line
+
+
+    def read_file( self, path ):
+        """
+        Return the contents of a GPFS configuration file.
+        """
+        f = open( path, 'r' )
+        try:
+           return f.read()
+        finally:
+           f.close()
+
+
+    def read_lines( self, path ):
+        """
+        A generator that yields the lines of a GPFS configuration file, without the
+        newline, so the caller can stop once it has what it needs.
+        """
+        for line in self.read_file( path ).splitlines():
+            yield line
+
+
+# The Popen arguments that start a command in its own process group, so everything
+# it started can be killed.  start_new_session is done in the child without running
+# Python code, which preexec_fn does and which can deadlock when other threads are
+# running.  Python 2 only has preexec_fn.
+if sys.version_info >= ( 3, 2 ):
+   new_session = { 'start_new_session': True }
+else:
+   new_session = { 'preexec_fn': os.setsid }
+
+
+class SubprocessBackend( CommandBackend ):
+    """
+    The default backend, it runs the commands on this node.  When a command is run
+    by the CommandScheduler, it gets its own process group so a timeout or a
+    cancellation can kill everything it started.
+    """
+    def popen( self, shellCommand, **kwargs ):
+        ticket = current_ticket()
+        if ticket is not None:
+           kwargs.update( new_session )
+        subp = Popen( shellCommand, universal_newlines=True, **kwargs )
+        if ticket is not None:
+           ticket.attach( subp )
+        return subp
+
+
+    def read_lines( self, path ):
+        # Read the file a line at a time, mmsdrfs can be megabytes on a large cluster.
+        f = open( path, 'r' )
+        try:
+           for line in f:
+               yield line.rstrip('\n')
+        finally:
+           f.close()
+
+
+    def run( self, shellCommand ):
+        subp = self.popen( shellCommand, stdout=PIPE, stderr=PIPE )
+        ( outdata, errdata ) = subp.communicate()
+        return ( subp.returncode, outdata, errdata )
+
+
+    def stream( self, shellCommand, status ):
+        # tempfile and hashlib are imported where they are used, to keep the import
+        # of ssapi fast for the command line tool.
+        import tempfile
+        errfile = tempfile.TemporaryFile( mode='w+' )
+        try:
+           subp = self.popen( shellCommand, stdout=PIPE, stderr=errfile )
+           try:
+              for line in subp.stdout:
+                  yield line.rstrip('\n')
+           finally:
+              subp.stdout.close()
+              subp.wait()
+           errfile.seek( 0 )
+           status.returncode = subp.returncode
+           status.stderr = errfile.read()
+        finally:
+           errfile.close()
+
+
+def fixture_name( kind, words ):
+    """
+    Return the file name a fixture is stored under.  It starts with the command or
+    file name so the fixture directory is easy to read.
+    """
+    import hashlib
+    digest = hashlib.sha1( '\0'.join( words ).encode( 'utf-8' ) ).hexdigest()[:16]
+    return "{}-{}-{}.json".format( kind, os.path.basename( words[0] ), digest )
+
+
+class RecordingBackend( CommandBackend ):
+    """
+    Passes every command and file read to another backend, the SubprocessBackend by
+    default, and saves what it returned as a JSON fixture file in directory.
+    """
+    def __init__( self, directory, backend=None ):
+        self.directory = directory
+        self.backend = backend or SubprocessBackend()
+        if not os.path.isdir( self.directory ):
+           os.makedirs( self.directory )
+
+
+    def save( self, name, fixture ):
+        # Write to a temporary file first so a reader never sees a partial fixture.
+        path = os.path.join( self.directory, name )
+        tmppath = "{}.{}.{}".format( path, os.getpid(), threading.current_thread().ident )
+        f = open( tmppath, 'w' )
+        try:
+           json.dump( fixture, f, indent=1, sort_keys=True )
+        finally:
+           f.close()
+        os.rename( tmppath, path )
+
+
+    def run( self, shellCommand ):
+        ( rc, outdata, errdata ) = self.backend.run( shellCommand )
+        self.save( fixture_name( 'cmd', shellCommand ),
+                   { 'command': shellCommand, 'rc': rc, 'stdout': outdata, 'stderr': errdata } )
+        return ( rc, outdata, errdata )
+
+
+    def read_file( self, path ):
+        data = self.backend.read_file( path )
+        self.save( fixture_name( 'file', [ path ] ), { 'path': path, 'data': data } )
+        return data
+
+
+class ReplayBackend( CommandBackend ):
+    """
+    Serves the fixtures saved by a RecordingBackend instead of running anything.  A
+    command or file without a fixture raises ValueError('NoFixture: ...').
+    """
+    def __init__( self, directory ):
+        self.directory = directory
+
+
+    def load( self, name, what ):
+        path = os.path.join( self.directory, name )
+        if not os.path.exists( path ):
+           raise ValueError( 'NoFixture: {}'.format( what ) )
+        f = open( path, 'r' )
+        try:
+           return json.load( f )
+        finally:
+           f.close()
+
+
+    def run( self, shellCommand ):
+        fixture = self.load( fixture_name( 'cmd', shellCommand ), ' '.join( shellCommand ) )
+        return ( fixture['rc'], fixture['stdout'], fixture['stderr'] )
+
+
+    def read_file( self, path ):
+        return self.load( fixture_name( 'file', [ path ] ), path )['data']
+
+
+# The backend every command goes through.
+command_backend = SubprocessBackend()
+
+
+def set_command_backend( backend ):
+    """
+    Send every command through the given backend, and return the previous one.
+    """
+    global command_backend
+    previous = command_backend
+    command_backend = backend
+    return previous
+
+
+class CommandCache:
+    """
+    A process wide cache of execute_command results, keyed by the command and
+    its arguments.  Each entry lives for the TTL of its command, and the least
+    recently used entries are evicted once max_entries is reached.
+
+    ttls[command] = Seconds to keep the output of command, ie: ttls['mmlscluster'] = 300
+                    A TTL of 0 disables caching for that command.
+
+    Only successful (return code 0) results of the reporting commands are cached,
+    see is_shared_command().  The hits, misses and evictions counters are there to
+    help tune the TTLs, see stats().
+    """
+    def __init__( self, max_entries=256, default_ttl=60, ttls=None ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict( ttls or {} )
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+
+    def reset_stats( self ):
+        """
+        Zero the hit, miss, eviction and invalidation counters.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+
+    def key( self, commandString ):
+        return tuple( shlex.split( commandString ) )
+
+
+    def ttl( self, key ):
+        return self.ttls.get( os.path.basename( key[0] ), self.default_ttl )
+
+
+    def get( self, key ):
+        """
+        Return the cached result for key, or None if it is missing or expired.
+        """
+        with self.lock:
+           entry = self.entries.get( key )
+           if entry is None:
+              self.misses = self.misses + 1
+              return None
+
+           ( expires, result ) = entry
+           if expires <= time.time():
+              del self.entries[key]
+              self.misses = self.misses + 1
+              return None
+
+           # Mark it as the most recently used entry
+           del self.entries[key]
+           self.entries[key] = entry
+           self.hits = self.hits + 1
+           return result
+
+
+    def put( self, key, result ):
+        ttl = self.ttl( key )
+        if ttl <= 0:
+           return
+
+        with self.lock:
+           if key in self.entries:
+              del self.entries[key]
+           self.entries[key] = ( time.time() + ttl, result )
+           while len( self.entries ) > self.max_entries:
+               self.entries.popitem( last=False )
+               self.evictions = self.evictions + 1
+
+
+    def invalidate( self, commands, device=None ):
+        """
+        Drop the cached results of the given command names.  If device is given,
+        only the entries for that device, and those for every device, ie: mmlsmgr -c,
+        are dropped.  See command_device().
+        """
+        with self.lock:
+           for key in list( self.entries.keys() ):
+               if os.path.basename( key[0] ) not in commands:
+                  continue
+               if device and command_device( key ) not in ( None, device ):
+                  continue
+               del self.entries[key]
+               self.invalidations = self.invalidations + 1
+
+
+    def clear( self ):
+        with self.lock:
+           self.entries.clear()
+
+
+    def stats( self ):
+        """
+        Return a dictionary of the cache counters.
+        """
+        with self.lock:
+           return { 'entries': len( self.entries ),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                  }
+
+
+# The cache in front of execute_command.  None until enable_command_cache() is called.
+command_cache = None
+
+
+def enable_command_cache( max_entries=256, default_ttl=60, ttls=None ):
+    """
+    Turn on the process wide execute_command cache and return it.
+    """
+    global command_cache
+    command_cache = CommandCache( max_entries=max_entries, default_ttl=default_ttl, ttls=ttls )
+    return command_cache
+
+
+def disable_command_cache():
+    """
+    Turn off the process wide execute_command cache.
+    """
+    global command_cache
+    command_cache = None
+
+
+#-------------------------------------------------------------------------------------
+# Command scheduler
+#
+# When enabled, every command ssapi runs is admitted by the CommandScheduler:
+#
+#    ssapi.enable_command_scheduler( max_running=8, max_per_device=2, timeout=600 )
+#
+# Commands wait in priority order until fewer than max_running commands, and fewer
+# than max_per_device commands for their device, are running.  A command that runs
+# longer than its timeout has its process group killed and raises
+# ValueError('Timeout: ...'), and a cancelled one raises ValueError('Cancelled: ...').
+#-------------------------------------------------------------------------------------
+
+# The priority classes, lowest number first.  The reporting commands are
+# interactive and the others bulk, unless command_priority() says otherwise.
+priority_classes = { 'interactive': 0, 'normal': 1, 'bulk': 2 }
+
+scheduler_state = threading.local()
+
+
+def current_ticket():
+    """
+    Return the ticket of the command this thread is running for the scheduler.
+    """
+    return getattr( scheduler_state, 'ticket', None )
+
+
+@contextlib.contextmanager
+def command_priority( priority ):
+    """
+    Run the commands of this thread in the given priority class:
+
+        with ssapi.command_priority( 'bulk' ):
+            f.rotate_snapshots( 7 )
+
+    Commands run by worker threads, ie: delete_snapshots(), use their default.
+    """
+    if priority not in priority_classes:
+       raise ValueError( 'UnknownPriority: {}'.format( priority ) )
+    previous = getattr( scheduler_state, 'priority', None )
+    scheduler_state.priority = priority
+    try:
+       yield
+    finally:
+       scheduler_state.priority = previous
+
+
+# Options of the mm commands whose value is never the GPFS device.
+value_options = ( '-d', '-F', '-N', '-J', '-P', '-I', '-C', '-g', '--block', '--files', '--block-size' )
+
+
+def command_device( shellCommand ):
+    """
+    Return the GPFS device a split mm command works on, or None if it works on
+    every device.  The device is the first argument that is not an option or an
+    option's value, without the fileset of the device:fileset form, ie: fs0 for
+    "mmrepquota -u -g -j fs0 -Y" and "mmsetquota fs0:proj1".
+    """
+    previous = None
+    for argument in shellCommand[1:]:
+        if not argument.startswith('-') and previous not in value_options:
+           return argument.split(':')[0]
+        previous = argument
+    return None
+
+
+class CommandTicket:
+    """
+    A command waiting for, or running under, the CommandScheduler.
+    """
+    def __init__( self, shellCommand, priority, device, timeout ):
+        self.command = shellCommand
+        self.priority = priority
+        self.device = device
+        self.timeout = timeout
+        self.state = 'queued'
+        self.outcome = None
+        self.process = None
+        self.timer = None
+        self.queued = time.time()
+        self.started = None
+        self.lock = threading.Lock()
+
+
+    def attach( self, process ):
+        """
+        Called by the backend with the process it started for this command.
+        """
+        with self.lock:
+           self.process = process
+           killed = self.outcome is not None
+        if killed:
+           self.kill()
+
+
+    def stop( self, outcome ):
+        """
+        End the command with outcome 'Timeout' or 'Cancelled'.
+        """
+        with self.lock:
+           if self.outcome is not None or self.state == 'done':
+              return
+           self.outcome = outcome
+        self.kill()
+
+
+    def kill( self ):
+        process = self.process
+        if process is None or process.poll() is not None:
+           return
+        try:
+           os.killpg( process.pid, signal.SIGKILL )
+        except OSError:
+           pass
+
+
+    def check( self ):
+        if self.outcome is not None:
+           raise ValueError( '{}: {}'.format( self.outcome, ' '.join( self.command ) ) )
+
+
+class CommandScheduler:
+    """
+    Admits commands so that at most max_running run at once, and at most
+    max_per_device for one GPFS device.  Waiting commands are admitted by priority
+    class, then in the order they arrived.
+
+    timeouts[command] = Seconds command may run, ie: timeouts['mmlsfileset'] = 300.
+                        Other commands get timeout, None means no limit.
+    """
+    def __init__( self, max_running=8, max_per_device=2, timeout=None, timeouts=None ):
+        self.max_running = max_running
+        self.max_per_device = max_per_device
+        self.timeout = timeout
+        self.timeouts = dict( timeouts or {} )
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.running = []
+        self.sequence = 0
+        self.reset_stats()
+
+
+    def reset_stats( self ):
+        self.completed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.waits = dict( ( priority, { 'count': 0, 'total': 0.0, 'max': 0.0 } ) for priority in priority_classes )
+
+
+    def priority( self, shellCommand ):
+        priority = getattr( scheduler_state, 'priority', None )
+        if priority is not None:
+           return priority
+        return 'interactive' if is_shared_command( shellCommand ) else 'bulk'
+
+
+    def device_running( self, device ):
+        return len( [ ticket for ticket in self.running if ticket.device == device ] )
+
+
+    def admit( self ):
+        """
+        Start every waiting ticket that fits.  Called with the condition held.
+        """
+        admitted = False
+        for entry in sorted( self.waiting ):
+            if len( self.running ) >= self.max_running:
+               break
+            ticket = entry[2]
+            if ticket.device is not None and self.device_running( ticket.device ) >= self.max_per_device:
+               continue
+            self.waiting.remove( entry )
+            ticket.state = 'running'
+            ticket.started = time.time()
+            self.running.append( ticket )
+            admitted = True
+        if admitted:
+           self.condition.notify_all()
+
+
+    def enter( self, shellCommand ):
+        """
+        Wait until the command is admitted and return its ticket.
+        """
+        priority = self.priority( shellCommand )
+        timeout = self.timeouts.get( os.path.basename( shellCommand[0] ), self.timeout )
+        ticket = CommandTicket( shellCommand, priority, command_device( shellCommand ), timeout )
+
+        with self.condition:
+           self.sequence = self.sequence + 1
+           entry = ( priority_classes[priority], self.sequence, ticket )
+           self.waiting.append( entry )
+           self.admit()
+           while ticket.state == 'queued' and ticket.outcome is None:
+               self.condition.wait()
+           if ticket.state == 'queued':
+              self.waiting.remove( entry )
+              self.cancelled = self.cancelled + 1
+              ticket.state = 'done'
+              ticket.check()
+
+           waited = ticket.started - ticket.queued
+           stats = self.waits[priority]
+           stats['count'] = stats['count'] + 1
+           stats['total'] = stats['total'] + waited
+           stats['max'] = max( stats['max'], waited )
+
+        if ticket.timeout:
+           ticket.timer = threading.Timer( ticket.timeout, ticket.stop, ( 'Timeout', ) )
+           ticket.timer.daemon = True
+           ticket.timer.start()
+        scheduler_state.ticket = ticket
+        return ticket
+
+
+    def leave( self, ticket ):
+        """
+        Release the slot of a ticket returned by enter().  Raises ValueError if the
+        command timed out or was cancelled.
+        """
+        scheduler_state.ticket = None
+        if ticket.timer is not None:
+           ticket.timer.cancel()
+        with ticket.lock:
+           ticket.state = 'done'
+        with self.condition:
+           self.running.remove( ticket )
+           if ticket.outcome == 'Timeout':
+              self.timed_out = self.timed_out + 1
+           elif ticket.outcome == 'Cancelled':
+              self.cancelled = self.cancelled + 1
+           else:
+              self.completed = self.completed + 1
+           self.admit()
+        ticket.check()
+
+
+    def run( self, shellCommand, function ):
+        """
+        Run function(), which runs the split command, once it is admitted and return
+        its result.
+        """
+        ticket = self.enter( shellCommand )
+        try:
+           result = function()
+        finally:
+           self.leave( ticket )
+        return result
+
+
+    def stream( self, shellCommand, generator ):
+        """
+        Yield the lines of generator, which streams the split command, once it is
+        admitted.  The slot is held until the stream ends.
+        """
+        ticket = self.enter( shellCommand )
+        try:
+           for line in generator:
+               scheduler_state.ticket = None
+               yield line
+               scheduler_state.ticket = ticket
+        finally:
+           self.leave( ticket )
+
+
+    def tickets( self ):
+        """
+        Return the tickets that are queued or running.
+        """
+        with self.condition:
+           return [ entry[2] for entry in sorted( self.waiting ) ] + list( self.running )
+
+
+    def cancel( self, ticket=None, device=None, priority=None ):
+        """
+        Cancel the given ticket, or every queued and running command, or only the
+        ones for a device or in a priority class.  Returns the number cancelled.
+        """
+        if ticket is not None:
+           targets = [ ticket ]
+        else:
+           targets = [ t for t in self.tickets()
+                       if ( device is None or t.device == device ) and ( priority is None or t.priority == priority ) ]
+        for target in targets:
+            target.stop( 'Cancelled' )
+        with self.condition:
+           self.condition.notify_all()
+        return len( targets )
+
+
+    def stats( self ):
+        """
+        Return the queue depth and running count, in total and by priority class,
+        the running commands by device, the outcome counters and the wait times.
+        """
+        with self.condition:
+           queued = dict( ( priority, 0 ) for priority in priority_classes )
+           for entry in self.waiting:
+               queued[entry[2].priority] = queued[entry[2].priority] + 1
+           devices = {}
+           for ticket in self.running:
+               devices[ticket.device] = devices.get( ticket.device, 0 ) + 1
+           waits = {}
+           for ( priority, stats ) in self.waits.items():
+               waits[priority] = { 'count': stats['count'],
+                                   'mean': stats['total'] / stats['count'] if stats['count'] else 0.0,
+                                   'max': stats['max'] }
+           return { 'queued': len( self.waiting ),
+                    'running': len( self.running ),
+                    'queued_by_priority': queued,
+                    'running_by_device': devices,
+                    'completed': self.completed,
+                    'timed_out': self.timed_out,
+                    'cancelled': self.cancelled,
+                    'wait_seconds': waits,
+                  }
+
+
+# The scheduler every command goes through.  None until enable_command_scheduler() is called.
+command_scheduler = None
+
+
+def enable_command_scheduler( max_running=8, max_per_device=2, timeout=None, timeouts=None ):
+    """
+    Send every command through a new CommandScheduler and return it.
+    """
+    global command_scheduler
+    command_scheduler = CommandScheduler( max_running=max_running, max_per_device=max_per_device,
+                                          timeout=timeout, timeouts=timeouts )
+    return command_scheduler
+
+
+def disable_command_scheduler():
+    global command_scheduler
+    command_scheduler = None
+
+
+def run_command( shellCommand, backend=None ):
+    """
+    Run the split command through the backend, the module command_backend by
+    default, and the command scheduler if it is on.
+    """
+    backend = backend or command_backend
+    scheduler = command_scheduler
+    if scheduler is None:
+       return backend.run( shellCommand )
+    return scheduler.run( shellCommand, lambda: backend.run( shellCommand ) )
+
+
+def stream_command( shellCommand, status ):
+    """
+    Stream the split command through the module command_backend, and the command
+    scheduler if it is on.
+    """
+    scheduler = command_scheduler
+    if scheduler is None:
+       return command_backend.stream( shellCommand, status )
+    return scheduler.stream( shellCommand, command_backend.stream( shellCommand, status ) )
+
+
+def execute_command( commandString=None, Debug=False, Session=None ):
     """
     This routing will execute a command and return its output.
 
-    Arguments:
-        commandString - The command you wish to execute.
+    Arguments:
+        commandString - The command you wish to execute.
+
+    Return Values:
+        1 - The return code of the command
+        2 - The information sent to STDOUT from the command
+        3 - The information sent to STDERR from the command
+
+    Note: It is up to the caller to determine success/failure.
+
+    If the command cache has been enabled with enable_command_cache(), a cached
+    result is returned when one is available.  Commands listed in
+    cache_invalidations drop the stale cache entries for their device.
+
+    If a Session is given, the command is run through it instead, see Session.
+    """
+    if not commandString:
+       return( 99999999, None, None )
+
+    shellCommand = shlex.split( commandString )
+    start = hook_command_start( commandString, Debug )
+
+    if Session is not None:
+       ( result, cached ) = Session.run( shellCommand )
+    else:
+       result = cached_result( shellCommand )
+       cached = result is not None
+       if not cached:
+          result = run_command( shellCommand )
+          cache_result( shellCommand, result )
+
+    if start is not None:
+       hook_command_end( commandString, start, result[0], len( result[1] or '' ), len( result[2] or '' ), cached=cached, Debug=Debug )
+
+    if Debug and cached:
+       print("DEBUG: Command (cached): {}".format(commandString))
+    elif Debug:
+       print("DEBUG: Command: {}".format(commandString))
+       print("DEBUG: Return Code: {}".format(result[0]))
+       print("DEBUG: STDOUT: {}".format(result[1]))
+       print("DEBUG: STDERR: {}".format(result[2]))
+
+    return result
+
+
+class CommandStream:
+    """
+    Run a command and iterate over its STDOUT lines as they are produced, instead
+    of collecting all of the output first like execute_command.  Once the lines
+    have been consumed, returncode and stderr are set.
+
+        stream = CommandStream( "/usr/lpp/mmfs/bin/mmlsfileset fs0 -Y" )
+        for line in stream:
+            ...
+
+    If the command cache is on, or a Session is given, the command is run through
+    execute_command so its result can be shared.
+    """
+    def __init__( self, commandString, Debug=False, Session=None ):
+        self.commandString = commandString
+        self.debug = Debug
+        self.session = Session
+        self.returncode = None
+        self.stderr = None
+
+
+    def __iter__( self ):
+        if command_cache is not None or self.session is not None:
+           ( self.returncode, outdata, self.stderr ) = execute_command( self.commandString, self.debug, self.session )
+           for line in outdata.splitlines():
+               yield line
+           return
+
+        start = hook_command_start( self.commandString, self.debug )
+        if start is None:
+           for line in stream_command( shlex.split( self.commandString ), self ):
+               yield line
+        else:
+           stdout_bytes = 0
+           for line in stream_command( shlex.split( self.commandString ), self ):
+               stdout_bytes = stdout_bytes + len( line ) + 1
+               yield line
+           hook_command_end( self.commandString, start, self.returncode, stdout_bytes, len( self.stderr or '' ), Debug=self.debug )
+
+        if self.debug:
+           print("DEBUG: Command: {}".format(self.commandString))
+           print("DEBUG: Return Code: {}".format(self.returncode))
+           print("DEBUG: STDERR: {}".format(self.stderr))
+
+
+def check_command_result( commandString, rc, cmd_err ):
+    """
+    Raise ValueError if the command returned a non-zero rc, so a loader does not
+    mistake a failed command for empty output.
+    """
+    if rc:
+       raise ValueError( "CommandFailed: {} returned {}: {}".format( commandString, rc, ( cmd_err or '' ).strip() ) )
+
+
+# Text in the output of a failed mm command that means it may work if it is retried,
+# usually because another mm command holds the lock.
+transient_errors = ( 'another mm command', 'busy', 'in progress', 'try again',
+                     'temporarily unavailable', 'quiesce' )
+
+
+def is_transient_failure( rc, cmd_out, cmd_err ):
+    """
+    Return True if the command failed with one of the transient_errors.
+    """
+    if rc == 0:
+       return False
+    output = ( "{} {}".format( cmd_out or '', cmd_err or '' ) ).lower()
+    for error in transient_errors:
+        if error in output:
+           return True
+    return False
+
+
+def execute_with_retry( commandString, retries=5, backoff=1.0, Debug=False, Session=None ):
+    """
+    This routine will execute a command like execute_command, but if it fails with
+    one of the transient_errors it is retried up to retries more times.  The wait
+    before each retry starts at backoff seconds and doubles every time.
+
+    Return Values:
+        1 - The return code of the command
+        2 - The information sent to STDOUT from the command
+        3 - The information sent to STDERR from the command
+        4 - The number of times the command was run
+    """
+    attempts = 0
+    while True:
+        attempts = attempts + 1
+        ( rc, cmd_out, cmd_err ) = execute_command( commandString, Debug, Session )
+        if attempts > retries or not is_transient_failure( rc, cmd_out, cmd_err ):
+           return ( rc, cmd_out, cmd_err, attempts )
+        if Debug:
+           print("DEBUG: Retrying: {}".format(commandString))
+        time.sleep( backoff * ( 2 ** ( attempts - 1 ) ) )
+
+
+def cached_result( shellCommand ):
+    """
+    Return the cached result of the split command, or None if the command cache is
+    off, the command is never cached or there is no current entry for it.
+    """
+    cache = command_cache
+    if cache is None or not is_shared_command( shellCommand ):
+       return None
+    return cache.get( tuple( shellCommand ) )
+
+
+def cache_result( shellCommand, result, cache=None ):
+    """
+    Store the result of the split command in the command cache, if it is on, or in
+    the given cache.  Only the reporting commands are stored, see
+    is_shared_command().  If the command is listed in cache_invalidations, drop
+    the stale entries instead.
+    """
+    if cache is None:
+       cache = command_cache
+    if cache is None:
+       return
+
+    stale = cache_invalidations.get( os.path.basename( shellCommand[0] ) )
+    if stale:
+       cache.invalidate( stale, command_device( shellCommand ) )
+    elif result[0] == 0 and is_shared_command( shellCommand ):
+       cache.put( tuple( shellCommand ), result )
+
+
+#-------------------------------------------------------------------------------------
+# Sessions
+#-------------------------------------------------------------------------------------
+
+# Commands that only report, and whose results a Session can share.  Every mmls
+# command is included.
+shared_commands = ( 'mmrepquota', )
+
+
+def is_shared_command( shellCommand ):
+    name = os.path.basename( shellCommand[0] )
+    return name.startswith( 'mmls' ) or name in shared_commands
+
+
+class Session:
+    """
+    A Session is shared by any number of ssapi objects in one process, so they do
+    not each fetch the same data:
+
+        session = ssapi.Session()
+        c = ssapi.Cluster( Session=session )
+        f = ssapi.Filesystem( 'fs0', Session=session )
+        s = ssapi.Snapshots( 'fs0', 'proj1', Session=session )
+
+    It reads the node name once, runs every command through its backend ( the
+    module command_backend if none is given ), and keeps the results of the
+    reporting commands for ttl seconds.  When several threads ask for the same
+    command at the same time, one runs it and the others wait for its result.
+    Commands that change the cluster always run, and drop the stored results they
+    make stale as listed in cache_invalidations.
+
+    refresh() gets the stored result while it is younger than ttl, call clear() to
+    fetch everything again.
+    """
+    def __init__( self, backend=None, ttl=60, max_entries=1024, nodefile='/var/mmfs/gen/mmfsNodeData' ):
+        self.backend = backend
+        self.nodefile = nodefile
+        self.store = CommandCache( max_entries=max_entries, default_ttl=ttl )
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.nodename = None
+
+
+    def get_backend( self ):
+        return self.backend or command_backend
+
+
+    def get_node_name( self ):
+        """
+        Return the node name, it is read from the GPFS configuration file once.
+        """
+        if self.nodename is None:
+           with self.lock:
+              if self.nodename is None:
+                 self.nodename = read_node_name( self.nodefile, self.get_backend() )
+        return self.nodename
+
+
+    def run( self, shellCommand ):
+        """
+        Run the split command, or share the result of an identical one.  Returns
+        ( ( return code, stdout, stderr ), shared ), shared is True when the command
+        was not run for this call.
+        """
+        if not is_shared_command( shellCommand ):
+           result = run_command( shellCommand, self.get_backend() )
+           cache_result( shellCommand, result, self.store )
+           return ( result, False )
+
+        key = tuple( shellCommand )
+        result = self.store.get( key )
+        if result is not None:
+           return ( result, True )
+
+        with self.lock:
+           flight = self.in_flight.get( key )
+           leader = flight is None
+           if leader:
+              flight = self.in_flight[key] = { 'done': threading.Event(), 'result': None, 'error': None }
+
+        if not leader:
+           flight['done'].wait()
+           if flight['error'] is not None:
+              raise flight['error']
+           return ( flight['result'], True )
+
+        try:
+           flight['result'] = run_command( shellCommand, self.get_backend() )
+           cache_result( shellCommand, flight['result'], self.store )
+        except Exception as error:
+           flight['error'] = error
+           raise
+        finally:
+           with self.lock:
+              del self.in_flight[key]
+           flight['done'].set()
+        return ( flight['result'], False )
+
+
+    def clear( self ):
+        """
+        Drop every stored result.
+        """
+        self.store.clear()
+
+
+    def stats( self ):
+        return self.store.stats()
+
+
+def session_node_name( session ):
+    """
+    Return the node name from the session, or read it if there is no session.
+    """
+    if session is None:
+       return read_node_name()
+    return session.get_node_name()
+
+
+def run_concurrently( *functions ):
+    """
+    This routine will run each of the given functions in its own thread and wait
+    for all of them to finish.  The functions are called with no arguments, so
+    pass bound methods.
+
+    If any of the functions raised an exception, the first one is re-raised here
+    once every thread has completed.
+    """
+    errors = []
+
+    def runner( function ):
+        try:
+           function()
+        except BaseException as e:
+           errors.append( e )
+
+    threads = []
+    for function in functions:
+        thread = threading.Thread( target=runner, args=( function, ) )
+        thread.daemon = True
+        thread.start()
+        threads.append( thread )
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+       raise errors[0]
+
+
+def run_bounded( function, items, max_workers=8 ):
+    """
+    This routine will call function( item ) for every item, using at most
+    max_workers threads at a time.
+
+    It is a generator that yields ( item, result, error ) as each call finishes,
+    where error is the exception the call raised, or None if it succeeded.  If
+    the caller stops iterating, no new calls are started.
+    """
+    items = list( items )
+    work = queue.Queue()
+    done = queue.Queue()
+    stop = threading.Event()
+    for item in items:
+        work.put( item )
+
+    def worker():
+        while not stop.is_set():
+            try:
+               item = work.get_nowait()
+            except queue.Empty:
+               return
+            # Every item has to post a result, or the caller waits for it forever.
+            try:
+               done.put( ( item, function( item ), None ) )
+            except BaseException as e:
+               done.put( ( item, None, e ) )
+
+    for idx in range( min( max( max_workers, 1 ), len( items ) ) ):
+        thread = threading.Thread( target=worker )
+        thread.daemon = True
+        thread.start()
+
+    try:
+       for idx in range( len( items ) ):
+           yield done.get()
+    finally:
+       stop.set()
+
+
+def load_lazy_attribute( obj, name ):
+    """
+    Used by __getattr__ in the classes that support lazy loading.  If name is one
+    of the class lazy_attributes, run its loader and return the loaded value.
+    """
+    loader = obj.__class__.lazy_attributes.get( name )
+    if loader is None:
+       raise AttributeError( name )
+    getattr( obj, loader )()
+    return obj.__dict__[name]
+
+
+def lazy_loaders( obj, groups ):
+    """
+    Return the unique loader method names for the given lazy attribute groups.  If
+    no groups are given, use every group that has already been loaded.
+    """
+    lazy_attributes = obj.__class__.lazy_attributes
+    if not groups:
+       groups = [ name for name in lazy_attributes if name in obj.__dict__ ]
+
+    loaders = []
+    for name in groups:
+        if name not in lazy_attributes:
+           raise ValueError( 'UnknownGroup: {}'.format( name ) )
+        if lazy_attributes[name] not in loaders:
+           loaders.append( lazy_attributes[name] )
+    return loaders
+
+
+#-------------------------------------------------------------------------------------
+# Change sets
+#
+# refresh() in Filesystem, StoragePool and Snapshots merges the new command output
+# into the structures already loaded and returns what changed, as a change set:
+#
+#    { 'added':    { name: record },
+#      'removed':  [ name ],
+#      'modified': { name: { field: ( old value, new value ) } } }
+#
+# A field that was added or removed has None as its old or new value.  Callbacks
+# added with subscribe() are called with ( object, group, change set ) whenever a
+# refresh finds a change.
+#-------------------------------------------------------------------------------------
+
+def diff_records( old, new ):
+    """
+    Return the change set between two dictionaries of records, or of values like
+    filesys, where a modified entry is ( old value, new value ).
+    """
+    added = {}
+    modified = {}
+    removed = [ name for name in old if name not in new ]
+    for name in new:
+        new_record = new[name]
+        if name not in old:
+           added[name] = new_record
+           continue
+
+        old_record = old[name]
+        if old_record == new_record:
+           continue
+        if not ( hasattr( old_record, 'keys' ) and hasattr( new_record, 'keys' ) ):
+           modified[name] = ( old_record, new_record )
+           continue
+
+        fields = {}
+        for key in new_record.keys():
+            old_value = old_record.get( key )
+            if old_value != new_record[key]:
+               fields[key] = ( old_value, new_record[key] )
+        for key in old_record.keys():
+            if key not in new_record:
+               fields[key] = ( old_record[key], None )
+        modified[name] = fields
+
+    return { 'added': added, 'removed': removed, 'modified': modified }
+
+
+def merge_records( current, new ):
+    """
+    Merge new into current and return ( merged, change set ).  Dictionaries are
+    updated in place, and only the modified fields of a record are replaced.  A
+    RecordTable keeps its rows in packed columns that can not be changed in place
+    without leaving dead rows behind, so the new table is returned instead.
+    """
+    changes = diff_records( current, new )
+    if not ( isinstance( current, dict ) and isinstance( new, dict ) ):
+       return ( new, changes )
+
+    for name in changes['removed']:
+        del current[name]
+    for ( name, record ) in changes['added'].items():
+        current[name] = record
+    for ( name, fields ) in changes['modified'].items():
+        record = current[name]
+        if not isinstance( record, dict ):
+           current[name] = new[name]
+           continue
+        for key in fields:
+            if key in new[name]:
+               record[key] = new[name][key]
+            else:
+               del record[key]
+
+    return ( current, changes )
+
+
+def has_changes( changes ):
+    return bool( changes['added'] or changes['removed'] or changes['modified'] )
+
+
+def subscribe( obj, callback ):
+    """
+    Used by subscribe() in the classes with a refresh() that returns change sets.
+    """
+    obj.__dict__.setdefault( 'subscribers', [] ).append( callback )
+
+
+def unsubscribe( obj, callback ):
+    subscribers = obj.__dict__.get( 'subscribers', [] )
+    if callback in subscribers:
+       subscribers.remove( callback )
+
+
+def notify_subscribers( obj, group, changes ):
+    """
+    Call every subscriber of obj with the change set of group, if anything changed.
+    """
+    if has_changes( changes ):
+       for callback in list( obj.__dict__.get( 'subscribers', () ) ):
+           callback( obj, group, changes )
+
+
+encoded_byte = re.compile( b'%([0-9A-Fa-f]{2})' )
+byte_values = [ bytes( bytearray( [ idx ] ) ) for idx in range( 256 ) ]
+
+
+def decode_encoded_byte( match ):
+    return byte_values[int( match.group(1), 16 )]
+
+
+def policy_text( value ):
+    """
+    Return the bytes read from a list file as a string.  On Python 3, bytes that are
+    not UTF-8 are kept with surrogateescape.
+    """
+    if str is bytes:
+       return value
+    return value.decode( 'utf-8', 'surrogateescape' )
+
+
+def decode_policy_path( path ):
+    """
+    Replace every %XX escape of a list file path in a single pass.
+    """
+    if b'%' in path:
+       path = encoded_byte.sub( decode_encoded_byte, path )
+    return policy_text( path )
+
+
+def replace_encoded_strings( mystring ):
+    """
+    The -Y output of the mm commands encodes special characters as %XX, one escape
+    per byte of their UTF-8 encoding.  This will replace every one of those encoded
+    bytes in a single pass and return a true string.
+    """
+    if '%' not in mystring:
+       return mystring
+    if str is bytes:
+       return decode_policy_path( mystring )
+    return decode_policy_path( mystring.encode( 'utf-8', 'surrogateescape' ) )
+
+
+def output_lines( cmd_out ):
+    """
+    The parsers accept either the command output as one string, or anything that
+    yields its lines, like a CommandStream.  Return an iterable of the lines.
+    """
+    if isinstance( cmd_out, string_types ):
+       return cmd_out.splitlines()
+    return cmd_out
+
+
+def iter_mm_records( lines, start=6 ):
+    """
+    This is a generator that parses the colon separated output of the mm commands
+    run with -Y, one line at a time.  Each HEADER line maps the field names once,
+    and every line after it is yielded as a dictionary of field name -> value,
+    with the %XX encoded characters replaced.
+
+    start is the index of the first field to keep.  The first six fields
+    (command, section, HEADER, version, reserved, reserved) are skipped by default.
+    Lines before the first HEADER line are ignored.
+    """
+    for ( keys, vals ) in iter_mm_rows( lines, start ):
+        yield dict( zip( keys, vals ) )
+
+
+def iter_mm_rows( lines, start=6 ):
+    """
+    The same as iter_mm_records, but yields ( keys, values ) lists instead of a
+    dictionary.  keys is the same list for every row under one HEADER line.
+    """
+    keys = None
+    for line in lines:
+        # Ignore blank lines
+        if not line:
+           continue
+
+        vals = line.split(':')
+        if len( vals ) > 2 and vals[2] == 'HEADER':
+           keys = vals[start:]
+           continue
+
+        if keys is None:
+           continue
+
+        if '%' in line:
+           yield ( keys, [ replace_encoded_strings( val ) for val in vals[start:-1] ] )
+        else:
+           yield ( keys, vals[start:-1] )
+
+
+#-------------------------------------------------------------------------------------
+# Compact records
+#
+# With Compact=True, Filesystem.filesets and Snapshots.snapshots are RecordTables
+# instead of a dictionary of dictionaries.  A RecordTable stores its records by
+# column: the field names are kept once, each column keeps every distinct value once
+# and a small array of codes with one entry per record.  The numeric fields are
+# converted to integers once.
+#-------------------------------------------------------------------------------------
+
+# The fields that are converted to integers in compact mode.
+fileset_numeric_fields = ( 'id', 'rootInode', 'parentId', 'inodes', 'dataInKB', 'inodeSpace',
+                           'maxInodes', 'allocInodes', 'freeInodes', 'snapId' )
+snapshot_numeric_fields = ( 'snapID', 'data', 'metadata' )
+
+# The value of a field a record does not have.
+missing_value = object()
+
+# The largest code each array type can hold.
+code_limits = { 'B': 0xFF, 'H': 0xFFFF, 'I': 0xFFFFFFFF }
+
+
+class RecordColumn( object ):
+    """
+    One column of a RecordTable.  values holds each distinct value once, and codes
+    holds the index into values for every record.
+    """
+    __slots__ = ( 'codes', 'values', 'lookup' )
+
+    def __init__( self, length=0 ):
+        self.values = [ missing_value ]
+        self.lookup = None
+        self.codes = array( 'B', [0] ) * length
+
+
+    def encode( self, value ):
+        """
+        Return the code for value, adding it to values if it is new.
+        """
+        if self.lookup is None:
+           self.lookup = dict( ( val, code ) for ( code, val ) in enumerate( self.values ) )
+
+        code = self.lookup.get( value )
+        if code is None:
+           code = len( self.values )
+           self.values.append( value )
+           self.lookup[value] = code
+           if code > code_limits[self.codes.typecode]:
+              self.codes = array( 'I', self.codes )
+        return code
+
+
+    def shrink( self ):
+        """
+        Drop the value lookup and store the codes in the smallest array type.
+        """
+        self.lookup = None
+        if len( self.values ) <= code_limits['B'] + 1:
+           typecode = 'B'
+        elif len( self.values ) <= code_limits['H'] + 1:
+           typecode = 'H'
+        else:
+           typecode = 'I'
+        if typecode != self.codes.typecode:
+           self.codes = array( typecode, self.codes )
+
+
+class Record( object ):
+    """
+    One record of a RecordTable.  It can be used like the dictionary kept for each
+    record in non-compact mode, ie: filesets['root']['inodeSpace']
+    """
+    __slots__ = ( 'table', 'row' )
+
+    def __init__( self, table, row ):
+        self.table = table
+        self.row = row
+
+
+    def __getitem__( self, key ):
+        column = self.table.columns[self.table.index[key]]
+        value = column.values[column.codes[self.row]]
+        if value is missing_value:
+           raise KeyError( key )
+        return value
+
+
+    def __setitem__( self, key, value ):
+        idx = self.table.index.get( key )
+        if idx is None:
+           idx = self.table.add_field( key )
+        column = self.table.columns[idx]
+        code = column.encode( value )
+        column.codes[self.row] = code
+
+
+    def __contains__( self, key ):
+        try:
+           self[key]
+        except KeyError:
+           return False
+        return True
+
+
+    def __iter__( self ):
+        return iter( self.keys() )
+
+
+    def __len__( self ):
+        return len( self.keys() )
+
+
+    def __eq__( self, other ):
+        if isinstance( other, Record ):
+           other = other.to_dict()
+        return self.to_dict() == other
+
+
+    def __ne__( self, other ):
+        return not self.__eq__( other )
+
+    __hash__ = None
+
+
+    def __repr__( self ):
+        return repr( self.to_dict() )
+
+
+    def get( self, key, default=None ):
+        try:
+           return self[key]
+        except KeyError:
+           return default
+
+
+    def items( self ):
+        items = []
+        for ( field, column ) in zip( self.table.fields, self.table.columns ):
+            value = column.values[column.codes[self.row]]
+            if value is not missing_value:
+               items.append( ( field, value ) )
+        return items
+
+
+    def keys( self ):
+        return [ field for ( field, value ) in self.items() ]
+
+
+    def values( self ):
+        return [ value for ( field, value ) in self.items() ]
+
+
+    def to_dict( self ):
+        return dict( self.items() )
+
+
+class RecordTable( object ):
+    """
+    A column store of records that can be used like the dictionary of name ->
+    record dictionaries kept in non-compact mode.  Looking up a name returns a
+    Record view of its row.
+
+    numeric is the list of fields whose values are converted to integers.
+
+    Deleting or replacing a record leaves its old row in the columns until
+    compact() is called.
+    """
+    def __init__( self, numeric=() ):
+        self.numeric = frozenset( numeric )
+        self.fields = []
+        self.index = {}
+        self.columns = []
+        self.rows = {}
+        self.length = 0
+        self.header = None
+        self.positions = []
+        self.absent = []
+
+
+    def add_field( self, field ):
+        self.index[field] = len( self.fields )
+        self.fields.append( field )
+        self.columns.append( RecordColumn( self.length ) )
+        self.header = None
+        return self.index[field]
+
+
+    def add( self, keys, vals, key_field=None ):
+        """
+        Add a row from the keys and values of an -Y row, stored under the value of
+        key_field if it is given, and return its Record.
+        """
+        if keys is not self.header or len( vals ) != len( self.positions ):
+           self.header = keys
+           self.positions = []
+           for key in keys[:len( vals )]:
+               if key not in self.index:
+                  self.add_field( key )
+               self.positions.append( ( self.columns[self.index[key]], key in self.numeric ) )
+           present = set( id( column ) for ( column, numeric ) in self.positions )
+           self.absent = [ column for column in self.columns if id( column ) not in present ]
+
+        row = self.length
+        self.length = self.length + 1
+        for ( ( column, numeric ), val ) in zip( self.positions, vals ):
+            if numeric and isinstance( val, string_types ) and val.isdigit():
+               val = int( val )
+            code = column.lookup.get( val ) if column.lookup is not None else None
+            if code is None:
+               code = column.encode( val )
+            column.codes.append( code )
+        for column in self.absent:
+            column.codes.append( 0 )
+
+        record = Record( self, row )
+        if key_field is not None:
+           self.rows[record[key_field]] = row
+        return record
+
+
+    def finish( self ):
+        """
+        Called once all of the rows have been added, to pack the columns.
+        """
+        for column in self.columns:
+            column.shrink()
+
+
+    def compact( self ):
+        """
+        Drop the rows of deleted and replaced records, and the values only they
+        used, from the columns.  The Records returned before this are no longer
+        valid.
+        """
+        live = sorted( set( self.rows.values() ) )
+        if len( live ) == self.length:
+           return
+
+        renumber = dict( ( row, idx ) for ( idx, row ) in enumerate( live ) )
+        for ( idx, column ) in enumerate( self.columns ):
+            packed = RecordColumn()
+            for row in live:
+                code = packed.encode( column.values[column.codes[row]] )
+                packed.codes.append( code )
+            packed.shrink()
+            self.columns[idx] = packed
+
+        self.rows = dict( ( name, renumber[row] ) for ( name, row ) in self.rows.items() )
+        self.length = len( live )
+        self.header = None
+
+
+    def __getitem__( self, name ):
+        return Record( self, self.rows[name] )
+
+
+    def __setitem__( self, name, record ):
+        keys = list( record.keys() )
+        row = self.add( keys, [ record[key] for key in keys ] )
+        self.rows[name] = row.row
+
+
+    def __delitem__( self, name ):
+        del self.rows[name]
+
+
+    def __contains__( self, name ):
+        return name in self.rows
+
+
+    def __iter__( self ):
+        return iter( self.rows )
+
+
+    def __len__( self ):
+        return len( self.rows )
+
+
+    def __eq__( self, other ):
+        if isinstance( other, RecordTable ):
+           other = other.to_dict()
+        return self.to_dict() == other
+
+
+    def __ne__( self, other ):
+        return not self.__eq__( other )
+
+    __hash__ = None
+
+
+    def get( self, name, default=None ):
+        if name not in self.rows:
+           return default
+        return self[name]
+
+
+    def keys( self ):
+        return list( self.rows.keys() )
+
+
+    def values( self ):
+        return [ Record( self, row ) for row in self.rows.values() ]
+
+
+    def items( self ):
+        return [ ( name, Record( self, row ) ) for ( name, row ) in self.rows.items() ]
+
+
+    def to_dict( self ):
+        return dict( ( name, Record( self, row ).to_dict() ) for ( name, row ) in self.rows.items() )
+
+
+def remove_special_characters( mystring ):
+    """
+    The mmlspool command has returns strings with special characters.
+    This will remove those encoded strings.
+    """
+    tempstring = mystring.replace('%', '')
+    mystring = tempstring
+    tempstring = mystring.replace('(', '')
+    mystring = tempstring
+    tempstring = mystring.replace(')', '')
+    return tempstring
+
+
+#-------------------------------------------------------------------------------------
+# Parsers
+#
+# These turn the output of the mm commands into the structures the classes keep.
+# They are shared by the classes here and the asyncio classes in ssapi_async, so
+# both return identical structures.
+#-------------------------------------------------------------------------------------
+
+def read_node_name( nodefile='/var/mmfs/gen/mmfsNodeData', backend=None ):
+    """
+    This routine will extract the current node name from the GPFS configuration file.
+    """
+    nodecfg = ( backend or command_backend ).read_file( nodefile )
+    nodecfg_s = nodecfg.split(':')
+    return nodecfg_s[5]
+
+
+def read_config_generation( sdrfs='/var/mmfs/gen/mmsdrfs' ):
+    """
+    Return the configuration generation number from the version line of mmsdrfs,
+    or None if it can not be read.  It changes every time the cluster configuration
+    changes.
+    """
+    # The version line is the first line, do not read the rest of the file.
+    lines = command_backend.read_lines( sdrfs )
+    try:
+       for line in lines:
+           fields = line.split(':')
+           if len( fields ) > 3 and fields[1] == '00_VERSION_LINE':
+              return fields[3]
+    except ( IOError, OSError, ValueError ):
+       pass
+    finally:
+       lines.close()
+    return None
+
+
+@instrumented_parser
+def parse_mmlsnsd( cmd_out ):
+    """
+    Parse the mmlsnsd command output.  Returns the nsds dictionary and the list
+    of unique GPFS devices.
+    """
+    nsds = {}
+    fsdevs = {}
+    for line in cmd_out.splitlines():
+        line.rstrip()
+
+        # Ignore blank lines
+        if not line:
+           continue
+
+        # Ignore dashed lines
+        if '----------' in line:
+           continue
+
+        # Ignore header lines
+        if 'File system' in line:
+           continue
+
+        if '(local cache)' in line:
+           nsd_name = line.split()[2]
+           fsname = 'lroc'
+           servers = (line.split()[3]).split(',')
+        elif 'free disk' in line:
+           nsd_name = line.split()[2]
+           fsname = 'free'
+           servers = (line.split()[3]).split(',')
+        else:
+           nsd_name = line.split()[1]
+           fsname = line.split()[0]
+           servers = (line.split()[2]).split(',')
+           fsdevs[fsname] = 1
+
+        nsds[nsd_name] = {}
+        nsds[nsd_name]['usage'] = fsname
+        nsds[nsd_name]['servers'] = servers
+
+    return ( nsds, list( fsdevs.keys() ) )
+
+
+@instrumented_parser
+def parse_mmlsmgr( cmd_out ):
+    """
+    Parse the mmlsmgr -c command output into the cluster_manager dictionary.
+    """
+    cluster_manager = {}
+    for line in cmd_out.splitlines():
+        line.rstrip()
+
+        # Ignore blank lines
+        if not line:
+           continue
+
+        if 'Cluster manager node' in line:
+           line = line.replace('(', '').replace(')', '')
+           cluster_manager['ip'] = line.split()[3]
+           cluster_manager['node'] = line.split()[4]
+
+    return cluster_manager
+
+
+@instrumented_parser
+def parse_mmlscluster( cmd_out ):
+    """
+    Parse the mmlscluster command output into the cluster_info dictionary.
+    """
+    cluster_info = {}
+    found_nodes = 0
+    for line in cmd_out.splitlines():
+        line.rstrip()
+
+        # Ignore blank lines
+        if not line:
+           continue
+
+        # Ignore dashed lines
+        if '----------' in line:
+           continue
+        if '==========' in line:
+           continue
+
+        if found_nodes >= 1:
+           nodeid = line.split()[0]
+           daemonname = line.split()[1]
+           ipaddr = line.split()[2]
+           adminname = line.split()[3]
+           cluster_info['nodes'][nodeid] = {}
+           cluster_info['nodes'][nodeid]['daemon_name'] = daemonname
+           cluster_info['nodes'][nodeid]['ip'] = ipaddr
+           cluster_info['nodes'][nodeid]['admin_name'] = adminname
+
+        if 'Node  Daemon' in line:
+           found_nodes = found_nodes + 1
+           cluster_info['nodes'] = {}
+
+        if 'GPFS cluster name' in line:
+           cluster_info['name'] = line.split()[3]
+        if 'GPFS cluster id' in line:
+           cluster_info['id'] = line.split()[3]
+        if 'GPFS UID domain' in line:
+           cluster_info['uid'] = line.split()[3]
+        if 'Remote shell command' in line:
+           cluster_info['rsh'] = line.split()[3]
+        if 'Remote file copy command' in line:
+           cluster_info['rcp'] = line.split()[4]
+        if 'Primary server' in line:
+           cluster_info['primary'] = line.split()[2]
+        if 'Secondary server' in line:
+           cluster_info['secondary'] = line.split()[2]
+
+    return cluster_info
+
+
+@instrumented_parser
+def parse_mmlspool( cmd_out ):
+    """
+    Parse the mmlspool command output into the pools dictionary.
+    """
+    pools = {}
+    for line in cmd_out.splitlines()[2:]:
+        line.rstrip()
+
+        # Ignore blank lines
+        if not line:
+           continue
+
+        newline = remove_special_characters( line )
+        vals = newline.split()
+        poolname = vals[0]
+        pools[poolname] = {}
+        pools[poolname]['id'] = vals[1]
+        pools[poolname]['blksize'] = vals[2]
+        pools[poolname]['blkmod'] = vals[3]
+        pools[poolname]['data'] = vals[4]
+        pools[poolname]['metadata'] = vals[5]
+        pools[poolname]['datasize'] = vals[6]
+        pools[poolname]['datafree'] = vals[7]
+        pools[poolname]['datapctfree'] = vals[8]
+        pools[poolname]['metasize'] = vals[9]
+        pools[poolname]['metafree'] = vals[10]
+        pools[poolname]['metapctfree'] = vals[11]
+
+    return pools
+
+
+@instrumented_parser
+def parse_mmlsfs( cmd_out ):
+    """
+    Parse the mmlsfs -Y command output into the filesys dictionary.
+    """
+    filesys = {}
+    for record in iter_mm_records( output_lines( cmd_out ) ):
+        filesys[record['fieldName']] = record['data']
+
+    return filesys
+
+
+def fileset_type( fileset ):
+    """
+    Return the fileset type, independent inode or dependent inode.
+    """
+    # In compact mode inodeSpace is an integer.
+    inode_space = str( fileset['inodeSpace'] )
+
+    if fileset['filesetName'] == 'root' and inode_space == '0':
+       return 'Independent'
+    elif inode_space >= '1':
+       return 'Independent'
+    elif inode_space == '0':
+       return 'Dependent'
+    else:
+       return 'Unknown'
+
+
+@instrumented_parser
+def parse_mmlsfileset( cmd_out, Compact=False ):
+    """
+    Parse the mmlsfileset -Y command output into the filesets dictionary, or a
+    RecordTable if Compact is True.
+    """
+    if Compact:
+       filesets = RecordTable( fileset_numeric_fields )
+       for ( keys, vals ) in iter_mm_rows( output_lines( cmd_out ), start=7 ):
+           record = filesets.add( keys, vals, 'filesetName' )
+           record['fstype'] = fileset_type( record )
+       filesets.finish()
+       return filesets
+
+    filesets = {}
+    for record in iter_mm_records( output_lines( cmd_out ), start=7 ):
+        record['fstype'] = fileset_type( record )
+        filesets[record['filesetName']] = record
+
+    return filesets
+
+
+@instrumented_parser
+def parse_mmlssnapshot( cmd_out, Compact=False ):
+    """
+    Parse the mmlssnapshot -Y command output into the snapshots dictionary, or a
+    RecordTable if Compact is True.  When there are no snapshots, mmlssnapshot
+    prints a message instead of a HEADER line and the dictionary is empty.
+    """
+    if Compact:
+       snapshots = RecordTable( snapshot_numeric_fields )
+       for ( keys, vals ) in iter_mm_rows( output_lines( cmd_out ) ):
+           snapshots.add( keys, vals, 'directory' )
+       snapshots.finish()
+       return snapshots
+
+    snapshots = {}
+    for record in iter_mm_records( output_lines( cmd_out ) ):
+        snapshots[record['directory']] = record
+
+    return snapshots
+
+
+#-------------------------------------------------------------------------------------
+# Cluster state cache
+#
+# The parsed mmlscluster and mmlsnsd output rarely changes, so Cluster can keep it in
+# a file between runs:
+#
+#    c = ssapi.Cluster( StateCache=True )
+#
+# The saved state is used while the configuration generation in mmsdrfs is the one
+# it was saved with, and it is younger than the ttl.  The cluster manager can move
+# at any time, so it is not saved and is only fetched when it is used.
+#-------------------------------------------------------------------------------------
+
+def default_state_path():
+    cache_home = os.environ.get( 'XDG_CACHE_HOME' ) or os.path.join( os.path.expanduser( '~' ), '.cache' )
+    return os.path.join( cache_home, 'ssapi', 'cluster_state.json' )
+
+
+class ClusterStateCache:
+    """
+    Saves and loads the cluster state in a JSON file at path.  The file is replaced
+    with a rename, so concurrent writers can not leave a partial file behind.
+    """
+    version = 1
+
+    def __init__( self, path=None, ttl=3600, sdrfs='/var/mmfs/gen/mmsdrfs' ):
+        self.path = path or default_state_path()
+        self.ttl = ttl
+        self.sdrfs = sdrfs
+
+
+    def load( self ):
+        """
+        Return the saved state dictionary, or None if there is none or it is stale.
+        """
+        try:
+           f = open( self.path, 'r' )
+        except ( IOError, OSError ):
+           return None
+        try:
+           try:
+              state = json.load( f )
+           except ValueError:
+              return None
+        finally:
+           f.close()
+
+        if not isinstance( state, dict ) or state.get( 'version' ) != self.version:
+           return None
+        if time.time() - state.get( 'time', 0 ) > self.ttl:
+           return None
+        if state.get( 'generation' ) != read_config_generation( self.sdrfs ):
+           return None
+        return state
+
+
+    def save( self, cluster_info, nsds, gpfsdevs ):
+        """
+        Save the state with the current configuration generation.  Errors are
+        ignored, the cache is only an optimization.
+        """
+        state = { 'version': self.version,
+                  'time': time.time(),
+                  'generation': read_config_generation( self.sdrfs ),
+                  'cluster_info': cluster_info,
+                  'nsds': nsds,
+                  'gpfsdevs': list( gpfsdevs ),
+                }
+
+        import tempfile
+        directory = os.path.dirname( self.path ) or '.'
+        try:
+           if not os.path.isdir( directory ):
+              os.makedirs( directory )
+           ( fd, tmppath ) = tempfile.mkstemp( dir=directory, prefix='.cluster_state.' )
+           try:
+              f = os.fdopen( fd, 'w' )
+              try:
+                 json.dump( state, f, separators=( ',', ':' ) )
+              finally:
+                 f.close()
+              os.rename( tmppath, self.path )
+           except:
+              os.unlink( tmppath )
+              raise
+        except ( IOError, OSError ):
+           pass
+
+
+    def clear( self ):
+        try:
+           os.unlink( self.path )
+        except OSError:
+           pass
+
+
+#-------------------------------------------------------------------------------------
+# Remote commands
+#
+# Some information only exists on each node.  RemoteShells keeps one remote shell
+# per node open and runs commands through it, so a command on 2000 nodes does not
+# pay for 2000 connections every time:
+#
+#    c = ssapi.Cluster()
+#    for ( node, result, error ) in c.run_on_nodes( 'cat /var/mmfs/gen/mmfsNodeData' ):
+#        ...
+#
+# Each command is written to the shell followed by a marker line with its return
+# code on STDOUT and another on STDERR, and the output is read up to the markers.
+# A shell that times out or closes is thrown away and opened again when needed.
+#
+# The remote shell is run as: rsh [options] node /bin/sh.  Any program that runs
+# its remaining arguments locally can stand in for it off-cluster.
+#-------------------------------------------------------------------------------------
+
+# The options added when the remote shell is ssh.  The connections are multiplexed,
+# so the shells of other processes on this node reuse them too.
+ssh_options = [ '-o', 'BatchMode=yes',
+                '-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=~/.ssh/ssapi-%r@%h:%p',
+                '-o', 'ControlPersist=300' ]
+
+
+def decode_output( data ):
+    if str is bytes:
+       return data
+    return data.decode( 'utf-8', 'replace' )
+
+
+class RemoteShell:
+    """
+    A /bin/sh on a node, started through the remote shell command, that runs one
+    command at a time.
+    """
+    def __init__( self, node, rshCommand ):
+        self.node = node
+        # In its own process group, so close() kills everything it started.
+        self.process = Popen( rshCommand + [ node, '/bin/sh' ], stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                              close_fds=True, **new_session )
+
+
+    def alive( self ):
+        return self.process is not None and self.process.poll() is None
+
+
+    def close( self ):
+        """
+        Kill the remote shell command and everything it started on this node.
+        """
+        process = self.process
+        self.process = None
+        if process is None:
+           return
+        if process.poll() is None:
+           try:
+              os.killpg( process.pid, signal.SIGKILL )
+           except OSError:
+              pass
+        for pipe in ( process.stdin, process.stdout, process.stderr ):
+            try:
+               pipe.close()
+            except ( IOError, OSError ):
+               pass
+        process.wait()
+
+
+    def run( self, commandString, timeout=None ):
+        """
+        Run the command and return ( return code, stdout, stderr ).  Raises
+        ValueError('Timeout: ...') if it runs longer than timeout seconds, and
+        ValueError('ConnectionClosed: ...') if the shell goes away, after closing it.
+        """
+        import binascii
+        import select
+
+        marker = '__ssapi_{}__'.format( binascii.hexlify( os.urandom( 8 ) ).decode( 'ascii' ) )
+        out_marker = ( '\n' + marker + ' ' ).encode( 'ascii' )
+        err_marker = ( '\n' + marker + '\n' ).encode( 'ascii' )
+
+        # The command runs in a subshell, so exit and cd do not change the shell, and
+        # reads /dev/null, so it can not eat the commands that follow.
+        script = "( {}\n) </dev/null\n__ssapi_rc=$?\nprintf '\\n%s %d\\n' {} $__ssapi_rc\nprintf '\\n%s\\n' {} >&2\n".format( commandString, marker, marker )
+        if not isinstance( script, bytes ):
+           script = script.encode( 'utf-8' )
+
+        deadline = None if timeout is None else time.time() + timeout
+        ( out_fd, err_fd ) = ( self.process.stdout.fileno(), self.process.stderr.fileno() )
+        # bytearrays, so appending a read does not copy what has already arrived.
+        output = { out_fd: bytearray(), err_fd: bytearray() }
+        # Where the search for the marker of each descriptor starts.
+        search = { out_fd: 0, err_fd: 0 }
+        rc = None
+        err_done = False
+
+        try:
+           self.process.stdin.write( script )
+           self.process.stdin.flush()
+        except ( IOError, OSError ):
+           self.close()
+           raise ValueError( 'ConnectionClosed: {}'.format( self.node ) )
+
+        while rc is None or not err_done:
+            wait = None
+            if deadline is not None:
+               wait = deadline - time.time()
+               if wait <= 0:
+                  self.close()
+                  raise ValueError( 'Timeout: {} on {}'.format( commandString, self.node ) )
+
+            # poll, unlike select, works with the descriptors above 1024 that a few
+            # thousand open shells use.
+            poller = select.poll()
+            if rc is None:
+               poller.register( out_fd, select.POLLIN )
+            if not err_done:
+               poller.register( err_fd, select.POLLIN )
+            for ( fd, event ) in poller.poll( None if wait is None else int( wait * 1000 ) + 1 ):
+                data = os.read( fd, 65536 )
+                if not data:
+                   stderr = decode_output( bytes( output[err_fd] ) )
+                   self.close()
+                   raise ValueError( 'ConnectionClosed: {} {}'.format( self.node, stderr.strip() ).strip() )
+                output[fd].extend( data )
+
+                # The marker, and the return code after it, can arrive split over
+                # several reads.  Once the marker is found the search stays at it
+                # until the newline after the return code has arrived, otherwise only
+                # the end of the old data a marker could start in is searched again.
+                wanted = out_marker if fd == out_fd else err_marker
+                idx = output[fd].find( wanted, search[fd] )
+                if idx < 0:
+                   search[fd] = max( len( output[fd] ) - len( wanted ) + 1, 0 )
+                   continue
+                search[fd] = idx
+
+                if fd == out_fd:
+                   end = output[fd].find( b'\n', idx + len( out_marker ) )
+                   if end >= 0:
+                      rc = int( bytes( output[fd][idx + len( out_marker ):end] ) )
+                      del output[fd][idx:]
+                else:
+                   err_done = True
+                   del output[fd][idx:]
+
+        return ( rc, decode_output( bytes( output[out_fd] ) ), decode_output( bytes( output[err_fd] ) ) )
+
+
+class RemoteShells:
+    """
+    A pool of RemoteShell, reused by the commands that are run on the same node.
+
+        shells = ssapi.RemoteShells( '/usr/bin/ssh' )
+        for ( node, result, error ) in shells.run_on_nodes( 'mmdiag --version', nodes ):
+            ...
+        shells.close()
+
+    At most max_idle shells per node are kept open between commands.  If options is
+    None, ssh_options are added when the remote shell is ssh.
+    """
+    def __init__( self, rsh='/usr/bin/ssh', options=None, max_idle=1 ):
+        if isinstance( rsh, string_types ):
+           rsh = shlex.split( rsh )
+        if options is None:
+           options = ssh_options if os.path.basename( rsh[0] ) == 'ssh' else []
+        self.rshCommand = list( rsh ) + list( options )
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+
+    def acquire( self, node ):
+        with self.lock:
+           shells = self.idle.get( node, [] )
+           while shells:
+               shell = shells.pop()
+               if shell.alive():
+                  return shell
+               shell.close()
+        return RemoteShell( node, self.rshCommand )
+
+
+    def release( self, shell ):
+        if not shell.alive():
+           shell.close()
+           return
+        with self.lock:
+           shells = self.idle.setdefault( shell.node, [] )
+           if len( shells ) < self.max_idle:
+              shells.append( shell )
+              return
+        shell.close()
+
+
+    def run( self, node, commandString, timeout=None ):
+        """
+        Run the command on the node, see RemoteShell.run().
+        """
+        start = hook_command_start( commandString )
+        shell = self.acquire( node )
+        try:
+           result = shell.run( commandString, timeout )
+        finally:
+           self.release( shell )
+        hook_command_end( commandString, start, result[0], len( result[1] ), len( result[2] ) )
+        return result
+
+
+    def run_on_nodes( self, commandString, nodes, max_workers=64, timeout=60 ):
+        """
+        Run the command on every node, on at most max_workers nodes at a time, and
+        give each node timeout seconds.  Like run_bounded(), it is a generator that
+        yields ( node, ( return code, stdout, stderr ), error ) as each node finishes.
+        """
+        return run_bounded( lambda node: self.run( node, commandString, timeout ), nodes, max_workers )
+
+
+    def close( self ):
+        """
+        Close every idle shell.
+        """
+        with self.lock:
+           shells = [ shell for node_shells in self.idle.values() for shell in node_shells ]
+           self.idle = {}
+        for shell in shells:
+            shell.close()
+
+
+class Nsds:
+    """
+    This class contains all of the information about the NSDs in the cluster.  It
+    includes the NSD name, servers they are attached to, gpfs device they serve, etc.
+
+    gpfsdevs - a list unique gpfs devices
+
+    nsds[name]['usage'] = The gpfs device the specified name is a part of
+    nsds[name]['servers'] = The storage servers the specified name is hosted by
+
+    If State=( nsds, gpfsdevs ) is passed, ie: from the cluster state cache, it is
+    used instead of running mmlsnsd.
+
+    If you pass Session=, mmlsnsd is run through that Session.
+
+    The server indexes are built the first time one of them is used:
+
+    nsds_by_server[server] = The NSDs the server serves
+    nsds_by_filesystem[usage] = The NSDs of the file system, or 'free' or 'lroc'
+    nsds_by_position[idx][server] = The NSDs the server is in position idx of the
+                                    server list for, 0 is the primary server
+    """
+    session = None
+
+    # Attributes built by build_server_indexes() on first access.
+    index_attributes = ( 'nsds_by_server', 'nsds_by_filesystem', 'nsds_by_position' )
+
+    def __init__( self, Debug=False, State=None, Session=None ):
+        self.set_debug( Debug )
+        self.session = Session
+        if State is None:
+           self.collect_nsd_info()
+        else:
+           ( self.nsds, self.gpfsdevs ) = State
+
+
+    def __getattr__( self, name ):
+        if name in self.index_attributes:
+           self.build_server_indexes()
+           return self.__dict__[name]
+        raise AttributeError( name )
+
+
+    def set_debug( self, Debug ):
+        """
+        Set the debugging level for the class. 0 by default.
+        """
+        self.debug = Debug
+        if self.debug == True:
+           print("DEBUG: NSDs: Debugging turned on")
+
+
+    def toggle_debug( self ):
+        """
+        Toggle debugging. If on, shut it off, if off, set it to 1.
+        """
+        if self.debug == True:
+           print("DEBUG: NSDs: Turning ssapi debugging off.")
+           self.debug = False
+        else:
+           print("DEBUG: NSDs: Turning ssapi debugging on.")
+           self.debug = True
+
+
+    def dump( self ):
+        print("GPFS Devices: {}".format(self.gpfsdevs))
+        nsd_keys = self.nsds.keys()
+        for nsd in sorted(nsd_keys):
+            print("{:<10s}  {:<10s}  {:<s}".format(nsd, self.nsds[nsd]['usage'], self.nsds[nsd]['servers']))
+
+
+    def return_gpfs_devices( self ):
+        """
+        Return an iterable list of uniq GPFS devices.
+        """
+        return self.gpfsdevs
+
+
+    def build_server_indexes( self ):
+        """
+        Build the server, file system and server position maps from the NSDs.
+        """
+        by_server = {}
+        by_filesystem = {}
+        by_position = []
+
+        for ( name, nsd ) in self.nsds.items():
+            by_filesystem.setdefault( nsd['usage'], [] ).append( name )
+            for ( idx, server ) in enumerate( nsd['servers'] ):
+                by_server.setdefault( server, [] ).append( name )
+                while len( by_position ) <= idx:
+                    by_position.append( {} )
+                by_position[idx].setdefault( server, [] ).append( name )
+
+        self.nsds_by_server = by_server
+        self.nsds_by_filesystem = by_filesystem
+        self.nsds_by_position = by_position
+
+
+    def drop_server_indexes( self ):
+        """
+        Throw away the server indexes, they are built again when next used.
+        """
+        for name in self.index_attributes:
+            self.__dict__.pop( name, None )
+
+
+    def failure_impact( self, nodes ):
+        """
+        Return what happens to the NSDs if the given nodes go down:
+
+        lost = The NSDs that have no server left
+        failover[nsd] = The server that takes over an NSD whose primary is down
+        filesystems[usage] = { 'lost': [ nsds ], 'failover': [ nsds ] }
+        """
+        if isinstance( nodes, string_types ):
+           nodes = [ nodes ]
+        down = set( nodes )
+
+        affected = set()
+        for node in down:
+            affected.update( self.nsds_by_server.get( node, () ) )
+
+        lost = []
+        failover = {}
+        filesystems = {}
+        for name in sorted( affected ):
+            servers = self.nsds[name]['servers']
+            alive = [ server for server in servers if server not in down ]
+            usage = filesystems.setdefault( self.nsds[name]['usage'], { 'lost': [], 'failover': [] } )
+            if not alive:
+               lost.append( name )
+               usage['lost'].append( name )
+            elif servers[0] in down:
+               failover[name] = alive[0]
+               usage['failover'].append( name )
+
+        return { 'lost': lost, 'failover': failover, 'filesystems': filesystems }
+
+
+    def server_load( self ):
+        """
+        Return server -> { 'primary': NSDs it is the primary server for,
+                           'backup': NSDs it is a backup server for,
+                           'total': every NSD it serves }
+        """
+        load = {}
+        for ( server, names ) in self.nsds_by_server.items():
+            primary = len( self.nsds_by_position[0].get( server, () ) ) if self.nsds_by_position else 0
+            load[server] = { 'primary': primary, 'backup': len( names ) - primary, 'total': len( names ) }
+        return load
+
+
+    def single_points_of_failure( self, Local=False ):
+        """
+        Return the NSDs that only have one server.  Local read only cache disks are
+        always on one node, they are left out unless Local is True.
+        """
+        return sorted( name for ( name, nsd ) in self.nsds.items()
+                       if len( nsd['servers'] ) == 1 and ( Local or nsd['usage'] != 'lroc' ) )
+
+
+    def collect_nsd_info( self ):
+        """
+        Process the mmlsnsd command output to build the necessary structures.
+        """
+        if self.debug:
+           dfunc = 'collect_nsd_info'
+           print("DEBUG: Starting Function: {}".format(dfunc))
+
+        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlsnsd", Session=self.session )
+        ( self.nsds, self.gpfsdevs ) = parse_mmlsnsd( cmd_out )
+        self.drop_server_indexes()
+
+        if self.debug:
+           dfunc = 'collect_nsd_info'
+           print("DEBUG: Leavng Function: {}".format(dfunc))
+
+
+
+class Cluster:
+    """
+    This class will collect the information about the cluster.
+
+    If you wish to debug the class, you can now pass Debug=True on the initialization.
+
+    If you pass Lazy=True, nothing is collected up front.  Each group of data is
+    fetched the first time it is accessed and then kept.  Use refresh() to fetch
+    it again.
+
+    If you pass StateCache=True, or a ClusterStateCache, the cluster information
+    and NSDs are loaded from the state saved by an earlier run while the cluster
+    configuration has not changed, and saved after they are fetched.  In lazy mode
+    they are saved once both have been fetched.  The cluster
+    manager is then only fetched when it is used.
+
+    If you pass Session=, the node name, the NSDs and the command results are
+    shared with the other objects of that Session.
+
+    run_on_nodes() runs a command on the nodes of the cluster over its remote shell
+    command.  The remote shells are kept open for the next call, until
+    close_remote_shells().
+    """
+    session = None
+    remote_shells = None
+
+    # Attributes that are loaded on first access in lazy mode, and the method that loads them.
+    lazy_attributes = OrderedDict( [ ( 'cluster_info', 'get_cluster_info' ),
+                                     ( 'nodename', 'get_node_name' ),
+                                     ( 'cluster_manager', 'get_cluster_manager' ),
+                                     ( 'is_cluster_manager', 'is_node_cluster_manager' ),
+                                     ( 'nsds', 'get_nsd_information' ),
+                                     ( 'gpfsdevs', 'get_nsd_information' ),
+                                   ] )
+
+
+    def __init__( self, Debug=False, Lazy=False, StateCache=None, Session=None ):
+        self.set_debug( Debug )
+        self.session = Session
+        if StateCache is True:
+           StateCache = ClusterStateCache()
+        self.state_cache = StateCache
+
+        if self.state_cache is not None and self.load_state():
+           if not Lazy:
+              self.get_node_name()
+        elif not Lazy:
+           self.get_cluster_info()
+           self.get_node_name()
+           self.is_node_cluster_manager()
+           self.get_nsd_information()
+           self.save_state()
+
+
+    def __getattr__( self, name ):
+        value = load_lazy_attribute( self, name )
+        if name in ( 'cluster_info', 'nsds', 'gpfsdevs' ):
+           self.save_state()
+        return value
+
+
+    def refresh( self, *groups ):
+        """
+        Fetch the given data groups again, ie: refresh('cluster_info', 'nsds').  With
+        no arguments, every group that has already been loaded is fetched again.
+        """
+        loaders = lazy_loaders( self, groups )
+        # is_node_cluster_manager() uses the cluster manager fetched first, so mmlsmgr
+        # only runs once.
+        if 'is_node_cluster_manager' in loaders:
+           loaders = [ 'get_cluster_manager' ] + [ loader for loader in loaders if loader != 'get_cluster_manager' ]
+        for loader in loaders:
+            getattr( self, loader )()
+        if 'get_cluster_info' in loaders or 'get_nsd_information' in loaders:
+           self.save_state()
+
+
+    def load_state( self ):
+        """
+        Load cluster_info, nsds and gpfsdevs from the state cache.  Returns False if
+        there is no usable saved state.
+        """
+        state = self.state_cache.load()
+        if state is None:
+           if self.debug:
+              print("DEBUG: No usable saved cluster state in {}".format(self.state_cache.path))
+           return False
+
+        if self.debug:
+           print("DEBUG: Loaded the cluster state from {}".format(self.state_cache.path))
+        self.cluster_info = state['cluster_info']
+        self.nsds = Nsds( Debug=self.debug, State=( state['nsds'], state['gpfsdevs'] ), Session=self.session )
+        self.gpfsdevs = self.nsds.return_gpfs_devices()
+        return True
+
+
+    def save_state( self ):
+        """
+        Save cluster_info, nsds and gpfsdevs in the state cache, if there is one and
+        they are all loaded.
+        """
+        if self.__dict__.get( 'state_cache' ) is None:
+           return
+        if 'cluster_info' not in self.__dict__ or 'nsds' not in self.__dict__:
+           return
+        self.state_cache.save( self.cluster_info, self.nsds.nsds, self.gpfsdevs )
+
+
+    def get_nsd_information( self ):
+        """
+        Collect the NSD information and the list of GPFS devices it contains.
+        """
+        self.nsds = Nsds( Debug=self.debug, Session=self.session )
+        self.gpfsdevs = self.nsds.return_gpfs_devices()
+
+
+    def load_filesystems( self, devices=None, max_workers=8, **kwargs ):
+        """
+        Build a Filesystem object for each of the given GPFS devices, or for all of
+        gpfsdevs if none are given, using at most max_workers threads.  Any other
+        keyword arguments are passed to Filesystem, ie: Lazy=True.
+
+        Returns a dictionary of device -> Filesystem.  A device that fails does not
+        stop the others, its exception is saved in self.filesystem_errors[device].
+        """
+        if devices is None:
+           devices = self.gpfsdevs
+        kwargs.setdefault( 'Session', self.session )
+
+        filesystems = {}
+        self.filesystem_errors = {}
+        for ( device, filesystem, error ) in run_bounded( lambda dev: Filesystem( dev, **kwargs ), devices, max_workers ):
+            if error is not None:
+               if self.debug:
+                  print("DEBUG: Filesystem {} failed: {}".format(device, error))
+               self.filesystem_errors[device] = error
+            else:
+               filesystems[device] = filesystem
+
+        return filesystems
+
+
+    def capacity_report( self, devices=None, max_workers=8, threshold=90.0 ):
+        """
+        Run mmlspool for the given GPFS devices, or all of gpfsdevs, using at most
+        max_workers threads, and return ( table, summary ), see capacity_table() and
+        capacity_summary().  A device that fails is left out of the table and its
+        exception is saved in summary['errors'][device].
+        """
+        if devices is None:
+           devices = self.gpfsdevs
+
+        pools = {}
+        errors = {}
+        for ( device, pool, error ) in run_bounded( lambda dev: StoragePool( dev, Session=self.session ), devices, max_workers ):
+            if error is not None:
+               errors[device] = error
+            else:
+               pools[device] = pool.pools
+
+        table = capacity_table( pools )
+        summary = capacity_summary( table, threshold )
+        summary['errors'] = errors
+        return ( table, summary )
+
+
+    def node_names( self, nodes=None ):
+        """
+        Return the admin node names of the given nodes, which can be node numbers,
+        daemon node names or admin node names, or of every node in the cluster.
+        """
+        if isinstance( nodes, string_types ):
+           nodes = [ nodes ]
+        if nodes is not None:
+           nodes = set( str( node ) for node in nodes )
+
+        names = []
+        for ( nodeid, node ) in sorted( self.cluster_info.get( 'nodes', {} ).items(), key=lambda item: int( item[0] ) ):
+            if nodes is None or nodeid in nodes or node['daemon_name'] in nodes or node['admin_name'] in nodes:
+               names.append( node['admin_name'] )
+        return names
+
+
+    def run_on_nodes( self, commandString, nodes=None, max_workers=64, timeout=60 ):
+        """
+        Run the command on the given nodes, see node_names(), or on every node, with
+        the remote shell command of the cluster.  At most max_workers nodes are run
+        at the same time, and each one gets timeout seconds.
+
+        It is a generator that yields ( node, ( return code, stdout, stderr ), error )
+        as each node finishes, where error is the exception the node raised, ie:
+        ValueError('Timeout: ...'), or None.
+        """
+        if self.remote_shells is None:
+           self.remote_shells = RemoteShells( self.cluster_info.get( 'rsh', '/usr/bin/ssh' ) )
+        return self.remote_shells.run_on_nodes( commandString, self.node_names( nodes ), max_workers, timeout )
+
+
+    def close_remote_shells( self ):
+        if self.remote_shells is not None:
+           self.remote_shells.close()
+           self.remote_shells = None
+
+
+    def set_debug( self, Debug ):
+        """
+        Set the debugging level for the class. 0 by default.
+        """
+        self.debug = Debug
+        if self.debug == True:
+           print("DEBUG: CLUSTER: Debugging turned on")
+
+
+    def toggle_debug( self ):
+        """
+        Toggle debugging. If on, shut it off, if off, set it to 1.
+        """
+        if self.debug == True:
+           print("DEBUG: CLUSTER: Turning ssapi debugging off.")
+           self.debug = False
+        else:
+           print("DEBUG: CLUSTER: Turning ssapi debugging on.")
+           self.debug = True
+
+
+    def get_node_name( self ):
+        """
+        This routine will extract the current node name from the GPFS configuration file.
+        """
+        if self.debug:
+           dfunc = 'get_node_name'
+           print("DEBUG: Starting Function: {}".format(dfunc))
+
+        self.nodename = session_node_name( self.session )
+
+        if self.debug:
+           print("DEBUG: Leavng Function: {}".format(dfunc))
+
+
+    def get_cluster_manager( self ):
+        """
+        This routine parses the mmlsmgr command.
+        """
+        if self.debug:
+           dfunc = 'get_cluster_manager'
+           print("DEBUG: Starting Function: {}".format(dfunc))
+
+        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlsmgr -c", Session=self.session )
+        self.cluster_manager = parse_mmlsmgr( cmd_out )
+        if self.debug and self.cluster_manager:
+           print("DEBUG: Cluster Manager IP: {0}".format(self.cluster_manager['ip']))
+           print("DEBUG: Cluster Manager Name: {0}".format(self.cluster_manager['node']))
+
+        if self.debug:
+           print("DEBUG: Leavng Function: {}".format(dfunc))
+
+
+    def is_node_cluster_manager( self ):
+        """
+        Check to see if this node is the cluster manager.  If so, 
+        set cluster_manager to True else set it to False.  The cluster manager is
+        only fetched if it is not loaded yet.
+        """
+        if self.debug:
+           dfunc = 'is_node_cluster_manager'
+           print("DEBUG: Starting Function: {}".format(dfunc))
+
+        if 'cluster_manager' not in self.__dict__:
+           self.get_cluster_manager()
+
+        if self.nodename in self.cluster_manager['node']:
+           self.is_cluster_manager = True
+        else:
+           self.is_cluster_manager = False
+
+        if self.debug:
+           print("DEBUG: Leavng Function: {}".format(dfunc))
+
 
-    Return Values:
-        1 - The return code of the command
-        2 - The information sent to STDOUT from the command
-        3 - The information sent to STDERR from the command
+    def get_cluster_info( self ):
+        """
+        This routine parses the mmlscluster command.
+        """
+        if self.debug:
+           dfunc = 'get_cluster_info'
+           print("DEBUG: Starting Function: {}".format(dfunc))
 
-    Note: It is up to the caller to determine success/failure.
+        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlscluster", Session=self.session )
+        self.cluster_info = parse_mmlscluster( cmd_out )
 
-    """
-    if not commandString:
-       return( 99999999, None, None )
+        if self.debug:
+           print("DEBUG: Leavng Function: {}".format(dfunc))
 
-    shellCommand = shlex.split( commandString )
-    subp = Popen( shellCommand, stdout=PIPE, stderr=PIPE )
-    ( outdata, errdata ) = subp.communicate()
 
-    if Debug:
-       print("DEBUG: Command: {}".format(commandString))
-       print("DEBUG: Return Code: {}".format(subp.returncode))
-       print("DEBUG: STDOUT: {}".format(outdata))
-       print("DEBUG: STDERR: {}".format(errdata))
+    def dump( self ):
+        if self.debug:
+           print("Cluster Information")
+           for key in self.cluster_info.keys():
+               print("{0} -> {1}".format(key, self.cluster_info[key]))
 
-    return  ( subp.returncode, outdata, errdata )
+           print("\nNSD Information")
+           try:
+              for key in self.nsd_info.keys():
+                  print("{0} -> FS: {1}   Servers: {2}".format(key, self.nsd_info[key]['usage'], self.nsd_info[key]['servers']))
+           except:
+              print("No NSD Information Loaded.")
 
 
-def replace_encoded_strings( mystring ):
+
+
+
+class StoragePool:
+    session = None
+
+    def __init__( self, gpfsdev, Session=None ):
+        self.gpfsdev = gpfsdev
+        self.session = Session
+        commandString = "/usr/lpp/mmfs/bin/mmlspool {}".format( self.gpfsdev )
+        ( rc, cmd_out, cmd_err )  = execute_command( commandString, Session=self.session )
+        check_command_result( commandString, rc, cmd_err )
+        self.pools = parse_mmlspool( cmd_out )
+        self.pool_list = self.pools.keys()
+
+
+    def refresh( self ):
+        """
+        Run mmlspool again and update pools in place.  Returns the change set, and
+        sends it to the subscribers as group 'pools' if anything changed.
+        """
+        commandString = "/usr/lpp/mmfs/bin/mmlspool {}".format( self.gpfsdev )
+        ( rc, cmd_out, cmd_err )  = execute_command( commandString, Session=self.session )
+        check_command_result( commandString, rc, cmd_err )
+        ( self.pools, changes ) = merge_records( self.pools, parse_mmlspool( cmd_out ) )
+        self.pool_list = self.pools.keys()
+        notify_subscribers( self, 'pools', changes )
+        return changes
+
+
+    def subscribe( self, callback ):
+        """
+        Call callback( pools, 'pools', changes ) when refresh() finds a change.
+        """
+        subscribe( self, callback )
+
+
+    def unsubscribe( self, callback ):
+        unsubscribe( self, callback )
+
+
+    def dump( self ):
+        print("{}".format(self.pools))
+
+
+    def __getitem__( self, key ):
+        return self.pools[key]
+
+
+class RingBuffer( object ):
     """
-    The mmlsfileset command returns encoded strings for special characters.
-    This will replace those encoded strings and return a true string.
+    A fixed size buffer of floats that keeps the last capacity values appended.
     """
-    tempstring = mystring.replace('%2F', '/')
-    mystring = tempstring
-    tempstring = mystring.replace('%5F', '_')
-    mystring = tempstring
-    tempstring = mystring.replace('%3A', ':')
-    return tempstring
+    __slots__ = ( 'data', 'capacity', 'start', 'count' )
 
+    def __init__( self, capacity ):
+        self.data = array( 'd', [ 0.0 ] ) * capacity
+        self.capacity = capacity
+        self.start = 0
+        self.count = 0
 
-def remove_special_characters( mystring ):
+
+    def append( self, value ):
+        end = ( self.start + self.count ) % self.capacity
+        self.data[end] = value
+        if self.count < self.capacity:
+           self.count = self.count + 1
+        else:
+           self.start = ( self.start + 1 ) % self.capacity
+
+
+    def __len__( self ):
+        return self.count
+
+
+    def __getitem__( self, idx ):
+        if idx < 0:
+           idx = idx + self.count
+        if idx < 0 or idx >= self.count:
+           raise IndexError( idx )
+        return self.data[( self.start + idx ) % self.capacity]
+
+
+    def values( self ):
+        """
+        Return the values from oldest to newest.
+        """
+        end = self.start + self.count
+        if end <= self.capacity:
+           return self.data[self.start:end]
+        return self.data[self.start:] + self.data[:end - self.capacity]
+
+
+def fill_rate( times, used ):
     """
-    The mmlspool command has returns strings with special characters.
-    This will remove those encoded strings.
+    Return the least squares slope of used over times, in units per second, or None
+    if there are fewer than two samples or they all have the same time.
     """
-    tempstring = mystring.replace('%', '')
-    mystring = tempstring
-    tempstring = mystring.replace('(', '')
-    mystring = tempstring
-    tempstring = mystring.replace(')', '')
-    return tempstring
+    count = len( times )
+    if count < 2:
+       return None
+    mean_time = sum( times ) / count
+    mean_used = sum( used ) / count
+    numerator = 0.0
+    denominator = 0.0
+    for ( t, u ) in zip( times, used ):
+        numerator = numerator + ( t - mean_time ) * ( u - mean_used )
+        denominator = denominator + ( t - mean_time ) * ( t - mean_time )
+    if denominator == 0:
+       return None
+    return numerator / denominator
+
+
+class PoolSeries( object ):
+    """
+    The sample history of one storage pool, in ring buffers of capacity samples.
+    Sizes are in KB, as mmlspool reports them.
+    """
+    fields = ( 'datasize', 'datafree', 'metasize', 'metafree' )
 
+    def __init__( self, capacity ):
+        self.times = RingBuffer( capacity )
+        self.series = dict( ( field, RingBuffer( capacity ) ) for field in self.fields )
 
-class Nsds:
-    """
-    This class contains all of the information about the NSDs in the cluster.  It
-    includes the NSD name, servers they are attached to, gpfs device they serve, etc.
 
-    gpfsdevs - a list unique gpfs devices
+    def append( self, when, pool ):
+        """
+        Add a sample.  Every field is converted before anything is appended, so a
+        bad value leaves the ring buffers aligned.
+        """
+        values = [ float( pool[field] ) for field in self.fields ]
+        self.times.append( when )
+        for ( field, value ) in zip( self.fields, values ):
+            self.series[field].append( value )
 
-    nsds[name]['usage'] = The gpfs device the specified name is a part of
-    nsds[name]['servers'] = The storage servers the specified name is hosted by
 
-    """
-    def __init__( self, Debug=False ):
-        self.set_debug( Debug )
-        self.collect_nsd_info()
+    def window( self, since ):
+        """
+        Return the times and the series of the samples taken at or after since.
+        """
+        times = self.times.values()
+        first = 0
+        while first < len( times ) and times[first] < since:
+            first = first + 1
+        return ( times[first:], dict( ( field, self.series[field].values()[first:] ) for field in self.fields ) )
 
 
-    def set_debug( self, Debug ):
+    def forecast( self, since ):
         """
-        Set the debugging level for the class. 0 by default.
+        Return the latest sizes, and the fill rate in KB per second and the time to
+        full in seconds of data and metadata over the samples taken since.  The time
+        to full is None if the pool is not filling.
         """
-        self.debug = Debug
-        if self.debug == True:
-           print("DEBUG: NSDs: Debugging turned on")
+        ( times, series ) = self.window( since )
+        result = { 'samples': len( times ) }
+        for kind in ( 'data', 'meta' ):
+            size = series[kind + 'size']
+            free = series[kind + 'free']
+            rate = fill_rate( times, [ s - f for ( s, f ) in zip( size, free ) ] )
+            result[kind + 'size'] = size[-1] if size else None
+            result[kind + 'free'] = free[-1] if free else None
+            result[kind + '_fill_rate'] = rate
+            if rate and rate > 0:
+               result[kind + '_time_to_full'] = free[-1] / rate
+            else:
+               result[kind + '_time_to_full'] = None
+        return result
 
 
-    def toggle_debug( self ):
+class PoolSampler:
+    """
+    Samples the storage pools of one or more GPFS devices every interval seconds on
+    a background thread, and forecasts how fast they are filling up.
+
+        sampler = ssapi.PoolSampler( [ 'fs0', 'fs1' ], interval=60, window=3600 )
+        sampler.start()
+        ...
+        sampler.forecast()['fs0']['data']['data_time_to_full']
+
+    Each pool keeps at most capacity samples in ring buffers, so memory does not
+    grow however long the sampler runs.  The forecasts use the samples of the last
+    window seconds.  Devices that fail to sample keep their exception in errors.
+    """
+    def __init__( self, devices, interval=60, window=3600, capacity=1024, max_workers=8 ):
+        if isinstance( devices, string_types ):
+           devices = [ devices ]
+        self.devices = list( devices )
+        self.interval = interval
+        self.window = window
+        self.capacity = capacity
+        self.max_workers = max_workers
+        self.pools = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def sample( self ):
         """
-        Toggle debugging. If on, shut it off, if off, set it to 1.
+        Take one sample of every device now.
         """
-        if self.debug == True:
-           print("DEBUG: NSDs: Turning ssapi debugging off.")
-           self.debug = False
-        else:
-           print("DEBUG: NSDs: Turning ssapi debugging on.")
-           self.debug = True
+        for ( device, pools, error ) in run_bounded( StoragePool, self.devices, self.max_workers ):
+            now = time.time()
+            with self.lock:
+               if error is not None:
+                  self.errors[device] = error
+                  continue
+               self.errors.pop( device, None )
+               for ( name, pool ) in pools.pools.items():
+                   key = ( device, name )
+                   if key not in self.pools:
+                      self.pools[key] = PoolSeries( self.capacity )
+                   try:
+                      self.pools[key].append( now, pool )
+                   except ValueError as parse_error:
+                      self.errors[device] = parse_error
+
+
+    def run( self ):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait( self.interval )
+
+
+    def start( self ):
+        """
+        Start sampling on a daemon thread.
+        """
+        if self.thread is not None and self.thread.is_alive():
+           return
+        self.stopped.clear()
+        self.thread = threading.Thread( target=self.run )
+        self.thread.daemon = True
+        self.thread.start()
 
 
-    def dump( self ):
-        print("GPFS Devices: {}".format(self.gpfsdevs))
-        nsd_keys = self.nsds.keys()
-        for nsd in sorted(nsd_keys):
-            print("{:<10s}  {:<10s}  {:<s}".format(nsd, self.nsds[nsd]['usage'], self.nsds[nsd]['servers']))
+    def stop( self, timeout=None ):
+        self.stopped.set()
+        if self.thread is not None:
+           self.thread.join( timeout )
+           self.thread = None
 
 
-    def return_gpfs_devices( self ):
+    def forecast( self, device=None ):
         """
-        Return an iterable list of uniq GPFS devices.
+        Return device -> pool -> forecast, see PoolSeries.forecast(), for every
+        device or only the given one.
         """
-        return self.gpfsdevs
+        since = time.time() - self.window
+        result = {}
+        with self.lock:
+           for ( ( dev, name ), series ) in self.pools.items():
+               if device is None or dev == device:
+                  result.setdefault( dev, {} )[name] = series.forecast( since )
+        return result
 
 
-    def collect_nsd_info( self ):
+    def filling( self, within ):
         """
-        Process the mmlsnsd command output to build the necessary structures.
+        Return the ( device, pool, kind, seconds ) of every pool whose data or
+        metadata is forecast to be full within the given number of seconds.
         """
-        if self.debug:
-           dfunc = inspect.stack()[0][3]
-           print("DEBUG: Starting Function: {}".format(dfunc))
+        result = []
+        for ( device, pools ) in self.forecast().items():
+            for ( name, forecast ) in pools.items():
+                for kind in ( 'data', 'meta' ):
+                    seconds = forecast[kind + '_time_to_full']
+                    if seconds is not None and seconds <= within:
+                       result.append( ( device, name, kind, seconds ) )
+        return sorted( result, key=lambda entry: entry[3] )
+
+
+#-------------------------------------------------------------------------------------
+# Capacity report
+#
+# Cluster.capacity_report() gathers the pools of every device into one table with a
+# row per ( device, pool ).  With NumPy installed the table is a structured array
+# and the summary is computed with array operations.  Without it, the table is a
+# CapacityTable of array columns that can be used the same way, table['datafree'].
+#-------------------------------------------------------------------------------------
 
-        self.nsds = {}
-        fsdevs = {}
-        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlsnsd" )
+# The numeric columns, in KB, and the percentages computed from them.
+capacity_size_fields = ( 'datasize', 'datafree', 'metasize', 'metafree' )
+capacity_pct_fields = ( 'datapctused', 'metapctused' )
 
-        for line in cmd_out.splitlines():
-            line.rstrip()
 
-            # Ignore blank lines
-            if not line:
-               continue
+class CapacityTable( object ):
+    """
+    The columns of the capacity report when NumPy is not installed.  device and
+    pool are lists, the other columns are arrays of floats.  A pct used column is
+    NaN for pools without data or metadata.
+    """
+    def __init__( self, devices, pools, sizes ):
+        self.columns = { 'device': devices, 'pool': pools }
+        for field in capacity_size_fields:
+            self.columns[field] = array( 'd', sizes[field] )
+        nan = float( 'nan' )
+        for kind in ( 'data', 'meta' ):
+            size = self.columns[kind + 'size']
+            free = self.columns[kind + 'free']
+            self.columns[kind + 'pctused'] = array( 'd', [ 100.0 * ( s - f ) / s if s > 0 else nan for ( s, f ) in zip( size, free ) ] )
 
-            # Ignore dashed lines
-            if '----------' in line:
-               continue
 
-            # Ignore header lines
-            if 'File system' in line:
-               continue
+    def __getitem__( self, field ):
+        return self.columns[field]
 
-            if '(local cache)' in line:
-               nsd_name = line.split()[2]
-               fsname = 'lroc'
-               servers = (line.split()[3]).split(',')
-            elif 'free disk' in line:
-               nsd_name = line.split()[2]
-               fsname = 'free'
-               servers = (line.split()[3]).split(',')
-            else:
-               nsd_name = line.split()[1]
-               fsname = line.split()[0]
-               servers = (line.split()[2]).split(',')
-               fsdevs[fsname] = 1
 
-            self.nsds[nsd_name] = {}
-            self.nsds[nsd_name]['usage'] = fsname
-            self.nsds[nsd_name]['servers'] = servers
+    def __len__( self ):
+        return len( self.columns['device'] )
 
-            try:
-               del fsname
-               del servers
-            except NameError:
-               pass
 
-        self.gpfsdevs = fsdevs.keys()
+def capacity_table( pools_by_device ):
+    """
+    Build the capacity table from a dictionary of device -> StoragePool.pools.
+    """
+    devices = []
+    pools = []
+    sizes = dict( ( field, [] ) for field in capacity_size_fields )
+    for device in sorted( pools_by_device ):
+        for ( name, pool ) in sorted( pools_by_device[device].items() ):
+            devices.append( device )
+            pools.append( name )
+            for field in capacity_size_fields:
+                sizes[field].append( pool[field] )
+
+    numpy = import_numpy()
+    if numpy is None:
+       return CapacityTable( devices, pools, dict( ( field, [ float( val ) for val in values ] ) for ( field, values ) in sizes.items() ) )
+
+    width = max( [ len( name ) for name in devices + pools ] + [ 1 ] )
+    dtype = [ ( 'device', 'U{}'.format( width ) ), ( 'pool', 'U{}'.format( width ) ) ]
+    dtype.extend( ( field, 'f8' ) for field in capacity_size_fields + capacity_pct_fields )
+    table = numpy.zeros( len( devices ), dtype=dtype )
+    table['device'] = devices
+    table['pool'] = pools
+    for field in capacity_size_fields:
+        table[field] = numpy.array( sizes[field] ).astype( 'f8' )
+    with numpy.errstate( divide='ignore', invalid='ignore' ):
+       for kind in ( 'data', 'meta' ):
+           size = table[kind + 'size']
+           table[kind + 'pctused'] = numpy.where( size > 0, 100.0 * ( size - table[kind + 'free'] ) / size, numpy.nan )
+    return table
+
+
+def percentiles( values, fractions, numpy=None ):
+    """
+    Return the nearest rank percentiles of values, skipping NaN, or None for each if
+    there are no values.  They are computed with the numpy module if it is given.
+    """
+    if numpy is not None:
+       values = numpy.asarray( values )
+       values = values[~numpy.isnan( values )]
+       if not len( values ):
+          return [ None ] * len( fractions )
+       points = [ 100.0 * fraction for fraction in fractions ]
+       try:
+          result = numpy.percentile( values, points, method='nearest' )
+       except TypeError:
+          # NumPy before 1.22 calls it interpolation
+          result = numpy.percentile( values, points, interpolation='nearest' )
+       return [ float( val ) for val in result ]
+
+    values = sorted( val for val in values if val == val )
+    if not values:
+       return [ None ] * len( fractions )
+    return [ values[min( len( values ) - 1, int( round( fraction * ( len( values ) - 1 ) ) ) )] for fraction in fractions ]
+
+
+def capacity_summary( table, threshold=90.0 ):
+    """
+    Return the totals, by device and overall, the percentiles of the data and
+    metadata pct used of the pools, and the ( device, pool, kind, pct used ) of every
+    pool at or over threshold percent used.
+    """
+    summary = { 'pools': len( table ), 'threshold': threshold, 'breaches': [] }
+
+    numpy = None if isinstance( table, CapacityTable ) else import_numpy()
+    if numpy is not None:
+       totals = dict( ( field, float( table[field].sum() ) ) for field in capacity_size_fields )
+       ( devices, inverse ) = numpy.unique( table['device'], return_inverse=True )
+       sums = dict( ( field, numpy.bincount( inverse, weights=table[field], minlength=len( devices ) ) )
+                    for field in capacity_size_fields )
+       by_device = {}
+       for ( idx, device ) in enumerate( devices ):
+           by_device[str( device )] = dict( ( field, float( sums[field][idx] ) ) for field in capacity_size_fields )
+       for kind in ( 'data', 'meta' ):
+           pct = table[kind + 'pctused']
+           for row in numpy.nonzero( pct >= threshold )[0]:
+               summary['breaches'].append( ( str( table['device'][row] ), str( table['pool'][row] ), kind, float( pct[row] ) ) )
+    else:
+       totals = dict( ( field, sum( table[field], 0.0 ) ) for field in capacity_size_fields )
+       by_device = dict( ( device, dict( ( field, 0.0 ) for field in capacity_size_fields ) ) for device in set( table['device'] ) )
+       for ( row, device ) in enumerate( table['device'] ):
+           for field in capacity_size_fields:
+               by_device[device][field] = by_device[device][field] + table[field][row]
+       for kind in ( 'data', 'meta' ):
+           for ( row, pct ) in enumerate( table[kind + 'pctused'] ):
+               if pct >= threshold:
+                  summary['breaches'].append( ( table['device'][row], table['pool'][row], kind, pct ) )
+
+    for values in [ totals ] + list( by_device.values() ):
+        for kind in ( 'data', 'meta' ):
+            size = values[kind + 'size']
+            values[kind + 'pctused'] = 100.0 * ( size - values[kind + 'free'] ) / size if size > 0 else None
+
+    summary['totals'] = totals
+    summary['devices'] = by_device
+    for kind in ( 'data', 'meta' ):
+        ( p50, p90, p99, top ) = percentiles( table[kind + 'pctused'], ( 0.50, 0.90, 0.99, 1.0 ), numpy )
+        summary[kind + 'pctused'] = { 'p50': p50, 'p90': p90, 'p99': p99, 'max': top }
+    summary['breaches'].sort( key=lambda breach: -breach[3] )
+    return summary
+
+
+def snapshot_delete_list( snaplist, max_to_keep ):
+    """
+    Given the sorted list of snapshot names and an integer of how many snapshots you want
+    to keep, return the names that are to be purged before a new snapshot is added.
+    """
+    # Slicing is a 0 based operation, plus we are adding a snapshot.
+    max_to_keep = max_to_keep - 1
 
-        if self.debug:
-           dfunc = inspect.stack()[0][3]
-           print("DEBUG: Leavng Function: {}".format(dfunc))
+    dellist = []
+    if len( snaplist ) <= max_to_keep:
+       return dellist
 
+    if max_to_keep == 0:
+       dellist = snaplist
+    elif len( snaplist ) > max_to_keep:
+       dellist = list(snaplist)[ : -( max_to_keep ) ]
 
+    return dellist
 
-class Cluster:
+
+class Snapshots:
     """
-    This class will collect the information about the cluster.
+    This class will collect the snapshots of a GPFS device, or of one fileset in it.
 
-    If you wish to debug the class, you can now pass Debug=True on the initialization.
+    If you pass Compact=True, snapshots is a RecordTable that uses much less memory
+    with large numbers of snapshots, and snapID, data and metadata are integers.
+
+    If you pass Session=, the node name and the snapshot list are shared with the
+    other objects of that Session.
     """
-    def __init__( self, Debug=False ):
-        self.set_debug( Debug )
-        self.get_cluster_info()
+    session = None
+
+    def __init__( self, gpfsdev, fileset, Debug=False, Compact=False, Session=None ):
+        self.set_debug(Debug)
+        self.session = Session
+        self.gpfsdev = gpfsdev
+        self.fileset = fileset
+        self.compact = Compact
+        self.snap_name_separator = '_'
+        self.snapshots = {}
         self.get_node_name()
-        self.is_node_cluster_manager()
-        self.nsds = Nsds( Debug=self.debug )
-        self.gpfsdevs = self.nsds.return_gpfs_devices()
+
+        if self.debug == True:
+           print("GPFSDEV: {}   FILESET: {}   DEBUG: {}".format(self.gpfsdev,
+                                                                self.fileset,
+                                                                self.debug))
+        self.get_snapshot_information()
+
+
+    def list_command( self ):
+        """
+        Return the mmlssnapshot command for this file system or fileset.
+        """
+        if not self.fileset:
+           return "/usr/lpp/mmfs/bin/mmlssnapshot {} -Y".format( self.gpfsdev )
+        else:
+           return "/usr/lpp/mmfs/bin/mmlssnapshot {} -j {} -Y".format( self.gpfsdev, self.fileset )
+
+
+    def get_snapshot_information( self ):
+        """
+        Run mmlssnapshot and rebuild the snapshot structures from its output.
+        """
+        if self.debug == True:
+           print( "DEBUG: CMD: {} ".format( self.list_command() ) )
+        stream = CommandStream( self.list_command(), self.debug, self.session )
+        self.set_snapshots( parse_mmlssnapshot( stream, self.compact ) )
+        self.check_list_output( stream.returncode, None, stream.stderr )
+
+
+    def refresh( self ):
+        """
+        Run mmlssnapshot again and update snapshots in place.  Returns the change
+        set, and sends it to the subscribers as group 'snapshots' if anything changed.
+        """
+        stream = CommandStream( self.list_command(), self.debug, self.session )
+        snapshots = parse_mmlssnapshot( stream, self.compact )
+        self.check_list_output( stream.returncode, None, stream.stderr )
+
+        ( snapshots, changes ) = merge_records( self.snapshots, snapshots )
+        self.set_snapshots( snapshots )
+        notify_subscribers( self, 'snapshots', changes )
+        return changes
+
+
+    def subscribe( self, callback ):
+        """
+        Call callback( snapshots, 'snapshots', changes ) when refresh() finds a change.
+        """
+        subscribe( self, callback )
+
+
+    def unsubscribe( self, callback ):
+        unsubscribe( self, callback )
+
+
+    def check_list_output( self, rc, cmd_out, cmd_err ):
+        if rc > 0:
+           print("RC: {}".format(rc))
+           if cmd_out is not None:
+              print("STDOUT: {}".format(cmd_out))
+           print("STDERR: {}".format(cmd_err))
+
+
+    def set_snapshots( self, snapshots ):
+        """
+        Keep the parsed snapshots and build the sorted snapshot list from them.
+        """
+        self.snapshots = snapshots
+        snaplist = self.snapshots.keys()
+        self.snaplist = sorted( snaplist )
+        self.snap_count = len( snaplist )
 
 
     def set_debug( self, Debug ):
@@ -220,7 +3492,7 @@ class Cluster:
         """
         self.debug = Debug
         if self.debug == True:
-           print("DEBUG: CLUSTER: Debugging turned on")
+           print("DEBUG: Snapshots: Debugging turned on")
 
 
     def toggle_debug( self ):
@@ -228,10 +3500,10 @@ class Cluster:
         Toggle debugging. If on, shut it off, if off, set it to 1.
         """
         if self.debug == True:
-           print("DEBUG: CLUSTER: Turning ssapi debugging off.")
+           print("DEBUG: Snapshots: Turning ssapi debugging off.")
            self.debug = False
         else:
-           print("DEBUG: CLUSTER: Turning ssapi debugging on.")
+           print("DEBUG: Snapshots: Turning ssapi debugging on.")
            self.debug = True
 
 
@@ -239,330 +3511,729 @@ class Cluster:
         """
         This routine will extract the current node name from the GPFS configuration file.
         """
-        if self.debug:
-           dfunc = inspect.stack()[0][3]
-           print("DEBUG: Starting Function: {}".format(dfunc))
+        self.nodename = session_node_name( self.session )
 
-        f = open('/var/mmfs/gen/mmfsNodeData', 'r')
-        nodecfg = f.read()
-        nodecfg_s = nodecfg.split(':')
-        f.close()
-        self.nodename = nodecfg_s[5]
 
-        if self.debug:
-           print("DEBUG: Leavng Function: {}".format(dfunc))
+    def get_delete_list( self, max_to_keep ):
+        """
+        Given an integer of how many snapshots you want to keep, this will return a list of snapshot
+        names that are to be purged.  It does not purge them, only a list of what needs to be purged
+        based on how many you want to keep.
+        """
+        self.dellist = snapshot_delete_list( self.snaplist, max_to_keep )
+        return self.dellist
 
 
-    def get_cluster_manager( self ):
+    def delsnap( self, snap_name, fileset=None ):
         """
-        This routine parses the mmlsmgr command.
+        Given a specific snapshot name, this routine will execute mmdelsnapshot and return you the output
+        from the command.  The object already knows if it is a filesystem or a fileset snapshot, so you just
+        need to specify the snapshot name.  Pass fileset to delete a snapshot of a different fileset.
         """
-        if self.debug:
-           dfunc = inspect.stack()[0][3]
-           print("DEBUG: Starting Function: {}".format(dfunc))
+        return execute_command( self.delete_command( snap_name, fileset ), Session=self.session )
+
+
+    def delete_snapshots( self, dellist, max_workers=4, retries=5, backoff=1.0, Refresh=True ):
+        """
+        Delete all of the snapshots in dellist, running at most max_workers mmdelsnapshot
+        commands at a time on this device.  A deletion that fails because the cluster is
+        busy is retried, see execute_with_retry().
+
+        The items in dellist are snapshot names, like the ones get_delete_list() returns,
+        or ( fileset, snapshot name ) tuples to delete snapshots of other filesets.  If
+        this object lists the whole device, a plain name is deleted from the fileset
+        mmlssnapshot reported for it.
+
+        Returns a dictionary of item -> { 'rc', 'stdout', 'stderr', 'attempts' }.  The
+        snapshot list is fetched again once all of the deletions are done, unless
+        Refresh is False.
+        """
+        def delete( item ):
+            if isinstance( item, tuple ):
+               ( fileset, snap_name ) = item
+            else:
+               ( fileset, snap_name ) = ( self.snapshot_fileset( item ), item )
+            return execute_with_retry( self.delete_command( snap_name, fileset ), retries, backoff, self.debug, self.session )
+
+        report = {}
+        for ( item, result, error ) in run_bounded( delete, dellist, max_workers ):
+            if error is not None:
+               result = ( None, None, str( error ), 1 )
+            ( rc, cmd_out, cmd_err, attempts ) = result
+            report[item] = { 'rc': rc, 'stdout': cmd_out, 'stderr': cmd_err, 'attempts': attempts }
+
+        if Refresh:
+           self.get_snapshot_information()
+        return report
+
+
+    def snapshot_fileset( self, snap_name ):
+        """
+        Return the fileset the named snapshot belongs to.
+        """
+        if self.fileset:
+           return self.fileset
+        snapshot = self.snapshots.get( snap_name )
+        if snapshot is None:
+           return self.fileset
+        return snapshot.get( 'fileset' ) or self.fileset
+
+
+    def delete_command( self, snap_name, fileset=None ):
+        """
+        Return the mmdelsnapshot command for the given snapshot name.
+        """
+        if fileset is None:
+           fileset = self.fileset
+
+        if fileset == '':
+           #return "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} -N {}".format(self.gpfsdev, snap_name, self.nodename)
+           return "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} ".format( self.gpfsdev, snap_name )
+        else:
+           #return "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} -j {} -N {}".format(self.gpfsdev, snap_name, fileset, self.nodename)
+           return "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} -j {} ".format( self.gpfsdev, snap_name, fileset )
+
+
+    def snap( self ):
+        """
+        This code will create a snapshot of the specified filesystem or fileset.
+
+        NOTE: You can NOT mix filesystem and fileset snapshots on the same GPFS device.
+
+        Filesystem snapshots are named: CCYYMMDD==HHMM for easy sorting / processing.
 
-        self.cluster_manager = {}
-        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlsmgr -c" )
-        for line in cmd_out.splitlines():
-            line.rstrip()
+        Filesystem snapshots are named: <Fileset>==CCYYMMDD==HHMM for easy processing again.
+        """
+        return execute_command( self.create_command( self.snapshot_name() ), Session=self.session )
 
-            # Ignore blank lines
-            if not line:
-               continue
 
-            if 'Cluster manager node' in line:
-               line = line.translate(None, '()')
-               ipaddr = line.split()[3]
-               nodename = line.split()[4]
-               self.cluster_manager['node'] = nodename
-               self.cluster_manager['ip'] = ipaddr
-               if self.debug:
-                  print("DEBUG: Cluster Manager IP: {0}".format(ipaddr))
-                  print("DEBUG: Cluster Manager Name: {0}".format(nodename))
+    def snapshot_name( self, fileset=None ):
+        """
+        Return the name for a new snapshot taken now, see snap().
+        """
+        if fileset is None:
+           fileset = self.fileset
 
-        if self.debug:
-           print("DEBUG: Leavng Function: {}".format(dfunc))
+        if fileset == '':
+           return time.strftime("%Y%m%d") + self.snap_name_separator + time.strftime("%H%M")
+        else:
+           return fileset + self.snap_name_separator + time.strftime("%Y%m%d") + self.snap_name_separator + time.strftime("%H%M")
 
 
-    def is_node_cluster_manager( self ):
+    def create_command( self, snapname, fileset=None ):
         """
-        Check to see if this node is the cluster manager.  If so, 
-        set cluster_manager to True else set it to False.
+        Return the mmcrsnapshot command for the given snapshot name.
         """
-        if self.debug:
-           dfunc = inspect.stack()[0][3]
-           print("DEBUG: Starting Function: {}".format(dfunc))
-
-        self.get_cluster_manager()
+        if fileset is None:
+           fileset = self.fileset
 
-        if self.nodename in self.cluster_manager['node']:
-           self.is_cluster_manager = True
+        if fileset == '':
+           return "/usr/lpp/mmfs/bin/mmcrsnapshot {0} {1}".format( self.gpfsdev, snapname )
         else:
-           self.is_cluster_manager = False
-
-        if self.debug:
-           print("DEBUG: Leavng Function: {}".format(dfunc))
+           return "/usr/lpp/mmfs/bin/mmcrsnapshot {0} {1} -j {2}".format( self.gpfsdev, snapname, fileset )
 
 
-    def get_cluster_info( self ):
+    def fileset_snapshots( self ):
         """
-        This routine parses the mmlscluster command.
+        Return a dictionary of fileset -> sorted list of its snapshot names, from the
+        fileset field mmlssnapshot reports.  Global snapshots are under ''.
         """
-        if self.debug:
-           dfunc = inspect.stack()[0][3]
-           print("DEBUG: Starting Function: {}".format(dfunc))
+        by_fileset = {}
+        for sname in self.snaplist:
+            by_fileset.setdefault( self.snapshots[sname]['fileset'], [] ).append( sname )
+        return by_fileset
 
-        self.cluster_info = {}
-        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlscluster" )
-        found_nodes = 0
-        for line in cmd_out.splitlines():
-            line.rstrip()
 
-            # Ignore blank lines
-            if not line:
-               continue
+#-------------------------------------------------------------------------------------
+# Quotas
+#
+# mmrepquota reports millions of entries on a large file system, so Quotas streams
+# its output one record at a time.  With Compact=True the report is also kept in a
+# QuotaTable, with the usage and limits in integer arrays, for repeated queries.
+#-------------------------------------------------------------------------------------
 
-            # Ignore dashed lines
-            if '----------' in line:
-               continue
-            if '==========' in line:
-               continue
+# The fields that are converted to integers.  Block values are in KB.
+quota_numeric_fields = ( 'id', 'blockUsage', 'blockQuota', 'blockLimit', 'blockInDoubt',
+                         'filesUsage', 'filesQuota', 'filesLimit', 'filesInDoubt', 'fid' )
+quota_text_fields = ( 'filesystemName', 'quotaType', 'name', 'blockGrace', 'filesGrace', 'remarks',
+                      'quota', 'defQuota', 'filesetname' )
 
-            if found_nodes >= 1:
-               nodeid = line.split()[0]
-               daemonname = line.split()[1]
-               ipaddr = line.split()[2]
-               adminname = line.split()[3]
-               self.cluster_info['nodes'][nodeid] = {}
-               self.cluster_info['nodes'][nodeid]['daemon_name'] = daemonname
-               self.cluster_info['nodes'][nodeid]['ip'] = ipaddr
-               self.cluster_info['nodes'][nodeid]['admin_name'] = adminname
-
-            if 'Node  Daemon' in line:
-               found_nodes = found_nodes + 1
-               self.cluster_info['nodes'] = {}
-
-            if 'GPFS cluster name' in line:
-               self.cluster_info['name'] = line.split()[3]
-            if 'GPFS cluster id' in line:
-               self.cluster_info['id'] = line.split()[3]
-            if 'GPFS UID domain' in line:
-               self.cluster_info['uid'] = line.split()[3]
-            if 'Remote shell command' in line:
-               self.cluster_info['rsh'] = line.split()[3]
-            if 'Remote file copy command' in line:
-               self.cluster_info['rcp'] = line.split()[4]
-            if 'Primary server' in line:
-               self.cluster_info['primary'] = line.split()[2]
-            if 'Secondary server' in line:
-               self.cluster_info['secondary'] = line.split()[2]
+grace_units = { 'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800 }
 
-        if self.debug:
-           print("DEBUG: Leavng Function: {}".format(dfunc))
+try:
+   array( 'q' )
+   quota_typecode = 'q'
+except ValueError:
+   quota_typecode = 'l'
 
 
-    def dump( self ):
-        if self.debug:
-           print("Cluster Information")
-           for key in self.cluster_info.keys():
-               print("{0} -> {1}".format(key, self.cluster_info[key]))
+def quota_number( value ):
+    """
+    Return value as an integer, or 0 if it is not a number.
+    """
+    if isinstance( value, int ):
+       return value
+    try:
+       return int( value )
+    except ( TypeError, ValueError ):
+       return 0
 
-           print("\nNSD Information")
-           try:
-              for key in self.nsd_info.keys():
-                  print("{0} -> FS: {1}   Servers: {2}".format(key, self.nsd_info[key]['usage'], self.nsd_info[key]['servers']))
-           except:
-              print("No NSD Information Loaded.")
 
+def quota_grace_seconds( grace ):
+    """
+    Convert a grace field, ie: 'none', 'expired' or '6 days', to seconds.  Returns
+    None when there is no grace period running.
+    """
+    words = grace.split() if grace else []
+    if not words or words[0] in ( 'none', '-' ):
+       return None
+    if words[0] == 'expired':
+       return 0
+    if len( words ) < 2 or not words[0].isdigit():
+       return None
+    unit = grace_units.get( words[1].rstrip('s') )
+    if unit is None:
+       return None
+    return int( words[0] ) * unit
+
+
+def iter_mmrepquota( cmd_out ):
+    """
+    A generator that parses mmrepquota -Y output one line at a time and yields a
+    dictionary for each quota entry, with the numeric fields as integers.
+    """
+    for ( keys, vals ) in iter_mm_rows( output_lines( cmd_out ) ):
+        record = dict( zip( keys, vals ) )
+        for field in quota_numeric_fields:
+            value = record.get( field )
+            if value is not None and value.isdigit():
+               record[field] = int( value )
+        yield record
 
 
+class QuotaTable( object ):
+    """
+    A column store of quota entries.  The numeric fields are kept in integer arrays,
+    the grace periods in seconds ( -1 for none ), and the text fields in
+    RecordColumns.  Rows are numbered in the order mmrepquota reported them.
+    """
+    def __init__( self ):
+        self.numbers = dict( ( field, array( quota_typecode ) ) for field in quota_numeric_fields )
+        self.grace = { 'block': array( quota_typecode ), 'files': array( quota_typecode ) }
+        self.text = dict( ( field, RecordColumn() ) for field in quota_text_fields )
+        self.length = 0
 
 
-class StoragePool:
-    def __init__( self, gpfsdev ):
-        self.gpfsdev = gpfsdev
-        self.pools = {}
+    def add( self, record ):
+        for ( field, column ) in self.numbers.items():
+            column.append( quota_number( record.get( field ) ) )
+        for ( kind, column ) in self.grace.items():
+            seconds = quota_grace_seconds( record.get( kind + 'Grace' ) )
+            column.append( -1 if seconds is None else seconds )
+        for ( field, column ) in self.text.items():
+            code = column.encode( record.get( field, missing_value ) )
+            column.codes.append( code )
+        self.length = self.length + 1
 
-        ( rc, cmd_out, cmd_err )  = execute_command( "/usr/lpp/mmfs/bin/mmlspool {}".format( self.gpfsdev) )
 
-        for line in cmd_out.splitlines()[2:]:
-            line.rstrip()
+    def finish( self ):
+        for column in self.text.values():
+            column.shrink()
 
-            # Ignore blank lines
-            if not line:
-               continue
 
-            newline = remove_special_characters( line )
-            vals = newline.split()
-            poolname = vals[0]
-            self.pools[poolname] = {}
-            self.pools[poolname]['id'] = vals[1]
-            self.pools[poolname]['blksize'] = vals[2]
-            self.pools[poolname]['blkmod'] = vals[3]
-            self.pools[poolname]['data'] = vals[4]
-            self.pools[poolname]['metadata'] = vals[5]
-            self.pools[poolname]['datasize'] = vals[6]
-            self.pools[poolname]['datafree'] = vals[7]
-            self.pools[poolname]['datapctfree'] = vals[8]
-            self.pools[poolname]['metasize'] = vals[9]
-            self.pools[poolname]['metafree'] = vals[10]
-            self.pools[poolname]['metapctfree'] = vals[11]
+    def __len__( self ):
+        return self.length
 
-        self.pool_list = self.pools.keys()
 
+    def __getitem__( self, row ):
+        """
+        Return the entry in row as a dictionary, like the ones Quotas streams.
+        """
+        record = {}
+        for ( field, column ) in self.text.items():
+            value = column.values[column.codes[row]]
+            if value is not missing_value:
+               record[field] = value
+        for ( field, column ) in self.numbers.items():
+            record[field] = column[row]
+        return record
 
-    def dump( self ):
-        print("{}".format(self.pools))
 
+    def __iter__( self ):
+        for row in range( self.length ):
+            yield self[row]
 
-    def __getitem__( self, key ):
-        return self.pools[key]
 
+    def rows( self, quotaType=None ):
+        """
+        Return the row numbers of every entry, or of the entries of one quota type,
+        ie: 'USR', 'GRP' or 'FILESET'.
+        """
+        if quotaType is None:
+           return range( self.length )
+        column = self.text['quotaType']
+        codes = column.codes
+        wanted = [ code for ( code, value ) in enumerate( column.values ) if value == quotaType ]
+        if not wanted:
+           return []
+        code = wanted[0]
+        return [ row for row in range( self.length ) if codes[row] == code ]
+
+
+class Quotas:
+    """
+    This class reports the quotas of a GPFS device from mmrepquota -Y.
 
-class Snapshots:
-    def __init__( self, gpfsdev, fileset, Debug=False ):
-        self.set_debug(Debug)
+    Iterating over it runs mmrepquota and yields one dictionary per quota entry,
+    without keeping the report in memory:
+
+        for quota in ssapi.Quotas( 'fs0' ):
+            print( quota['name'], quota['blockUsage'] )
+
+    Types selects the user (u), group (g) and fileset (j) quotas to report.
+
+    If you pass Compact=True, the report is read once into a QuotaTable, table, and
+    the queries use it instead of running mmrepquota each time.
+    """
+    session = None
+
+    def __init__( self, gpfsdev, Types='ugj', Debug=False, Compact=False, Session=None ):
+        if not gpfsdev:
+           raise ValueError('NoDevice')
+        self.debug = Debug
+        self.session = Session
         self.gpfsdev = gpfsdev
-        self.fileset = fileset
-        self.snap_name_separator = '_'
-        self.snapshots = {}
-        self.get_node_name()
+        self.types = Types
+        self.table = None
+        if Compact:
+           self.load_table()
 
-        if self.debug == True:
-           print("GPFSDEV: {}   FILESET: {}   DEBUG: {}".format(self.gpfsdev,
-                                                                self.fileset,
-                                                                self.debug))
-        if not self.fileset:
-           if self.debug == True:
-              print( "DEBUG: CMD: /usr/lpp/mmfs/bin/mmlssnapshot {} -Y ".format( self.gpfsdev) )
-           ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlssnapshot {} -Y".format( self.gpfsdev ), self.debug )
-        else:
-           if self.debug == True:
-              print( "DEBUG: CMD: /usr/lpp/mmfs/bin/mmlssnapshot {} -j {} -Y ".format( self.gpfsdev, self.fileset ) )
-           ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlssnapshot {} -j {} -Y".format( self.gpfsdev, self.fileset ) )
 
-        if rc > 0:
-           print("RC: {}".format(rc))
-           print("STDOUT: {}".format(cmd_out))
-           print("STDERR: {}".format(cmd_err))
+    def list_command( self ):
+        """
+        Return the mmrepquota command for this file system.
+        """
+        flags = ' '.join( '-' + flag for flag in self.types )
+        return "/usr/lpp/mmfs/bin/mmrepquota {} {} -Y".format( flags, self.gpfsdev )
 
-        # Process the HEADER line
-        if 'No snapshots in file system' in cmd_out.splitlines()[0]:
-           self.snap_count = 0
-           return
 
-        keys = cmd_out.splitlines()[0].split(':')[6:]
+    def stream( self ):
+        """
+        Run mmrepquota and yield its quota entries as they are read.
+        """
+        stream = CommandStream( self.list_command(), self.debug, self.session )
+        for record in iter_mmrepquota( stream ):
+            yield record
+        if stream.returncode > 0:
+           print("RC: {}".format(stream.returncode))
+           print("STDERR: {}".format(stream.stderr))
 
-        for line in cmd_out.splitlines()[1:]:
-            line.rstrip()
 
-            # Ignore blank lines
-            if not line:
-               continue
+    def __iter__( self ):
+        if self.table is not None:
+           return iter( self.table )
+        return self.stream()
 
-            vals = line.split(':')[6:]
-            sname = vals[1]
-            self.snapshots[sname] = {}
-            for idx in range(len(vals)-1):
-                self.snapshots[sname][keys[idx]] = replace_encoded_strings( vals[idx] )
 
-        snaplist = self.snapshots.keys()
-        self.snaplist = sorted( snaplist )
-        self.snap_count = len( snaplist )
+    def load_table( self ):
+        """
+        Read the report into table, replacing the one already loaded.
+        """
+        table = QuotaTable()
+        for record in self.stream():
+            table.add( record )
+        table.finish()
+        self.table = table
 
 
-    def set_debug( self, Debug ):
+    def entries( self, quotaType=None ):
+        for quota in self:
+            if quotaType is None or quota.get( 'quotaType' ) == quotaType:
+               yield quota
+
+
+    def top( self, n=10, field='blockUsage', quotaType=None ):
         """
-        Set the debugging level for the class. 0 by default.
+        Return the n entries with the largest value of a numeric field, ie: the
+        users using the most space with top( 10, 'blockUsage', 'USR' ).
         """
-        self.debug = Debug
-        if self.debug == True:
-           print("DEBUG: Snapshots: Debugging turned on")
+        if self.table is not None:
+           column = self.table.numbers[field]
+           rows = heapq.nlargest( n, self.table.rows( quotaType ), key=column.__getitem__ )
+           return [ self.table[row] for row in rows ]
+        return heapq.nlargest( n, self.entries( quotaType ), key=lambda quota: quota_number( quota.get( field ) ) )
 
 
-    def toggle_debug( self ):
+    def over_soft_limit( self, kind='block', quotaType=None ):
         """
-        Toggle debugging. If on, shut it off, if off, set it to 1.
+        Return the entries whose block or files usage is over the soft limit.
         """
-        if self.debug == True:
-           print("DEBUG: Snapshots: Turning ssapi debugging off.")
-           self.debug = False
-        else:
-           print("DEBUG: Snapshots: Turning ssapi debugging on.")
-           self.debug = True
+        if self.table is not None:
+           usage = self.table.numbers[kind + 'Usage']
+           quota = self.table.numbers[kind + 'Quota']
+           return [ self.table[row] for row in self.table.rows( quotaType ) if 0 < quota[row] < usage[row] ]
+        return [ entry for entry in self.entries( quotaType )
+                 if 0 < quota_number( entry.get( kind + 'Quota' ) ) < quota_number( entry.get( kind + 'Usage' ) ) ]
 
 
-    def get_node_name( self ):
+    def grace_expiring( self, within, kind='block', quotaType=None ):
         """
-        This routine will extract the current node name from the GPFS configuration file.
+        Return ( seconds left, entry ) for the entries whose block or files grace
+        period ends within the given number of seconds, including the ones that have
+        expired, with the soonest first.
         """
-        f = open('/var/mmfs/gen/mmfsNodeData', 'r')
-        nodecfg = f.read()
-        nodecfg_s = nodecfg.split(':')
-        f.close()
-        self.nodename = nodecfg_s[5]
+        result = []
+        if self.table is not None:
+           grace = self.table.grace[kind]
+           for row in self.table.rows( quotaType ):
+               if 0 <= grace[row] <= within:
+                  result.append( ( grace[row], self.table[row] ) )
+        else:
+           for entry in self.entries( quotaType ):
+               seconds = quota_grace_seconds( entry.get( kind + 'Grace' ) )
+               if seconds is not None and seconds <= within:
+                  result.append( ( seconds, entry ) )
+        return sorted( result, key=lambda pair: pair[0] )
 
 
-    def get_delete_list( self, max_to_keep ):
+    def by_fileset( self, filesystem=None ):
         """
-        Given an integer of how many snapshots you want to keep, this will return a list of snapshot
-        names that are to be purged.  It does not purge them, only a list of what needs to be purged
-        based on how many you want to keep.
+        Return fileset name -> totals for every fileset of the file system.  The
+        totals are the usage and limits of the fileset quota, the number of user and
+        group entries in the fileset and their block usage, joined with the path,
+        status, fstype, maxInodes and allocInodes from Filesystem.filesets.
+
+        filesystem is a Filesystem of this device, one is loaded if none is given.
         """
-        # Slicing is a 0 based operation, plus we are adding a snapshot.
-        max_to_keep = max_to_keep - 1
+        if filesystem is None:
+           filesystem = Filesystem( self.gpfsdev, Lazy=True, Session=self.session )
+
+        totals = {}
+        def fileset_totals( name ):
+            if name not in totals:
+               totals[name] = { 'blockUsage': 0, 'blockQuota': 0, 'blockLimit': 0,
+                                'filesUsage': 0, 'filesQuota': 0, 'filesLimit': 0,
+                                'users': 0, 'groups': 0, 'userBlockUsage': 0, 'groupBlockUsage': 0 }
+            return totals[name]
+
+        for entry in self:
+            quotaType = entry.get( 'quotaType' )
+            if quotaType == 'FILESET':
+               fileset = fileset_totals( entry.get( 'name' ) )
+               for field in ( 'blockUsage', 'blockQuota', 'blockLimit', 'filesUsage', 'filesQuota', 'filesLimit' ):
+                   fileset[field] = quota_number( entry.get( field ) )
+            elif quotaType in ( 'USR', 'GRP' ) and entry.get( 'filesetname' ):
+               fileset = fileset_totals( entry['filesetname'] )
+               if quotaType == 'USR':
+                  fileset['users'] = fileset['users'] + 1
+                  fileset['userBlockUsage'] = fileset['userBlockUsage'] + quota_number( entry.get( 'blockUsage' ) )
+               else:
+                  fileset['groups'] = fileset['groups'] + 1
+                  fileset['groupBlockUsage'] = fileset['groupBlockUsage'] + quota_number( entry.get( 'blockUsage' ) )
+
+        for ( name, record ) in filesystem.filesets.items():
+            fileset = fileset_totals( name )
+            for field in ( 'path', 'status', 'fstype', 'maxInodes', 'allocInodes' ):
+                if field in record:
+                   fileset[field] = record[field]
+        return totals
+
+
+#-------------------------------------------------------------------------------------
+# Policy scans
+#
+# mmapplypolicy can list billions of files.  Filesystem.policy_scan() runs a LIST
+# rule and returns a PolicyList over the list file it writes:
+#
+#    scan = ssapi.Filesystem( 'fs0', Lazy=True ).policy_scan()
+#    totals = scan.aggregate( ( 'FILESET_NAME', 'USER_ID' ), 'KB_ALLOCATED', workers=8 )
+#    totals['FILESET_NAME']['proj1']['total']
+#
+# Each line of a list file is: inode generation snapid [SHOW values] -- path, with
+# the special characters of the path escaped as %XX.  The file is read through mmap
+# a chunk of whole lines at a time, so memory use does not grow with its size, and
+# aggregate() splits it into byte ranges that worker processes read on their own.
+#-------------------------------------------------------------------------------------
 
-        self.dellist = []
-        if self.snap_count <= max_to_keep:
-           return self.dellist
+# The attributes policy_scan() shows by default.
+policy_show_attributes = ( 'FILESET_NAME', 'USER_ID', 'GROUP_ID', 'KB_ALLOCATED', 'FILE_SIZE' )
 
-        if max_to_keep == 0:
-           self.dellist = self.snaplist
-        elif self.snap_count > max_to_keep:
-           self.dellist = list(self.snaplist)[ : -( max_to_keep ) ]
+# The name of the external list, the list file is <prefix>.list.<name>.
+policy_list_name = 'ssapi'
+
+policy_path_separator = b' -- '
+
+def policy_rules( show=policy_show_attributes, where=None, list_name=policy_list_name ):
+    """
+    Return the policy of a LIST rule for every file, or the files the where clause
+    matches, that shows the given attributes.
+    """
+    rules = "RULE EXTERNAL LIST '{0}' EXEC '' ESCAPE '%'\nRULE '{0}_files' LIST '{0}'".format( list_name )
+    if show:
+       rules = rules + " SHOW( {} )".format( " || ' ' || ".join( "VARCHAR({})".format( attribute ) for attribute in show ) )
+    if where:
+       rules = rules + " WHERE {}".format( where )
+    return rules + "\n"
 
-        return self.dellist
 
+def parse_policy_line( line ):
+    """
+    Return the ( inode, generation, snapid, attributes, path ) of a list file line,
+    where attributes is the list of SHOW values.
+    """
+    ( head, separator, path ) = line.partition( policy_path_separator )
+    fields = head.split()
+    return ( int( fields[0] ), int( fields[1] ), int( fields[2] ),
+             [ policy_text( value ) for value in fields[3:] ], decode_policy_path( path ) )
+
+
+def policy_line_start( mm, offset ):
+    """
+    Return the offset of the first line that starts at or after offset.
+    """
+    if offset <= 0:
+       return 0
+    idx = mm.find( b'\n', offset - 1 )
+    return len( mm ) if idx < 0 else idx + 1
+
+
+def iter_policy_chunks( path, start=0, end=None, chunk_bytes=4194304 ):
+    """
+    A generator that reads the lines of a list file that start in the byte range
+    start to end through mmap, and yields them about chunk_bytes at a time as a
+    list of lines without the newline.
+    """
+    import mmap
+
+    f = open( path, 'rb' )
+    try:
+       size = os.fstat( f.fileno() ).st_size
+       if end is None or end > size:
+          end = size
+       if start >= end:
+          return
+
+       mm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+       try:
+          pos = policy_line_start( mm, start )
+          released = pos - pos % mmap.PAGESIZE
+          while pos < end:
+              # Always finish the line the chunk stops in.
+              idx = mm.find( b'\n', min( pos + chunk_bytes, end ) - 1 )
+              stop = size if idx < 0 else idx + 1
+              lines = mm[pos:stop].split( b'\n' )
+              if not lines[-1]:
+                 lines.pop()
+              yield lines
+              pos = stop
+
+              # Unmap the pages that have been read, so they do not stay resident.
+              # madvise is only there on Python 3.8 and later.
+              done = pos - pos % mmap.PAGESIZE
+              if done > released and hasattr( mm, 'madvise' ):
+                 mm.madvise( mmap.MADV_DONTNEED, released, done - released )
+                 released = done
+       finally:
+          mm.close()
+    finally:
+       f.close()
+
+
+def aggregate_policy_range( task ):
+    """
+    Count the lines in one byte range of a list file, and total a SHOW value, for
+    each distinct combination of the group_by SHOW values.  task is ( path, start,
+    end, group_by, value ), where group_by is a list of SHOW value positions and
+    value is the position of the value to total, or None.
+
+    Returns a dictionary of ( group_by values ) -> [ count, total ].  This runs in
+    the PolicyList.aggregate() worker processes.
+    """
+    import operator
+
+    ( path, start, end, group_by, value ) = task
+    columns = [ 3 + position for position in group_by ]
+    if value is not None:
+       columns.append( 3 + value )
+    # Only split off the columns that are used, the rest of the line is left alone.
+    maxsplit = max( columns ) + 1
+    keys = operator.itemgetter( *[ 3 + position for position in group_by ] )
+    single = len( group_by ) == 1
+
+    totals = {}
+    for lines in iter_policy_chunks( path, start, end ):
+        for line in lines:
+            fields = line.split( None, maxsplit )
+            key = keys( fields )
+            if single:
+               key = ( key, )
+            amount = 0 if value is None else int( fields[3 + value] )
+            entry = totals.get( key )
+            if entry is None:
+               totals[key] = [ 1, amount ]
+            else:
+               entry[0] = entry[0] + 1
+               entry[1] = entry[1] + amount
+    return totals
+
+
+class PolicyList:
+    """
+    The list files of a LIST rule, see policy_rules(), whose lines show the given
+    attributes:
+
+        scan = ssapi.PolicyList( '/tmp/scan.list.ssapi', show=( 'FILESET_NAME', 'KB_ALLOCATED' ) )
+        for ( inode, generation, snapid, attributes, path ) in scan:
+            ...
+
+    The files are never read into memory as a whole, see iter_policy_chunks().  If
+    workdir is given, it is a temporary directory that remove() deletes as well.
+    """
+    def __init__( self, paths, show=policy_show_attributes, workdir=None ):
+        if isinstance( paths, string_types ):
+           paths = [ paths ]
+        self.paths = list( paths )
+        self.show = list( show )
+        self.workdir = workdir
 
-    def delsnap( self, snap_name ):
+
+    def batches( self, chunk_bytes=4194304 ):
         """
-        Given a specific snapshot name, this routine will execute mmdelsnapshot and return you the output
-        from the command.  The object already knows if it is a filesystem or a fileset snapshot, so you just
-        need to specify the snapshot name.
+        A generator that yields the records of about chunk_bytes of list file at a
+        time, as lists of ( inode, generation, snapid, attributes, path ).
         """
-        if self.fileset == '':
-           #( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} -N {}".format(self.gpfsdev, snap_name, self.nodename) )
-           ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} ".format( self.gpfsdev, snap_name ) )
-        else:
-           #( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} -j {} -N {}".format(self.gpfsdev, snap_name, self.fileset, self.nodename) )
-           ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmdelsnapshot {} {} -j {} ".format( self.gpfsdev, snap_name, self.fileset ) )
-        return ( rc, cmd_out, cmd_err )
+        for path in self.paths:
+            for lines in iter_policy_chunks( path, chunk_bytes=chunk_bytes ):
+                yield [ parse_policy_line( line ) for line in lines ]
 
 
-    def snap( self ):
-        """
-        This code will create a snapshot of the specified filesystem or fileset.
+    def __iter__( self ):
+        for batch in self.batches():
+            for record in batch:
+                yield record
 
-        NOTE: You can NOT mix filesystem and fileset snapshots on the same GPFS device.
 
-        Filesystem snapshots are named: CCYYMMDD==HHMM for easy sorting / processing.
+    def ranges( self, range_bytes ):
+        """
+        Return the ( path, start, end ) byte ranges of about range_bytes each that
+        cover the list files.
+        """
+        ranges = []
+        for path in self.paths:
+            size = os.path.getsize( path )
+            ranges.extend( ( path, start, min( start + range_bytes, size ) ) for start in range( 0, size, range_bytes ) )
+        return ranges
 
-        Filesystem snapshots are named: <Fileset>==CCYYMMDD==HHMM for easy processing again.
+
+    def aggregate( self, group_by=( 'FILESET_NAME', 'USER_ID' ), value='KB_ALLOCATED', workers=4, range_bytes=67108864 ):
         """
-        if self.fileset == '':
-           snapname = time.strftime("%Y%m%d") + self.snap_name_separator + time.strftime("%H%M")
-           ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmcrsnapshot {0} {1}".format( self.gpfsdev, snapname ) )
-        else:
-           snapname = self.fileset + self.snap_name_separator + time.strftime("%Y%m%d") + self.snap_name_separator + time.strftime("%H%M")
-           ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmcrsnapshot {0} {1} -j {2}".format( self.gpfsdev, snapname, self.fileset ) )
+        Count the files, and total the value attribute, for each distinct value of
+        every group_by attribute.  value can be None to only count the files.
+
+        The list files are split into byte ranges of at most range_bytes, at least
+        four per worker, and read by workers processes at the same time.  With
+        workers=1 they are read in this process.
+
+        The workers keep a count and total for each combination of the group_by
+        values that occurs, ie: for each fileset and user that owns files in it, so
+        their memory use does not depend on the size of the list.
 
-        return ( rc, cmd_out, cmd_err )
+        Returns attribute -> value -> { 'count', 'total' }, ie:
+        totals['USER_ID']['1000']['total'].
+        """
+        if not group_by:
+           raise ValueError( 'NoGroupBy' )
+        for name in list( group_by ) + ( [] if value is None else [ value ] ):
+            if name not in self.show:
+               raise ValueError( 'UnknownAttribute: {}'.format( name ) )
+        positions = [ self.show.index( name ) for name in group_by ]
+        position = None if value is None else self.show.index( value )
+
+        size = sum( os.path.getsize( path ) for path in self.paths )
+        range_bytes = min( range_bytes, max( size // ( max( workers, 1 ) * 4 ), 1048576 ) )
+        tasks = [ ( path, start, end, positions, position ) for ( path, start, end ) in self.ranges( range_bytes ) ]
+
+        totals = dict( ( name, {} ) for name in group_by )
+
+        def merge( result ):
+            for ( keys, ( count, total ) ) in result.items():
+                for ( name, key ) in zip( group_by, keys ):
+                    entry = totals[name].setdefault( policy_text( key ), { 'count': 0, 'total': 0 } )
+                    entry['count'] = entry['count'] + count
+                    entry['total'] = entry['total'] + total
+
+        if workers <= 1 or len( tasks ) <= 1:
+           for task in tasks:
+               merge( aggregate_policy_range( task ) )
+           return totals
+
+        import multiprocessing
+        pool = multiprocessing.Pool( min( workers, len( tasks ) ) )
+        try:
+           for result in pool.imap_unordered( aggregate_policy_range, tasks ):
+               merge( result )
+        finally:
+           pool.terminate()
+           pool.join()
+        return totals
+
+
+    def remove( self ):
+        """
+        Delete the list files, and the temporary directory they are in.
+        """
+        for path in self.paths:
+            try:
+               os.unlink( path )
+            except OSError:
+               pass
+        if self.workdir is not None:
+           import shutil
+           shutil.rmtree( self.workdir, True )
+           self.workdir = None
 
 
 class Filesystem:
     """
     This class will collect the information about the specified GPFS device.
+
+    By default the mmlsfs, mmlsfileset and mmlspool commands are started at the
+    same time and each one is parsed as it finishes.  Pass Concurrent=False to
+    run them one after another.
+
+    If you pass Lazy=True, filesys, filesets and pools are each fetched the first
+    time they are accessed, so f['disks'] only runs mmlsfs.  Use refresh() to
+    fetch them again.
+
+    refresh() updates the structures already loaded in place and returns the
+    change set of each group, ie: f.refresh('filesets')['filesets']['added'].
+    Callbacks added with subscribe() get every change.
+
+    If you pass Compact=True, filesets is a RecordTable that uses much less memory
+    with large numbers of filesets, and the numeric fields like inodeSpace,
+    maxInodes and allocInodes are integers.
+
+    The fileset indexes are built the first time one of them is used, and rebuilt
+    after the filesets are fetched again:
+
+    junctions = A tree of junction path components, see fileset_for_path()
+    filesets_by_id[id] = The fileset name with that fileset id
+    filesets_by_inode_space[inodeSpace] = The fileset names in that inode space
+    filesets_by_parent[parentId] = The fileset names whose parent has that fileset id
+
+    If you pass Session=, the command results are shared with the other objects
+    of that Session.
     """
+    session = None
+
+    # Attributes that are loaded on first access in lazy mode, and the method that loads them.
+    lazy_attributes = OrderedDict( [ ( 'filesys', 'get_filesystem_information' ),
+                                     ( 'filesets', 'get_fileset_information' ),
+                                     ( 'pools', 'get_pool_information' ),
+                                   ] )
+
+    # Attributes built by build_fileset_indexes() on first access.
+    index_attributes = ( 'junctions', 'filesets_by_id', 'filesets_by_inode_space', 'filesets_by_parent' )
 
     filesystem_defaults = { 'automaticMountOption': 'yes',
                             'defaultMetadataReplicas': '1',
@@ -574,14 +4245,66 @@ class Filesystem:
                           }
 
 
-    def __init__( self, gpfsdev ):
+    def __init__( self, gpfsdev, Concurrent=True, Lazy=False, Compact=False, Session=None ):
         if not gpfsdev:
            raise ValueError('NoDevice')
         else:
            self.gpfsdev = gpfsdev
-           self.get_filesystem_information()
-           self.get_fileset_information()
-           self.get_pool_information()
+           self.session = Session
+           self.concurrent = Concurrent
+           self.compact = Compact
+           if not Lazy:
+              self.refresh( *self.lazy_attributes.keys() )
+
+
+    def __getattr__( self, name ):
+        if name in self.index_attributes:
+           self.build_fileset_indexes()
+           return self.__dict__[name]
+        return load_lazy_attribute( self, name )
+
+
+    def refresh( self, *groups ):
+        """
+        Fetch the given data groups again, ie: refresh('filesets').  With no arguments,
+        every group that has already been loaded is fetched again.
+
+        Returns a dictionary of group -> change set for the groups that were
+        already loaded.
+        """
+        self.changes = {}
+        loaders = [ getattr( self, loader ) for loader in lazy_loaders( self, groups ) ]
+        if self.concurrent and len( loaders ) > 1:
+           run_concurrently( *loaders )
+        else:
+           for loader in loaders:
+               loader()
+        return self.changes
+
+
+    def subscribe( self, callback ):
+        """
+        Call callback( filesystem, group, changes ) when refresh() finds a change
+        in filesys, filesets or pools.
+        """
+        subscribe( self, callback )
+
+
+    def unsubscribe( self, callback ):
+        unsubscribe( self, callback )
+
+
+    def merge_group( self, group, new ):
+        """
+        Merge newly fetched data into a group that is already loaded, save its change
+        set and notify the subscribers.  Returns the merged data.
+        """
+        if group not in self.__dict__:
+           return new
+        ( merged, changes ) = merge_records( self.__dict__[group], new )
+        self.__dict__.setdefault( 'changes', {} )[group] = changes
+        notify_subscribers( self, group, changes )
+        return merged
 
 
     def print_keys( self ):
@@ -590,26 +4313,19 @@ class Filesystem:
 
 
     def get_pool_information( self ):
-        self.pools = StoragePool( self.gpfsdev )
+        if 'pools' not in self.__dict__:
+           self.pools = StoragePool( self.gpfsdev, Session=self.session )
+           return
+        changes = self.pools.refresh()
+        self.__dict__.setdefault( 'changes', {} )['pools'] = changes
+        notify_subscribers( self, 'pools', changes )
 
 
     def get_filesystem_information( self ):
-        self.filesys = {}
-        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlsfs {0} -Y".format(self.gpfsdev) )
-        for line in cmd_out.splitlines():
-            line.rstrip()
-
-            # Ignore blank lines
-            if not line:
-               continue
-
-            # Ignore HEADER line
-            if 'HEADER' in line:
-               continue
-
-            key = line.split(':')[7]
-            value = line.split(':')[8]
-            self.filesys[key] = replace_encoded_strings( value )
+        stream = CommandStream( "/usr/lpp/mmfs/bin/mmlsfs {0} -Y".format(self.gpfsdev), Session=self.session )
+        filesys = parse_mmlsfs( stream )
+        check_command_result( stream.commandString, stream.returncode, stream.stderr )
+        self.filesys = self.merge_group( 'filesys', filesys )
 
 
     def fileset_list( self ):
@@ -627,36 +4343,299 @@ class Filesystem:
 
 
     def get_fileset_information( self ):
-        self.filesets = {}
-        ( rc, cmd_out, cmd_err ) = execute_command( "/usr/lpp/mmfs/bin/mmlsfileset {0} -Y".format(self.gpfsdev) )
+        stream = CommandStream( "/usr/lpp/mmfs/bin/mmlsfileset {0} -Y".format(self.gpfsdev), Session=self.session )
+        filesets = parse_mmlsfileset( stream, self.compact )
+        check_command_result( stream.commandString, stream.returncode, stream.stderr )
+        loaded = 'filesets' in self.__dict__
+        self.filesets = self.merge_group( 'filesets', filesets )
+        if not loaded or has_changes( self.changes['filesets'] ):
+           self.drop_fileset_indexes()
+
+
+    def build_fileset_indexes( self ):
+        """
+        Build the junction path tree and the fileset id, inode space and parent id
+        maps from the filesets.
+        """
+        junctions = {}
+        by_id = {}
+        by_inode_space = {}
+        by_parent = {}
+
+        for ( fname, fileset ) in self.filesets.items():
+            by_id[fileset['id']] = fname
+            by_inode_space.setdefault( fileset['inodeSpace'], [] ).append( fname )
+            by_parent.setdefault( fileset['parentId'], [] ).append( fname )
+
+            # Unlinked filesets do not have a junction
+            path = fileset['path']
+            if not path.startswith('/'):
+               continue
+
+            node = junctions
+            for component in path.split('/'):
+                if component:
+                   node = node.setdefault( component, {} )
+            node[None] = fname
 
-        # Process the HEADER line
-        keys = cmd_out.splitlines()[0].split(':')[7:]
+        self.junctions = junctions
+        self.filesets_by_id = by_id
+        self.filesets_by_inode_space = by_inode_space
+        self.filesets_by_parent = by_parent
 
-        for line in cmd_out.splitlines()[1:]:
-            line.rstrip()
 
-            # Ignore blank lines
-            if not line:
+    def drop_fileset_indexes( self ):
+        """
+        Throw away the fileset indexes, they are built again when next used.
+        """
+        for name in self.index_attributes:
+            self.__dict__.pop( name, None )
+
+
+    def fileset_for_path( self, path ):
+        """
+        Return the name of the fileset that owns the given absolute path, which is
+        the fileset with the longest junction path that the path is in.  Returns
+        None if the path is not under any linked fileset.
+        """
+        node = self.junctions
+        owner = node.get( None )
+        for component in path.split('/'):
+            if not component:
                continue
+            node = node.get( component )
+            if node is None:
+               break
+            owner = node.get( None, owner )
+        return owner
 
-            vals = line.split(':')[7:]
-            fname = vals[0]
-            self.filesets[fname] = {}
-            for idx in range(len(vals)-1):
-                self.filesets[fname][keys[idx]] = replace_encoded_strings( vals[idx] )
-
-            # Set the fileset type. independent inode or dependent inode
-            if self.filesets[fname]['filesetName'] == 'root' and self.filesets[fname]['inodeSpace'] == '0':
-               self.filesets[fname]['fstype'] = 'Independent'
-            elif self.filesets[fname]['inodeSpace'] >= '1':
-               self.filesets[fname]['fstype'] = 'Independent'
-            elif self.filesets[fname]['inodeSpace'] == '0':
-               self.filesets[fname]['fstype'] = 'Dependent'
-            else:
-               self.filesets[fname]['fstype'] = 'Unknown'
 
+    def resolve_paths( self, paths ):
+        """
+        This is a generator that yields ( path, fileset name ) for every path in the
+        given iterable, see fileset_for_path().  Lines read from a file can be passed
+        directly, the trailing newline is removed.
+        """
+        fileset_for_path = self.fileset_for_path
+        for path in paths:
+            path = path.rstrip('\n')
+            yield ( path, fileset_for_path( path ) )
+
+
+
+
+    def rotate_snapshots( self, max_to_keep, filesets=None, max_workers=4, retries=5, backoff=1.0, DryRun=False ):
+        """
+        Take a new snapshot of every independent inode fileset, or of the given filesets,
+        and purge the oldest snapshots of each one so that max_to_keep are left.
+
+        All of the existing snapshots are fetched with one mmlssnapshot of the whole device
+        and split up by fileset.  The snapshots are created, then purged, with at most
+        max_workers mm commands at a time, and commands that fail because the cluster is
+        busy are retried.  The old snapshots of a fileset are only purged if its new
+        snapshot was created.  With DryRun=True nothing is created or deleted.
+
+        Returns a dictionary of fileset -> { 'snapshot', 'create', 'delete' }, where
+        snapshot is the new snapshot name, create is the { 'rc', 'stdout', 'stderr',
+        'attempts' } result of mmcrsnapshot and delete is a dictionary of snapshot name ->
+        result of mmdelsnapshot.  In a dry run the results are None.
+        """
+        if filesets is None:
+           filesets = [ fname for fname in self.filesets if self.independent_inode_fileset( fname ) ]
+
+        snaps = Snapshots( self.gpfsdev, '', Compact=self.compact, Session=self.session )
+        existing = snaps.fileset_snapshots()
 
+        report = {}
+        for fname in filesets:
+            dellist = snapshot_delete_list( existing.get( fname, [] ), max_to_keep )
+            report[fname] = { 'snapshot': snaps.snapshot_name( fname ),
+                              'create': None,
+                              'delete': dict( ( sname, None ) for sname in dellist ),
+                            }
+
+        if DryRun:
+           return report
+
+        def create( fname ):
+            return execute_with_retry( snaps.create_command( report[fname]['snapshot'], fname ), retries, backoff, Session=self.session )
+
+        dellist = []
+        for ( fname, result, error ) in run_bounded( create, filesets, max_workers ):
+            if error is not None:
+               result = ( None, None, str( error ), 1 )
+            ( rc, cmd_out, cmd_err, attempts ) = result
+            report[fname]['create'] = { 'rc': rc, 'stdout': cmd_out, 'stderr': cmd_err, 'attempts': attempts }
+            if rc == 0:
+               dellist.extend( ( fname, sname ) for sname in report[fname]['delete'] )
+
+        results = snaps.delete_snapshots( dellist, max_workers, retries, backoff, Refresh=False )
+        for ( ( fname, sname ), result ) in results.items():
+            report[fname]['delete'][sname] = result
+
+        return report
+
+
+    def fileset_create_command( self, spec ):
+        """
+        Return the mmcrfileset command for a fileset spec, see provision_filesets().
+        """
+        command = "/usr/lpp/mmfs/bin/mmcrfileset {} {}".format( self.gpfsdev, shell_quote( spec['name'] ) )
+        if spec.get( 'comment' ):
+           command = command + " -t {}".format( shell_quote( spec['comment'] ) )
+        if spec.get( 'inode_space' ):
+           command = command + " --inode-space {}".format( shell_quote( spec['inode_space'] ) )
+           if spec['inode_space'] == 'new' and spec.get( 'inode_limit' ):
+              command = command + " --inode-limit {}".format( spec['inode_limit'] )
+        return command
+
+
+    def fileset_link_command( self, spec ):
+        return "/usr/lpp/mmfs/bin/mmlinkfileset {} {} -J {}".format( self.gpfsdev, shell_quote( spec['name'] ),
+                                                                   shell_quote( spec['junction'] ) )
+
+
+    def fileset_quota_command( self, spec ):
+        command = "/usr/lpp/mmfs/bin/mmsetquota {}:{}".format( self.gpfsdev, shell_quote( spec['name'] ) )
+        if spec.get( 'block' ):
+           command = command + " --block {}".format( spec['block'] )
+        if spec.get( 'files' ):
+           command = command + " --files {}".format( spec['files'] )
+        return command
+
+
+    def provision_steps( self, spec ):
+        """
+        Return the ( step, command ) list that provisions a fileset spec.
+        """
+        steps = [ ( 'create', self.fileset_create_command( spec ) ) ]
+        if spec.get( 'junction' ):
+           steps.append( ( 'link', self.fileset_link_command( spec ) ) )
+        if spec.get( 'block' ) or spec.get( 'files' ):
+           steps.append( ( 'quota', self.fileset_quota_command( spec ) ) )
+        return steps
+
+
+    def provision_filesets( self, specs, max_workers=4, retries=5, backoff=1.0, DryRun=False ):
+        """
+        Create a batch of filesets, link them and set their quotas.  Each spec is a
+        dictionary with:
+
+            name        - The fileset name, the only required key
+            comment     - The fileset comment
+            inode_space - 'new' for an independent fileset, or the fileset whose
+                          inode space it shares
+            inode_limit - MaxNumInodes[:NumInodesToPreallocate] of a new inode space
+            junction    - Where to link the fileset, it is not linked without one
+            block       - The block quota, Soft:Hard, ie: '10T:12T'
+            files       - The files quota, Soft:Hard, ie: '1M:1200000'
+
+        At most max_workers filesets are provisioned at a time.  Each one runs
+        mmcrfileset, then mmlinkfileset and mmsetquota if it needs them, and stops at
+        the first step that fails.  A step that fails because the cluster is busy is
+        retried, see execute_with_retry().  A fileset whose junction is inside the
+        junction of another fileset in the batch is started after that one is done.
+
+        filesets is fetched once at the end, with a single mmlsfileset.
+
+        Returns an OrderedDict, in spec order, of name -> { 'commands', 'create',
+        'link', 'quota', 'ok' }.  Each step is the { 'rc', 'stdout', 'stderr',
+        'attempts' } result of its command, or None if it was not run.  ok is True if
+        every step succeeded and mmlsfileset lists the fileset at its junction.  With
+        DryRun=True nothing is run and only commands is filled in.
+        """
+        report = OrderedDict()
+        for spec in specs:
+            if spec['name'] in report:
+               raise ValueError( 'DuplicateFileset: {}'.format( spec['name'] ) )
+            report[spec['name']] = { 'commands': [ command for ( step, command ) in self.provision_steps( spec ) ],
+                                     'create': None, 'link': None, 'quota': None, 'ok': False }
+
+        if DryRun:
+           return report
+
+        def provision( spec ):
+            entry = report[spec['name']]
+            for ( step, command ) in self.provision_steps( spec ):
+                try:
+                   ( rc, cmd_out, cmd_err, attempts ) = execute_with_retry( command, retries, backoff, Session=self.session )
+                except Exception as error:
+                   ( rc, cmd_out, cmd_err, attempts ) = ( None, None, str( error ), 1 )
+                entry[step] = { 'rc': rc, 'stdout': cmd_out, 'stderr': cmd_err, 'attempts': attempts }
+                if rc != 0:
+                   return
+
+        # Link the filesets level by level, so a junction's parent directory exists.
+        junctions = [ spec['junction'].rstrip( '/' ) for spec in specs if spec.get( 'junction' ) ]
+        levels = {}
+        for spec in specs:
+            junction = ( spec.get( 'junction' ) or '' ).rstrip( '/' )
+            level = len( [ path for path in junctions if junction.startswith( path + '/' ) ] )
+            levels.setdefault( level, [] ).append( spec )
+
+        for level in sorted( levels ):
+            list( run_bounded( provision, levels[level], max_workers ) )
+
+        if not [ entry for entry in report.values() if entry['create'] is not None and entry['create']['rc'] == 0 ]:
+           return report
+
+        self.refresh( 'filesets' )
+        for spec in specs:
+            entry = report[spec['name']]
+            steps = [ entry[step] for step in ( 'create', 'link', 'quota' ) if entry[step] is not None ]
+            if len( steps ) < len( entry['commands'] ) or [ step for step in steps if step['rc'] != 0 ]:
+               continue
+            fileset = self.filesets.get( spec['name'] )
+            if fileset is None:
+               continue
+            if spec.get( 'junction' ) and fileset['path'].rstrip( '/' ) != spec['junction'].rstrip( '/' ):
+               continue
+            entry['ok'] = True
+
+        return report
+
+
+    def policy_scan( self, show=policy_show_attributes, where=None, directory=None, nodes=None, workdir=None ):
+        """
+        Run mmapplypolicy with a LIST rule, see policy_rules(), over the file system
+        or the given directory in it, and return a PolicyList of the list file.
+
+        The policy and the list file are written to workdir, or a new temporary
+        directory, which PolicyList.remove() deletes with the list.  If nodes are
+        given the scan is run on them, and workdir has to be a directory they all
+        share.
+
+        Raises ValueError('PolicyFailed: ...') if mmapplypolicy fails.
+        """
+        import tempfile
+
+        temporary = None
+        if workdir is None:
+           workdir = temporary = tempfile.mkdtemp( prefix='ssapi-policy-' )
+        policy_file = os.path.join( workdir, '{}.policy'.format( policy_list_name ) )
+        f = open( policy_file, 'w' )
+        try:
+           f.write( policy_rules( show, where ) )
+        finally:
+           f.close()
+
+        prefix = os.path.join( workdir, policy_list_name )
+        command = "/usr/lpp/mmfs/bin/mmapplypolicy {} -P {} -I defer -f {}".format( shell_quote( directory or self.gpfsdev ),
+                                                                                    shell_quote( policy_file ), shell_quote( prefix ) )
+        if nodes:
+           if not isinstance( nodes, string_types ):
+              nodes = ','.join( nodes )
+           command = command + " -N {} -g {}".format( shell_quote( nodes ), shell_quote( workdir ) )
+
+        ( rc, cmd_out, cmd_err ) = execute_command( command, Session=self.session )
+
+        # mmapplypolicy does not write a list file when no file matched.
+        list_file = '{}.list.{}'.format( prefix, policy_list_name )
+        scan = PolicyList( [ list_file ] if os.path.exists( list_file ) else [], show, temporary )
+        if rc != 0:
+           scan.remove()
+           raise ValueError( 'PolicyFailed: {}'.format( ( cmd_err or cmd_out or '' ).strip() ) )
+        return scan
 
 
     @classmethod
@@ -683,10 +4662,10 @@ class Filesystem:
 
 if __name__ == '__main__':
    #
-   # This is just where I do my testing of stuff.
+   # Run the command line tool, see ssapi_cli.
    #
-
-   sys.exit(0)
+   from ssapi_cli import main
+   sys.exit( main() )
 
    #snap = Snapshots( 'condo', 'root' )
 
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+#=====================================================================================
+# asyncio counterparts to the ssapi classes.
+#
+# The mm commands are run as asyncio subprocesses, and commands that do not depend
+# on each other are run at the same time with gather.  The output is parsed with
+# the same parsers ssapi uses, so both APIs return identical structures.
+#
+# refresh(), delete_snapshots(), rotate_snapshots() and provision_filesets() are
+# coroutines here too.  They run the ssapi versions on the default executor, so the
+# event loop is not blocked while their commands run.
+#
+# This module needs Python 3.7 or later.  ssapi itself still runs on Python 2.7.
+#
+#    >>> import asyncio, ssapi_async
+#    >>> f = asyncio.run( ssapi_async.Filesystem.load( 'fs0' ) )
+#    >>> print( f['disks'] )
+#
+#=====================================================================================
+
+
+import asyncio
+import functools
+import locale
+import shlex
+from asyncio.subprocess import PIPE
+
+import ssapi
+
+
+async def execute_command( commandString=None, Debug=False ):
+    """
+    This routine will execute a command without blocking the event loop and return
+    its output.  It returns the same values as ssapi.execute_command, and uses the
+    ssapi command cache when it is enabled.
+    """
+    if not commandString:
+       return( 99999999, None, None )
+
+    shellCommand = shlex.split( commandString )
+    start = ssapi.hook_command_start( commandString, Debug )
+
+    result = ssapi.cached_result( shellCommand )
+    if result is not None:
+       if Debug:
+          print("DEBUG: Command (cached): {}".format(commandString))
+       ssapi.hook_command_end( commandString, start, result[0], len( result[1] or '' ), len( result[2] or '' ), cached=True, Debug=Debug )
+       return result
+
+    if isinstance( ssapi.command_backend, ssapi.SubprocessBackend ) and ssapi.command_scheduler is None:
+       subp = await asyncio.create_subprocess_exec( *shellCommand, stdout=PIPE, stderr=PIPE )
+       ( outdata, errdata ) = await subp.communicate()
+
+       encoding = locale.getpreferredencoding( False )
+       outdata = outdata.decode( encoding ).replace( '\r\n', '\n' )
+       errdata = errdata.decode( encoding ).replace( '\r\n', '\n' )
+       result = ( subp.returncode, outdata, errdata )
+    else:
+       # Other backends are not asyncio aware, and the command scheduler blocks while
+       # a command waits, so run them on the default executor.
+       loop = asyncio.get_running_loop()
+       result = await loop.run_in_executor( None, ssapi.run_command, shellCommand )
+
+    ssapi.hook_command_end( commandString, start, result[0], len( result[1] ), len( result[2] ), Debug=Debug )
+
+    if Debug:
+       print("DEBUG: Command: {}".format(commandString))
+       print("DEBUG: Return Code: {}".format(result[0]))
+       print("DEBUG: STDOUT: {}".format(result[1]))
+       print("DEBUG: STDERR: {}".format(result[2]))
+
+    ssapi.cache_result( shellCommand, result )
+    return result
+
+
+async def run_blocking( function, *args, **kwargs ):
+    """
+    Run a synchronous ssapi method on the default executor and return its result,
+    without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor( None, functools.partial( function, *args, **kwargs ) )
+
+
+class Nsds( ssapi.Nsds ):
+    """
+    ssapi.Nsds, built with: nsds = await Nsds.load()
+    """
+    @classmethod
+    async def load( cls, Debug=False ):
+        self = cls.__new__( cls )
+        self.set_debug( Debug )
+        await self.collect_nsd_info_async()
+        return self
+
+
+    async def collect_nsd_info_async( self ):
+        ( rc, cmd_out, cmd_err ) = await execute_command( "/usr/lpp/mmfs/bin/mmlsnsd" )
+        ( self.nsds, self.gpfsdevs ) = ssapi.parse_mmlsnsd( cmd_out )
+
+
+class Cluster( ssapi.Cluster ):
+    """
+    ssapi.Cluster, built with: cluster = await Cluster.load()
+
+    mmlscluster, mmlsmgr and mmlsnsd are run at the same time.
+    """
+    @classmethod
+    async def load( cls, Debug=False ):
+        self = cls.__new__( cls )
+        self.set_debug( Debug )
+        self.get_node_name()
+
+        ( cluster, manager, nsds ) = await asyncio.gather( execute_command( "/usr/lpp/mmfs/bin/mmlscluster" ),
+                                                           execute_command( "/usr/lpp/mmfs/bin/mmlsmgr -c" ),
+                                                           Nsds.load( Debug=self.debug ) )
+        self.cluster_info = ssapi.parse_mmlscluster( cluster[1] )
+        self.cluster_manager = ssapi.parse_mmlsmgr( manager[1] )
+        self.is_cluster_manager = self.nodename in self.cluster_manager['node']
+        self.nsds = nsds
+        self.gpfsdevs = self.nsds.return_gpfs_devices()
+        return self
+
+
+    async def refresh( self, *groups ):
+        return await run_blocking( ssapi.Cluster.refresh, self, *groups )
+
+
+    async def load_filesystems( self, devices=None, max_workers=8 ):
+        """
+        The async version of ssapi.Cluster.load_filesystems().  At most max_workers
+        file systems are loaded at the same time.
+        """
+        if devices is None:
+           devices = self.gpfsdevs
+
+        limit = asyncio.Semaphore( max( max_workers, 1 ) )
+
+        async def load( device ):
+            async with limit:
+                return await Filesystem.load( device )
+
+        results = await asyncio.gather( *[ load( device ) for device in devices ], return_exceptions=True )
+
+        filesystems = {}
+        self.filesystem_errors = {}
+        for ( device, result ) in zip( devices, results ):
+            if isinstance( result, Exception ):
+               self.filesystem_errors[device] = result
+            else:
+               filesystems[device] = result
+        return filesystems
+
+
+class StoragePool( ssapi.StoragePool ):
+    """
+    ssapi.StoragePool, built with: pools = await StoragePool.load( gpfsdev )
+    """
+    @classmethod
+    async def load( cls, gpfsdev ):
+        self = cls.__new__( cls )
+        self.gpfsdev = gpfsdev
+        commandString = "/usr/lpp/mmfs/bin/mmlspool {}".format( self.gpfsdev )
+        ( rc, cmd_out, cmd_err ) = await execute_command( commandString )
+        ssapi.check_command_result( commandString, rc, cmd_err )
+        self.pools = ssapi.parse_mmlspool( cmd_out )
+        self.pool_list = self.pools.keys()
+        return self
+
+
+    async def refresh( self ):
+        return await run_blocking( ssapi.StoragePool.refresh, self )
+
+
+class Snapshots( ssapi.Snapshots ):
+    """
+    ssapi.Snapshots, built with: snaps = await Snapshots.load( gpfsdev, fileset )
+
+    snap(), delsnap(), refresh() and delete_snapshots() are coroutines here.
+    """
+    @classmethod
+    async def load( cls, gpfsdev, fileset, Debug=False, Compact=False ):
+        self = cls.__new__( cls )
+        self.set_debug( Debug )
+        self.gpfsdev = gpfsdev
+        self.fileset = fileset
+        self.compact = Compact
+        self.snap_name_separator = '_'
+        self.snapshots = {}
+        self.get_node_name()
+        await self.get_snapshot_information_async()
+        return self
+
+
+    async def get_snapshot_information_async( self ):
+        ( rc, cmd_out, cmd_err ) = await execute_command( self.list_command(), self.debug )
+        self.check_list_output( rc, cmd_out, cmd_err )
+        self.set_snapshots( ssapi.parse_mmlssnapshot( cmd_out, self.compact ) )
+
+
+    async def delsnap( self, snap_name, fileset=None ):
+        return await execute_command( self.delete_command( snap_name, fileset ) )
+
+
+    async def snap( self ):
+        return await execute_command( self.create_command( self.snapshot_name() ) )
+
+
+    async def refresh( self ):
+        return await run_blocking( ssapi.Snapshots.refresh, self )
+
+
+    async def delete_snapshots( self, dellist, max_workers=4, retries=5, backoff=1.0, Refresh=True ):
+        return await run_blocking( ssapi.Snapshots.delete_snapshots, self, dellist, max_workers, retries, backoff, Refresh )
+
+
+class Filesystem( ssapi.Filesystem ):
+    """
+    ssapi.Filesystem, built with: f = await Filesystem.load( gpfsdev )
+
+    mmlsfs, mmlsfileset and mmlspool are run at the same time.  refresh(),
+    rotate_snapshots() and provision_filesets() are coroutines here.
+    """
+    @classmethod
+    async def load( cls, gpfsdev, Compact=False ):
+        if not gpfsdev:
+           raise ValueError('NoDevice')
+
+        self = cls.__new__( cls )
+        self.gpfsdev = gpfsdev
+        self.concurrent = True
+        self.compact = Compact
+
+        commands = [ "/usr/lpp/mmfs/bin/mmlsfs {0} -Y".format( self.gpfsdev ),
+                     "/usr/lpp/mmfs/bin/mmlsfileset {0} -Y".format( self.gpfsdev ) ]
+        ( filesys, filesets, pools ) = await asyncio.gather( execute_command( commands[0] ),
+                                                             execute_command( commands[1] ),
+                                                             StoragePool.load( self.gpfsdev ) )
+        for ( commandString, result ) in zip( commands, ( filesys, filesets ) ):
+            ssapi.check_command_result( commandString, result[0], result[2] )
+        self.filesys = ssapi.parse_mmlsfs( filesys[1] )
+        self.filesets = ssapi.parse_mmlsfileset( filesets[1], self.compact )
+        self.pools = pools
+        return self
+
+
+    async def refresh( self, *groups ):
+        return await run_blocking( ssapi.Filesystem.refresh, self, *groups )
+
+
+    async def rotate_snapshots( self, max_to_keep, filesets=None, max_workers=4, retries=5, backoff=1.0, DryRun=False ):
+        return await run_blocking( ssapi.Filesystem.rotate_snapshots, self, max_to_keep, filesets, max_workers, retries, backoff, DryRun )
+
+
+    async def provision_filesets( self, specs, max_workers=4, retries=5, backoff=1.0, DryRun=False ):
+        return await run_blocking( ssapi.Filesystem.provision_filesets, self, specs, max_workers, retries, backoff, DryRun )
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+#=====================================================================================
+# Parser benchmarks for ssapi.
+#
+# This runs the ssapi classes against synthetic mm command output, so the parsers
+# can be measured off-cluster and tracked between releases.  The SyntheticBackend
+# scales mmlsfileset, mmlssnapshot, mmlsnsd, mmlscluster and mmlspool output to
+# any number of rows.
+#
+#    python ssapi_bench.py                          # 1000, 10000 and 100000 rows
+#    python ssapi_bench.py --sizes 1000 250000 --json results.json
+#    python ssapi_bench.py --startup                # the ssapi command startup time
+#    python ssapi_bench.py --remote 2000            # run_on_nodes over tests/fake_rsh.py
+#
+# Peak memory is measured with tracemalloc, so it is only reported on Python 3.
+#
+#=====================================================================================
+
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+
+import ssapi
+
+try:
+   import tracemalloc
+except ImportError:
+   tracemalloc = None
+
+
+fileset_fields = [ 'filesystemName', 'filesetName', 'id', 'rootInode', 'status', 'path', 'parentId',
+                   'created', 'inodes', 'dataInKB', 'comment', 'filesetMode', 'afmTarget', 'afmState',
+                   'afmMode', 'afmFileLookupRefreshInterval', 'afmFileOpenRefreshInterval',
+                   'afmDirLookupRefreshInterval', 'afmDirOpenRefreshInterval', 'afmAsyncDelay',
+                   'afmNeedsRecovery', 'afmExpirationTimeout', 'afmRPO', 'afmLastPSnapId', 'inodeSpace',
+                   'isInodeSpaceOwner', 'maxInodes', 'allocInodes', 'inodeSpaceMask', 'afmShowHomeSnapshots',
+                   'afmNumReadThreads', 'reserved', 'afmReadBufferSize', 'afmWriteBufferSize',
+                   'afmReadSparseThreshold', 'afmParallelReadChunkSize', 'afmParallelReadThreshold', 'snapId',
+                   'afmNumFlushThreads', 'afmPrefetchThreshold', 'afmEnableAutoEviction', 'permChangeFlag',
+                   'afmParallelWriteThreshold', 'freeInodes', 'afmNeedsResync', 'afmParallelWriteChunkSize',
+                   'afmNumWriteThreads', 'afmPrimID', 'afmDRState', 'afmAssociatedPrimaryId', 'afmDIO',
+                   'afmGatewayNode', 'afmIOFlags', 'afmVerbose', 'afmReadFlags' ]
+
+filesystem_fields = [ ( 'minFragmentSize', '8192' ), ( 'inodeSize', '4096' ), ( 'indirectBlockSize', '32768' ),
+                      ( 'defaultMetadataReplicas', '2' ), ( 'maxMetadataReplicas', '2' ),
+                      ( 'defaultDataReplicas', '1' ), ( 'maxDataReplicas', '2' ),
+                      ( 'blockAllocationType', 'scatter' ), ( 'fileLockingSemantics', 'nfs4' ),
+                      ( 'ACLSemantics', 'all' ), ( 'numNodes', '1024' ), ( 'blockSize', '4194304' ),
+                      ( 'quotasAccountingEnabled', 'user;group;fileset' ), ( 'defaultQuotasEnabled', 'none' ),
+                      ( 'filesystemVersion', '19.01 (5.0.2.0)' ), ( 'automaticMountOption', 'yes' ),
+                      ( 'defaultMountPoint', '%2Fgpfs%2Ffs0' ) ]
+
+
+class SyntheticBackend( ssapi.CommandBackend ):
+    """
+    A command backend that generates mm command output of the given sizes.  Each
+    output is generated once and then served from memory, so the benchmarks only
+    measure the parsing.
+    """
+    def __init__( self, filesets=1000, snapshots=1000, nsds=100, nodes=100, pools=4, filesystems=4, quotas=1000, policy=1000 ):
+        self.sizes = { 'filesets': filesets, 'snapshots': snapshots, 'nsds': nsds, 'nodes': nodes, 'pools': pools,
+                       'filesystems': filesystems, 'quotas': quotas, 'policy': policy }
+        self.outputs = {}
+        self.lock = threading.Lock()
+        self.policy_file = None
+
+
+    def close( self ):
+        """
+        Delete the generated policy list file.
+        """
+        if self.policy_file is not None:
+           os.unlink( self.policy_file )
+           self.policy_file = None
+
+
+    def run( self, shellCommand ):
+        key = tuple( shellCommand )
+        with self.lock:
+           if key not in self.outputs:
+              self.outputs[key] = self.generate( shellCommand )
+           return self.outputs[key]
+
+
+    def read_file( self, path ):
+        if path.endswith( 'mmfsNodeData' ):
+           return "%%home%%:20_MEMBER_NODE::1:1:node1:10.0.0.1:node1:manager::::::node1:node1:\n"
+        return ssapi.CommandBackend.read_file( self, path )
+
+
+    def generate( self, shellCommand ):
+        command = shellCommand[0].split('/')[-1]
+        args = shellCommand[1:]
+        generator = getattr( self, command, None )
+        if generator is None:
+           return ( 1, '', 'SyntheticBackend: {} is not supported\n'.format( command ) )
+        return ( 0, '\n'.join( generator( args ) ) + '\n', '' )
+
+
+    def mmlscluster( self, args ):
+        yield ''
+        yield 'GPFS cluster information'
+        yield '========================'
+        yield '  GPFS cluster name:         bench.cluster'
+        yield '  GPFS cluster id:           1234567890123456789'
+        yield '  GPFS UID domain:           bench.cluster'
+        yield '  Remote shell command:      /usr/bin/ssh'
+        yield '  Remote file copy command:  /usr/bin/scp'
+        yield '  Repository type:           CCR'
+        yield ''
+        yield ' Node  Daemon node name  IP address   Admin node name  Designation'
+        yield '------------------------------------------------------------------'
+        for idx in range( 1, self.sizes['nodes'] + 1 ):
+            yield '{:5d}   node{}   10.{}.{}.{}   node{}   {}'.format( idx, idx, idx // 65536 % 256, idx // 256 % 256,
+                                                                 idx % 256, idx, 'quorum-manager' if idx <= 3 else '' )
+
+
+    def mmlsmgr( self, args ):
+        yield 'Cluster manager node: 10.0.0.1 (node1)'
+
+
+    def mmlsnsd( self, args ):
+        yield ''
+        yield ' File system   Disk name    NSD servers'
+        yield '---------------------------------------------------------------------------'
+        nodes = max( self.sizes['nodes'], 2 )
+        for idx in range( self.sizes['nsds'] ):
+            primary = idx % nodes + 1
+            backup = ( idx + 1 ) % nodes + 1
+            yield ' fs{}   nsd{}   node{},node{}'.format( idx % self.sizes['filesystems'], idx, primary, backup )
+
+
+    def mmlsfs( self, args ):
+        yield 'mmlsfs::HEADER:version:reserved:reserved:deviceName:fieldName:data:remarks:'
+        for ( field, value ) in filesystem_fields:
+            yield 'mmlsfs::0:1:::{}:{}:{}::'.format( args[0], field, value )
+        disks = ';'.join( 'nsd{}'.format( idx ) for idx in range( min( self.sizes['nsds'], 1000 ) ) )
+        yield 'mmlsfs::0:1:::{}:disks:{}::'.format( args[0], disks )
+
+
+    def mmlsfileset( self, args ):
+        yield 'mmlsfileset::HEADER:version:reserved:reserved:' + ':'.join( fileset_fields ) + ':'
+        for idx in range( self.sizes['filesets'] ):
+            name = 'root' if idx == 0 else 'fileset{}'.format( idx )
+            path = '%2Fgpfs%2F{}'.format( args[0] ) if idx == 0 else '%2Fgpfs%2F{}%2Fprojects%2F{}'.format( args[0], name )
+            inode_space = idx if idx % 4 == 0 else idx - idx % 4
+            values = [ args[0], name, str( idx ), '3', 'Linked', path, '--' if idx == 0 else '0',
+                       'Thu Jan  1 00%3A00%3A00 2026', '0', '0', '', 'off' ]
+            values.extend( [ '-' ] * 12 )
+            values.extend( [ str( inode_space ), '1' if idx % 4 == 0 else '0', '1048576', '524288', '0' ] )
+            values.extend( [ '-' ] * 8 )
+            values.extend( [ '0', '-', '-', '-', 'chmodAndSetacl', '-', '4000' ] )
+            values.extend( [ '-' ] * 11 )
+            yield 'mmlsfileset::0:1:::' + ':'.join( values ) + ':'
+
+
+    def mmlspool( self, args ):
+        yield "Storage pools in file system at '/gpfs/{}':".format( args[0] )
+        yield 'Name                    Id   BlkSize Data Meta Total Data in (KB)   Free Data in (KB)   Total Meta in (KB)    Free Meta in (KB)'
+        for idx in range( self.sizes['pools'] ):
+            name = 'system' if idx == 0 else 'pool{}'.format( idx )
+            yield '{:<20s} {:>8d}    4 MB  yes  {}  107374182400  53687091200 ( 50%)  10737418240  9663676416 ( 90%)'.format(
+                  name, idx if idx == 0 else 65536 + idx, 'yes' if idx == 0 else ' no' )
+
+
+    def mmlssnapshot( self, args ):
+        count = self.sizes['snapshots']
+        if count == 0:
+           yield 'No snapshots in file system {}'.format( args[0] )
+           return
+        fileset = args[args.index('-j') + 1] if '-j' in args else None
+        filesets = max( self.sizes['filesets'] // 4, 1 )
+        yield 'mmlssnapshot::HEADER:version:reserved:reserved:filesystemName:directory:snapID:status:created:quotas:data:metadata:fileset:snapType:'
+        for idx in range( count ):
+            owner = fileset or ( 'root' if idx % filesets == 0 else 'fileset{}'.format( idx % filesets * 4 ) )
+            yield 'mmlssnapshot::0:1:::{}:{}_{:08d}:{}:Valid:Thu Jan  1 00%3A00%3A00 2026::0:0:{}::'.format(
+                  args[0], owner, idx, idx + 1, owner )
+
+
+    def mmapplypolicy( self, args ):
+        """
+        Write the list file of the ssapi LIST rule.  It is generated once and linked
+        to each -f prefix, so the benchmarks only measure reading it.
+        """
+        if self.policy_file is None:
+           import tempfile
+           ( fd, self.policy_file ) = tempfile.mkstemp( prefix='ssapi-bench-', suffix='.list' )
+           f = os.fdopen( fd, 'w' )
+           try:
+              filesets = max( self.sizes['filesets'] // 4, 1 )
+              for idx in range( self.sizes['policy'] ):
+                  fid = idx % filesets * 4
+                  fileset = 'root' if fid == 0 else 'fileset{}'.format( fid )
+                  f.write( '{} {} 0  {} {} {} {} {} -- /gpfs/{}/projects/{}/dir%20{}/file{}.dat\n'.format(
+                           idx + 3, idx * 7919 % 65536, fileset, 1000 + idx % 997, 100 + idx % 13, idx % 4096,
+                           idx % 4096 * 1024, args[0], fileset, idx % 1000, idx ) )
+           finally:
+              f.close()
+        prefix = args[args.index('-f') + 1]
+        os.symlink( self.policy_file, '{}.list.{}'.format( prefix, ssapi.policy_list_name ) )
+        yield '[I] A total of {} files have been listed.'.format( self.sizes['policy'] )
+
+
+    def mmrepquota( self, args ):
+        device = args[-2]
+        filesets = max( self.sizes['filesets'] // 4, 1 )
+        yield ( 'mmrepquota::HEADER:version:reserved:reserved:filesystemName:quotaType:id:name:blockUsage:blockQuota:'
+                'blockLimit:blockInDoubt:blockGrace:filesUsage:filesQuota:filesLimit:filesInDoubt:filesGrace:remarks:'
+                'quota:defQuota:fid:filesetname:' )
+        for idx in range( self.sizes['quotas'] ):
+            fid = idx % filesets * 4
+            fileset = 'root' if fid == 0 else 'fileset{}'.format( fid )
+            if idx < filesets:
+               quota_type = 'FILESET'
+               name = fileset
+               qid = fid
+            else:
+               quota_type = 'USR' if idx % 2 else 'GRP'
+               name = 'user{}'.format( idx ) if idx % 2 else 'group{}'.format( idx )
+               qid = 1000 + idx
+            usage = idx * 7919 % 10000000
+            grace = 'none' if usage < 8000000 else ( 'expired' if usage > 9500000 else '{} days'.format( idx % 7 + 1 ) )
+            yield 'mmrepquota::0:1:::{}:{}:{}:{}:{}:8000000:10000000:0:{}:{}:0:0:0:none:i:on:off:{}:{}:'.format(
+                  device, quota_type, qid, name, usage, grace, idx % 5000, fid, fileset )
+
+
+def measure( function, repeat ):
+    """
+    Return the best wall time of repeat calls to function, and its peak traced
+    memory in bytes, or None if tracemalloc is not available.
+    """
+    best = None
+    for idx in range( repeat ):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+           best = elapsed
+
+    peak = None
+    if tracemalloc is not None:
+       tracemalloc.start()
+       result = function()
+       peak = tracemalloc.get_traced_memory()[1]
+       tracemalloc.stop()
+       del result
+
+    return ( best, peak )
+
+
+def policy_benchmark( function ):
+    """
+    Run function on a policy scan of fs0, and delete the scan.
+    """
+    scan = ssapi.Filesystem( 'fs0', Lazy=True ).policy_scan()
+    try:
+       return function( scan )
+    finally:
+       scan.remove()
+
+
+# name -> ( function to benchmark, the row count used for the per-row figures )
+benchmarks = [ ( 'Cluster',              lambda: ssapi.Cluster(),                               'nodes' ),
+               ( 'Nsds',                 lambda: ssapi.Nsds(),                                  'nsds' ),
+               ( 'Filesystem',           lambda: ssapi.Filesystem( 'fs0' ),                     'filesets' ),
+               ( 'Filesystem Compact',   lambda: ssapi.Filesystem( 'fs0', Compact=True ),       'filesets' ),
+               ( 'StoragePool',          lambda: ssapi.StoragePool( 'fs0' ),                    'pools' ),
+               ( 'Snapshots',            lambda: ssapi.Snapshots( 'fs0', '' ),                  'snapshots' ),
+               ( 'Snapshots Compact',    lambda: ssapi.Snapshots( 'fs0', '', Compact=True ),    'snapshots' ),
+               ( 'Quotas Stream',        lambda: ssapi.Quotas( 'fs0' ).top( 10 ),               'quotas' ),
+               ( 'Quotas Compact',       lambda: ssapi.Quotas( 'fs0', Compact=True ),           'quotas' ),
+               ( 'PolicyList Records',   lambda: policy_benchmark( lambda scan: sum( len( batch ) for batch in scan.batches() ) ), 'policy' ),
+               ( 'PolicyList Aggregate', lambda: policy_benchmark( lambda scan: scan.aggregate( workers=1 ) ), 'policy' ),
+             ]
+
+
+def run_benchmarks( sizes=( 1000, 10000, 100000 ), repeat=3, names=None ):
+    """
+    Run the benchmarks at every size and return a list of result dictionaries.
+    """
+    results = []
+    previous = ssapi.command_backend
+    try:
+       for size in sizes:
+           backend = SyntheticBackend( filesets=size, snapshots=size, nsds=size, nodes=size, pools=size, quotas=size, policy=size )
+           ssapi.set_command_backend( backend )
+
+           try:
+              for ( name, function, rows ) in benchmarks:
+                  if names and name not in names:
+                     continue
+                  ( elapsed, peak ) = measure( function, repeat )
+                  results.append( { 'benchmark': name,
+                                    'size': size,
+                                    'seconds': elapsed,
+                                    'rows_per_second': size / elapsed if elapsed else None,
+                                    'peak_bytes': peak,
+                                  } )
+           finally:
+              backend.close()
+    finally:
+       ssapi.set_command_backend( previous )
+
+    return results
+
+
+def measure_startup( repeat=10 ):
+    """
+    Return the seconds that importing ssapi_cli and ssapi and building its argument
+    parser add to the start of the interpreter, the best of repeat runs.
+    """
+    directory = os.path.dirname( os.path.abspath( __file__ ) )
+
+    def best( code ):
+        times = []
+        for idx in range( repeat ):
+            start = time.time()
+            subprocess.check_call( [ sys.executable, '-c', code ], cwd=directory )
+            times.append( time.time() - start )
+        return min( times )
+
+    return best( 'import ssapi_cli, ssapi; ssapi_cli.build_parser()' ) - best( 'pass' )
+
+
+def measure_remote( nodes, max_workers=64, rsh=None ):
+    """
+    Run a command on nodes fake nodes with RemoteShells, twice, and return the
+    seconds of the first run, which starts the shells, and of the second, which
+    reuses them.  The remote shell is tests/fake_rsh.py unless rsh is given.
+    """
+    if rsh is None:
+       rsh = [ sys.executable, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'tests', 'fake_rsh.py' ) ]
+    names = [ 'node{}'.format( idx ) for idx in range( nodes ) ]
+    shells = ssapi.RemoteShells( rsh )
+    try:
+       times = []
+       for idx in range( 2 ):
+           start = time.time()
+           for ( node, result, error ) in shells.run_on_nodes( 'true', names, max_workers, timeout=60 ):
+               if error is not None:
+                  raise error
+           times.append( time.time() - start )
+       return times
+    finally:
+       shells.close()
+
+
+def print_results( results ):
+    print("{:<20s} {:>8s} {:>10s} {:>12s} {:>12s}".format( 'Benchmark', 'Rows', 'Seconds', 'Rows/sec', 'Peak MB' ))
+    for result in results:
+        peak = '-' if result['peak_bytes'] is None else '{:.1f}'.format( result['peak_bytes'] / 1048576.0 )
+        print("{:<20s} {:>8d} {:>10.4f} {:>12.0f} {:>12s}".format( result['benchmark'], result['size'],
+                                                                   result['seconds'], result['rows_per_second'] or 0, peak ))
+
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description='Benchmark the ssapi parsers against synthetic mm output.' )
+    parser.add_argument( '--sizes', type=int, nargs='+', default=[ 1000, 10000, 100000 ],
+                         help='The number of rows to generate for each run.' )
+    parser.add_argument( '--repeat', type=int, default=3, help='Report the best of this many runs.' )
+    parser.add_argument( '--only', nargs='+', help='Only run these benchmarks.' )
+    parser.add_argument( '--json', help='Also write the results to this file.' )
+    parser.add_argument( '--startup', action='store_true',
+                         help='Check the ssapi command startup time against its budget instead.' )
+    parser.add_argument( '--remote', type=int, metavar='NODES',
+                         help='Time run_on_nodes over this many nodes with a local fake remote shell instead.' )
+    args = parser.parse_args( argv )
+
+    if args.remote:
+       ( first, second ) = measure_remote( args.remote )
+       print("run_on_nodes on {} nodes: {:.2f} s starting the shells, {:.2f} s reusing them".format( args.remote, first, second ))
+       return 0
+
+    if args.startup:
+       import ssapi_cli
+       seconds = measure_startup( max( args.repeat, 5 ) )
+       print("Startup: {:.1f} ms, budget {:.1f} ms".format( seconds * 1000, ssapi_cli.startup_budget * 1000 ))
+       return 0 if seconds <= ssapi_cli.startup_budget else 1
+
+    results = run_benchmarks( args.sizes, args.repeat, args.only )
+    print_results( results )
+
+    if args.json:
+       f = open( args.json, 'w' )
+       json.dump( results, f, indent=1 )
+       f.close()
+    return 0
+
+
+if __name__ == '__main__':
+   sys.exit( main() )
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#=====================================================================================
+# The ssapi command line tool.
+#
+#    ssapi cluster --fields nodename,is_cluster_manager
+#    ssapi cluster --state-cache
+#    ssapi nsds --format ndjson
+#    ssapi fs fs0 --fields blockSize,defaultMountPoint
+#    ssapi filesets fs0 --fields filesetName,path --format ndjson
+#    ssapi pools fs0
+#    ssapi snapshots fs0 -j proj1
+#
+# Listings are written as a JSON array, or one JSON object per line with
+# --format ndjson.  filesets and snapshots are written as the mm command output is
+# read, so they never have to be held in memory.
+#
+# --fields limits the output to those fields, and only the commands they need are
+# run: "ssapi cluster --fields nodename" only reads mmfsNodeData.  With
+# --state-cache, cluster uses the ssapi cluster state cache between runs.
+#
+# This runs thousands of times an hour from monitoring agents, so ssapi is only
+# imported once the arguments have been parsed.  "python ssapi_bench.py --startup"
+# checks the startup time against startup_budget.
+#
+#=====================================================================================
+
+
+from __future__ import print_function
+import os
+import sys
+import errno
+
+
+# The most the import of ssapi_cli and ssapi may add to the interpreter startup.
+# Measured at about 45 ms on Python 3 and 50 ms on Python 2.7.
+startup_budget = 0.060
+
+
+class CommandFailed( Exception ):
+    def __init__( self, command, rc, stderr ):
+        Exception.__init__( self, command )
+        self.command = command
+        self.rc = rc
+        self.stderr = stderr
+
+
+def parse_fields( fields ):
+    """
+    Return the list of fields from a --fields argument, or None for every field.
+    """
+    if not fields:
+       return None
+    return [ field for field in fields.split(',') if field ]
+
+
+def project( record, fields ):
+    if fields is None:
+       return dict( record )
+    return dict( ( field, record[field] ) for field in fields if field in record )
+
+
+def stream_records( command, start=6 ):
+    """
+    Run an mm command with -Y and yield its records as they are read.
+    """
+    import ssapi
+    stream = ssapi.CommandStream( command )
+    for record in ssapi.iter_mm_records( stream, start ):
+        yield record
+    if stream.returncode:
+       raise CommandFailed( command, stream.returncode, stream.stderr )
+
+
+def run_command( command ):
+    import ssapi
+    ( rc, cmd_out, cmd_err ) = ssapi.execute_command( command )
+    if rc:
+       raise CommandFailed( command, rc, cmd_err )
+    return cmd_out
+
+
+def cluster_object( args, fields ):
+    """
+    The cluster information, and the node name, cluster manager and GPFS devices.
+    Only the commands the fields need are run.
+    """
+    import ssapi
+    cluster = ssapi.Cluster( Lazy=True, StateCache=args.state_cache or None )
+    groups = [ 'nodename', 'cluster_manager', 'is_cluster_manager', 'gpfsdevs' ]
+
+    info = fields is None or [ field for field in fields if field not in groups ]
+    if args.state_cache and ( info or 'gpfsdevs' in fields ):
+       # The state is only saved with both the cluster information and the NSDs,
+       # fetch both so the next run can take them from the cache.
+       info = True
+       cluster.gpfsdevs
+    result = {}
+    if info:
+       result.update( cluster.cluster_info )
+    for group in groups:
+        if fields is None or group in fields:
+           result[group] = getattr( cluster, group )
+    return project( result, fields )
+
+
+def nsd_rows( args, fields ):
+    import ssapi
+    ( nsds, gpfsdevs ) = ssapi.parse_mmlsnsd( run_command( "/usr/lpp/mmfs/bin/mmlsnsd" ) )
+    for name in sorted( nsds ):
+        row = { 'name': name, 'usage': nsds[name]['usage'], 'servers': nsds[name]['servers'] }
+        yield project( row, fields )
+
+
+def filesystem_object( args, fields ):
+    import ssapi
+    filesys = ssapi.parse_mmlsfs( run_command( "/usr/lpp/mmfs/bin/mmlsfs {} -Y".format( args.device ) ) )
+    return project( filesys, fields )
+
+
+def fileset_rows( args, fields ):
+    import ssapi
+    for record in stream_records( "/usr/lpp/mmfs/bin/mmlsfileset {} -Y".format( args.device ), start=7 ):
+        if fields is None or 'fstype' in fields:
+           record['fstype'] = ssapi.fileset_type( record )
+        yield project( record, fields )
+
+
+def pool_rows( args, fields ):
+    import ssapi
+    pools = ssapi.parse_mmlspool( run_command( "/usr/lpp/mmfs/bin/mmlspool {}".format( args.device ) ) )
+    for name in sorted( pools ):
+        row = dict( pools[name] )
+        row['name'] = name
+        yield project( row, fields )
+
+
+def snapshot_rows( args, fields ):
+    if args.fileset:
+       command = "/usr/lpp/mmfs/bin/mmlssnapshot {} -j {} -Y".format( args.device, args.fileset )
+    else:
+       command = "/usr/lpp/mmfs/bin/mmlssnapshot {} -Y".format( args.device )
+    for record in stream_records( command ):
+        yield project( record, fields )
+
+
+def write_object( out, obj, args ):
+    import json
+    if args.format == 'ndjson':
+       out.write( json.dumps( obj, sort_keys=True, separators=( ',', ':' ) ) + '\n' )
+    else:
+       out.write( json.dumps( obj, sort_keys=True, indent=1 ) + '\n' )
+
+
+def write_rows( out, rows, args ):
+    """
+    Write each row as soon as it is produced.
+    """
+    import json
+    if args.format == 'ndjson':
+       for row in rows:
+           out.write( json.dumps( row, sort_keys=True, separators=( ',', ':' ) ) + '\n' )
+       return
+
+    out.write( '[' )
+    separator = '\n'
+    for row in rows:
+        out.write( separator + json.dumps( row, sort_keys=True ) )
+        separator = ',\n'
+    out.write( '\n]\n' )
+
+
+# ( subcommand, help, function, returns rows, takes a device )
+subcommands = [ ( 'cluster',   'The cluster information, node name and cluster manager.', cluster_object,    False, False ),
+                ( 'nsds',      'The NSDs, their file system and servers.',                 nsd_rows,          True,  False ),
+                ( 'fs',        'The attributes of a file system, from mmlsfs.',            filesystem_object, False, True ),
+                ( 'filesets',  'The filesets of a file system.',                           fileset_rows,      True,  True ),
+                ( 'pools',     'The storage pools of a file system.',                      pool_rows,         True,  True ),
+                ( 'snapshots', 'The snapshots of a file system, or of one fileset.',       snapshot_rows,     True,  True ),
+              ]
+
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser( prog='ssapi', description='Report Spectrum Scale information as JSON.' )
+    commands = parser.add_subparsers( dest='command', metavar='command' )
+    commands.required = True
+    for ( name, description, function, rows, device ) in subcommands:
+        command = commands.add_parser( name, help=description, description=description )
+        if device:
+           command.add_argument( 'device', help='The GPFS device.' )
+        if name == 'snapshots':
+           command.add_argument( '-j', dest='fileset', help='Only the snapshots of this fileset.' )
+        if name == 'cluster':
+           command.add_argument( '--state-cache', action='store_true',
+                                 help='Keep the cluster information on disk between runs.' )
+        command.add_argument( '--fields', help='A comma separated list of the fields to output.' )
+        command.add_argument( '--format', choices=( 'json', 'ndjson' ), default='json',
+                              help='One JSON document, or one JSON object per line.' )
+        command.set_defaults( function=function, rows=rows )
+    return parser
+
+
+def main( argv=None, out=None ):
+    args = build_parser().parse_args( argv )
+    out = out or sys.stdout
+    fields = parse_fields( args.fields )
+
+    try:
+       if args.rows:
+          write_rows( out, args.function( args, fields ), args )
+       else:
+          write_object( out, args.function( args, fields ), args )
+    except CommandFailed as error:
+       out.flush()
+       sys.stderr.write( "ssapi: {} failed with return code {}\n".format( error.command, error.rc ) )
+       if error.stderr:
+          sys.stderr.write( error.stderr )
+       return error.rc if error.rc < 256 else 1
+    except ( IOError, OSError ) as error:
+       if error.errno != errno.EPIPE:
+          sys.stderr.write( "ssapi: {}\n".format( error ) )
+          return 1
+       # The reader went away, ie: ssapi filesets fs0 | head.  Point stdout at
+       # /dev/null so the interpreter does not fail flushing it on the way out.
+       devnull = os.open( os.devnull, os.O_WRONLY )
+       os.dup2( devnull, out.fileno() )
+       return 0
+    except ValueError as error:
+       out.flush()
+       sys.stderr.write( "ssapi: {}\n".format( error ) )
+       return 1
+    return 0
+
+
+if __name__ == '__main__':
+   sys.exit( main() )
@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+#=====================================================================================
+# A daemon that refreshes the cluster information on a schedule and serves it over
+# HTTP, so dashboards, alerting and chargeback do not each run the mm commands.
+#
+#    python ssapi_exporter.py --port 9712 --interval pools=30
+#    curl http://localhost:9712/metrics         # Prometheus text format
+#    curl http://localhost:9712/json            # every dataset as one JSON document
+#    curl http://localhost:9712/json/pools      # one dataset
+#
+# Each dataset (cluster, nsds, pools, filesets and snapshots) is refreshed on its
+# own thread every interval seconds.  After a refresh the dataset is rendered once,
+# and a new set of responses is swapped in with a single assignment.  A scrape only
+# looks the response up, so it costs the same however many clients there are, and
+# a dataset that fails to refresh keeps serving its last good data.
+#
+# The file system datasets cover the devices given with --devices, or every device
+# in the latest mmlsnsd output.  Their commands run in the 'bulk' priority class
+# when the ssapi command scheduler is enabled.
+#
+#=====================================================================================
+
+
+from __future__ import print_function
+from collections import OrderedDict
+import sys
+import json
+import time
+import threading
+
+try:
+   from http.server import BaseHTTPRequestHandler, HTTPServer
+   from socketserver import ThreadingMixIn
+except ImportError:
+   from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+   from SocketServer import ThreadingMixIn
+
+import ssapi
+
+
+prometheus_content_type = 'text/plain; version=0.0.4; charset=utf-8'
+json_content_type = 'application/json'
+
+
+def escape_label( value ):
+    return str( value ).replace( '\\', '\\\\' ).replace( '"', '\\"' ).replace( '\n', '\\n' )
+
+
+def format_value( value ):
+    if isinstance( value, float ):
+       return repr( value )
+    return str( int( value ) )
+
+
+def encode_body( text ):
+    if not isinstance( text, bytes ):
+       text = text.encode( 'utf-8' )
+    return text
+
+
+class Metrics:
+    """
+    Collects the samples of a dataset and renders them in the Prometheus text
+    format, with the HELP and TYPE lines of each metric once.
+    """
+    def __init__( self ):
+        self.families = OrderedDict()
+
+
+    def add( self, name, help, value, labels=None, kind='gauge' ):
+        if name not in self.families:
+           self.families[name] = ( kind, help, [] )
+        self.families[name][2].append( ( labels or {}, value ) )
+
+
+    def render( self ):
+        lines = []
+        for ( name, ( kind, help, samples ) ) in self.families.items():
+            lines.append( '# HELP {} {}'.format( name, help ) )
+            lines.append( '# TYPE {} {}'.format( name, kind ) )
+            for ( labels, value ) in samples:
+                if labels:
+                   label_text = ','.join( '{}="{}"'.format( key, escape_label( labels[key] ) ) for key in sorted( labels ) )
+                   lines.append( '{}{{{}}} {}'.format( name, label_text, format_value( value ) ) )
+                else:
+                   lines.append( '{} {}'.format( name, format_value( value ) ) )
+        return ''.join( line + '\n' for line in lines )
+
+
+#-------------------------------------------------------------------------------------
+# Datasets
+#
+# Each dataset has a collect function that returns its data as plain dictionaries
+# and lists, and a metrics function that adds its samples to a Metrics.  The per
+# device datasets are collected and rendered one device at a time.
+#-------------------------------------------------------------------------------------
+
+def collect_cluster( session ):
+    cluster = ssapi.Cluster( Lazy=True, Session=session )
+    return { 'cluster_info': cluster.cluster_info,
+             'nodename': cluster.nodename,
+             'cluster_manager': cluster.cluster_manager,
+             'is_cluster_manager': cluster.is_cluster_manager,
+           }
+
+
+def cluster_metrics( metrics, data ):
+    info = data['cluster_info']
+    metrics.add( 'ssapi_cluster_info', 'The GPFS cluster name and id.', 1,
+                 { 'cluster': info.get( 'name', '' ), 'id': info.get( 'id', '' ) } )
+    metrics.add( 'ssapi_cluster_nodes', 'The number of nodes in the cluster.', len( info.get( 'nodes', {} ) ) )
+    metrics.add( 'ssapi_cluster_manager', 'The cluster manager node.', 1,
+                 { 'node': data['cluster_manager'].get( 'node', '' ) } )
+    metrics.add( 'ssapi_is_cluster_manager', 'Whether this node is the cluster manager.',
+                 int( data['is_cluster_manager'] ), { 'node': data['nodename'] } )
+
+
+def collect_nsds( session ):
+    nsds = ssapi.Nsds( Session=session )
+    return { 'nsds': nsds.nsds,
+             'gpfsdevs': sorted( nsds.gpfsdevs ),
+             'server_load': nsds.server_load(),
+             'single_points_of_failure': nsds.single_points_of_failure(),
+           }
+
+
+def nsd_metrics( metrics, data ):
+    counts = {}
+    for nsd in data['nsds'].values():
+        counts[nsd['usage']] = counts.get( nsd['usage'], 0 ) + 1
+    for usage in sorted( counts ):
+        metrics.add( 'ssapi_nsds', 'The number of NSDs of a file system, or free or lroc.', counts[usage],
+                     { 'filesystem': usage } )
+    for ( server, load ) in sorted( data['server_load'].items() ):
+        for role in ( 'primary', 'backup' ):
+            metrics.add( 'ssapi_nsd_server_nsds', 'The number of NSDs a server is the primary or a backup server for.',
+                         load[role], { 'server': server, 'role': role } )
+    metrics.add( 'ssapi_nsd_single_server', 'The number of NSDs with only one server.',
+                 len( data['single_points_of_failure'] ) )
+
+
+def collect_pools( session, device ):
+    return ssapi.StoragePool( device, Session=session ).pools
+
+
+# ( mmlspool field in KB, metric, help )
+pool_fields = ( ( 'datasize', 'ssapi_pool_data_size_bytes', 'The data capacity of the storage pool.' ),
+                ( 'datafree', 'ssapi_pool_data_free_bytes', 'The free data space of the storage pool.' ),
+                ( 'metasize', 'ssapi_pool_metadata_size_bytes', 'The metadata capacity of the storage pool.' ),
+                ( 'metafree', 'ssapi_pool_metadata_free_bytes', 'The free metadata space of the storage pool.' ),
+              )
+
+
+def pool_metrics( metrics, device, pools ):
+    for ( name, pool ) in sorted( pools.items() ):
+        for ( field, metric, help ) in pool_fields:
+            metrics.add( metric, help, ssapi.quota_number( pool[field] ) * 1024, { 'device': device, 'pool': name } )
+
+
+def collect_filesets( session, device ):
+    filesets = ssapi.Filesystem( device, Lazy=True, Compact=True, Session=session ).filesets
+    return dict( ( name, record.to_dict() ) for ( name, record ) in filesets.items() )
+
+
+# ( mmlsfileset field, metric, help ) for the filesets that own an inode space.
+fileset_fields = ( ( 'maxInodes', 'ssapi_fileset_max_inodes', 'The inode limit of an independent fileset.' ),
+                   ( 'allocInodes', 'ssapi_fileset_alloc_inodes', 'The allocated inodes of an independent fileset.' ),
+                   ( 'freeInodes', 'ssapi_fileset_free_inodes', 'The free inodes of an independent fileset.' ),
+                 )
+
+
+def fileset_metrics( metrics, device, filesets ):
+    counts = {}
+    for fileset in filesets.values():
+        counts[fileset['fstype']] = counts.get( fileset['fstype'], 0 ) + 1
+    for fstype in sorted( counts ):
+        metrics.add( 'ssapi_filesets', 'The number of filesets of each type.', counts[fstype],
+                     { 'device': device, 'type': fstype } )
+    for ( name, fileset ) in sorted( filesets.items() ):
+        if fileset['fstype'] != 'Independent':
+           continue
+        for ( field, metric, help ) in fileset_fields:
+            metrics.add( metric, help, ssapi.quota_number( fileset.get( field ) ), { 'device': device, 'fileset': name } )
+
+
+def collect_snapshots( session, device ):
+    # Snapshots only prints a failed mmlssnapshot, so it is run here to raise instead.
+    command = "/usr/lpp/mmfs/bin/mmlssnapshot {} -Y".format( device )
+    ( rc, cmd_out, cmd_err ) = ssapi.execute_command( command, Session=session )
+    ssapi.check_command_result( command, rc, cmd_err )
+    return ssapi.parse_mmlssnapshot( cmd_out )
+
+
+def snapshot_metrics( metrics, device, snapshots ):
+    counts = {}
+    for snapshot in snapshots.values():
+        fileset = snapshot.get( 'fileset' ) or 'root'
+        counts[fileset] = counts.get( fileset, 0 ) + 1
+    metrics.add( 'ssapi_snapshots_total', 'The number of snapshots of a file system.', len( snapshots ), { 'device': device } )
+    for fileset in sorted( counts ):
+        metrics.add( 'ssapi_fileset_snapshots', 'The number of snapshots of a fileset.', counts[fileset],
+                     { 'device': device, 'fileset': fileset } )
+
+
+def collect_bulk( collect, *args ):
+    """
+    Call collect with args in the 'bulk' priority class.  command_priority() only
+    applies to the thread that sets it, so each worker thread sets it again.
+    """
+    with ssapi.command_priority( 'bulk' ):
+       return collect( *args )
+
+
+# ( dataset, default interval in seconds, per device, collect, metrics )
+datasets = [ ( 'cluster',   600, False, collect_cluster,   cluster_metrics ),
+             ( 'nsds',      600, False, collect_nsds,      nsd_metrics ),
+             ( 'pools',      60, True,  collect_pools,     pool_metrics ),
+             ( 'filesets',  300, True,  collect_filesets,  fileset_metrics ),
+             ( 'snapshots', 300, True,  collect_snapshots, snapshot_metrics ),
+           ]
+
+
+class Exporter:
+    """
+    Refreshes each dataset on its own schedule and keeps the rendered responses:
+
+        exporter = ssapi_exporter.Exporter( intervals={ 'pools': 30 } )
+        exporter.start()
+        exporter.serve( 9712 )
+
+    If you pass Session=, its ttl should be shorter than the intervals, or the
+    refreshes return its stored results.
+
+    responses maps each path to ( content type, body ).  It is replaced, never
+    changed, so a reader always sees a complete set.  status[dataset] has the time
+    and duration of the last refresh, the number of failed refreshes and the last
+    error.  For the per device datasets, a device that fails keeps its last data
+    and its error is in status[dataset]['device_errors'].
+    """
+    session = None
+
+    def __init__( self, devices=None, intervals=None, max_workers=8, Session=None ):
+        self.devices = list( devices ) if devices else None
+        self.intervals = OrderedDict( ( name, interval ) for ( name, interval, per_device, collect, render ) in datasets )
+        self.intervals.update( intervals or {} )
+        self.max_workers = max_workers
+        # The results are not kept between refreshes, the Session only shares the
+        # node name and commands that are running at the same time.
+        self.session = Session or ssapi.Session( ttl=0 )
+        self.data = {}
+        self.rendered = {}
+        self.status = dict( ( name, { 'last_refresh': None, 'duration': None, 'errors': 0, 'last_error': None,
+                                      'device_errors': {} } ) for name in self.intervals )
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.responses = {}
+        self.publish()
+
+
+    def device_list( self ):
+        """
+        Return the devices of the per device datasets.
+        """
+        if self.devices is not None:
+           return self.devices
+        if 'nsds' not in self.data:
+           self.refresh( 'nsds' )
+        return self.data.get( 'nsds', {} ).get( 'gpfsdevs', [] )
+
+
+    def refresh( self, name ):
+        """
+        Collect one dataset now, render it and publish the new responses.
+        """
+        ( interval, per_device, collect, render ) = [ ( interval, per_device, collect, render )
+                                                      for ( dataset, interval, per_device, collect, render ) in datasets
+                                                      if dataset == name ][0]
+        start = time.time()
+        metrics = Metrics()
+        device_errors = {}
+        try:
+           if per_device:
+              data = dict( self.data.get( name, {} ) )
+              devices = self.device_list()
+              for ( device, result, error ) in ssapi.run_bounded( lambda dev: collect_bulk( collect, self.session, dev ), devices, self.max_workers ):
+                  if error is not None:
+                     device_errors[device] = str( error )
+                  else:
+                     data[device] = result
+              for device in list( data ):
+                  if device not in devices:
+                     del data[device]
+              for device in sorted( data ):
+                  render( metrics, device, data[device] )
+           else:
+              data = collect_bulk( collect, self.session )
+              render( metrics, data )
+           rendered = ( metrics.render(), json.dumps( data, sort_keys=True, default=str ) )
+        except Exception as error:
+           with self.lock:
+              status = self.status[name]
+              status['errors'] += 1
+              status['last_error'] = str( error )
+              self.publish()
+           return False
+
+        with self.lock:
+           self.data[name] = data
+           self.rendered[name] = rendered
+           status = self.status[name]
+           status['last_refresh'] = time.time()
+           status['duration'] = status['last_refresh'] - start
+           status['device_errors'] = device_errors
+           status['errors'] += len( device_errors )
+           if device_errors:
+              status['last_error'] = '; '.join( '{}: {}'.format( device, device_errors[device] ) for device in sorted( device_errors ) )
+           self.publish()
+        return True
+
+
+    def status_metrics( self ):
+        metrics = Metrics()
+        for ( name, status ) in sorted( self.status.items() ):
+            labels = { 'dataset': name }
+            if status['last_refresh'] is not None:
+               metrics.add( 'ssapi_exporter_last_refresh_timestamp_seconds', 'When the dataset was last refreshed.',
+                            status['last_refresh'], labels )
+               metrics.add( 'ssapi_exporter_refresh_duration_seconds', 'How long the last refresh of the dataset took.',
+                            status['duration'], labels )
+            metrics.add( 'ssapi_exporter_refresh_errors_total', 'The number of failed refreshes of the dataset or one of its devices.',
+                         status['errors'], labels, kind='counter' )
+        return metrics.render()
+
+
+    def publish( self ):
+        """
+        Build the responses from the rendered datasets and swap them in.  Called
+        with the lock held, so publishes do not interleave.
+        """
+        names = [ name for name in self.intervals if name in self.rendered ]
+        status = json.dumps( self.status, sort_keys=True )
+
+        document = '{' + ', '.join( [ '"{}": {}'.format( name, self.rendered[name][1] ) for name in names ] +
+                                    [ '"status": ' + status ] ) + '}\n'
+
+        responses = { '/metrics': ( prometheus_content_type,
+                                    encode_body( ''.join( self.rendered[name][0] for name in names ) + self.status_metrics() ) ),
+                      '/json': ( json_content_type, encode_body( document ) ),
+                      '/json/status': ( json_content_type, encode_body( status + '\n' ) ),
+                    }
+        for name in names:
+            responses['/json/' + name] = ( json_content_type, encode_body( self.rendered[name][1] + '\n' ) )
+        self.responses = responses
+
+
+    def run( self, name ):
+        while not self.stopped.is_set():
+            self.refresh( name )
+            self.stopped.wait( self.intervals[name] )
+
+
+    def start( self ):
+        """
+        Start refreshing every dataset on its own daemon thread.
+        """
+        if self.threads:
+           return
+        self.stopped.clear()
+        for name in self.intervals:
+            thread = threading.Thread( target=self.run, args=( name, ) )
+            thread.daemon = True
+            thread.start()
+            self.threads.append( thread )
+
+
+    def stop( self, timeout=None ):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join( timeout )
+        self.threads = []
+
+
+    def serve( self, port=9712, address='127.0.0.1' ):
+        """
+        Serve the responses over HTTP until interrupted.
+        """
+        server = ExporterServer( ( address, port ), ExporterHandler )
+        server.exporter = self
+        try:
+           server.serve_forever()
+        finally:
+           server.server_close()
+
+
+class ExporterServer( ThreadingMixIn, HTTPServer ):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ExporterHandler( BaseHTTPRequestHandler ):
+    def do_GET( self ):
+        response = self.server.exporter.responses.get( self.path.split( '?' )[0].rstrip( '/' ) or '/metrics' )
+        if response is None:
+           self.send_error( 404 )
+           return
+        ( content_type, body ) = response
+        self.send_response( 200 )
+        self.send_header( 'Content-Type', content_type )
+        self.send_header( 'Content-Length', str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+
+    def log_message( self, format, *args ):
+        pass
+
+
+def parse_interval( text ):
+    ( name, seconds ) = text.split( '=', 1 )
+    if name not in [ dataset[0] for dataset in datasets ]:
+       raise ValueError( 'UnknownDataset: {}'.format( name ) )
+    return ( name, float( seconds ) )
+
+
+def main( argv=None ):
+    import argparse
+    parser = argparse.ArgumentParser( description='Serve the Spectrum Scale cluster information over HTTP.' )
+    parser.add_argument( '--port', type=int, default=9712, help='The port to listen on.' )
+    parser.add_argument( '--address', default='127.0.0.1', help='The address to listen on.' )
+    parser.add_argument( '--devices', nargs='+', help='Only these GPFS devices, instead of every one in mmlsnsd.' )
+    parser.add_argument( '--interval', action='append', type=parse_interval, default=[], metavar='DATASET=SECONDS',
+                         help='How often to refresh a dataset, ie: pools=30.' )
+    parser.add_argument( '--max-workers', type=int, default=8, help='The devices collected at the same time.' )
+    args = parser.parse_args( argv )
+
+    exporter = Exporter( args.devices, dict( args.interval ), args.max_workers )
+    exporter.start()
+    try:
+       exporter.serve( args.port, args.address )
+    except KeyboardInterrupt:
+       pass
+    exporter.stop( 1 )
+    return 0
+
+
+if __name__ == '__main__':
+   sys.exit( main() )
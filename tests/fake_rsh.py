@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#=====================================================================================
+# A stand-in for the remote shell command that runs the command on this node:
+#
+#    python tests/fake_rsh.py node1 /bin/sh
+#
+# The node name is dropped, except for these:
+#
+#    down      - the connection is refused, like ssh to a node that is down
+#    split-*   - the output is passed on in pieces, and the last byte of each read
+#                is held back for a moment, like ssh over a slow TCP connection
+#
+#=====================================================================================
+
+
+import os
+import sys
+import time
+import threading
+from subprocess import Popen, PIPE
+
+
+def relay( source, target, delay ):
+    """
+    Copy source to target, writing each read as two pieces delay seconds apart.
+    """
+    while True:
+        data = os.read( source, 65536 )
+        if not data:
+           break
+        for piece in ( data[:-1], data[-1:] ):
+            if piece:
+               os.write( target, piece )
+               time.sleep( delay )
+
+
+def main( argv ):
+    node = argv[1]
+    command = argv[2:]
+
+    if node == 'down':
+       sys.stderr.write( 'ssh: connect to host {} port 22: Connection refused\n'.format( node ) )
+       return 255
+
+    if not node.startswith( 'split-' ):
+       os.execvp( command[0], command )
+
+    subp = Popen( command, stdout=PIPE, stderr=PIPE )
+    threads = [ threading.Thread( target=relay, args=( subp.stdout.fileno(), 1, 0.02 ) ),
+                threading.Thread( target=relay, args=( subp.stderr.fileno(), 2, 0.02 ) ) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return subp.wait()
+
+
+if __name__ == '__main__':
+   sys.exit( main( sys.argv ) )
@@ -0,0 +1,86 @@
+import sys
+import threading
+import unittest
+
+import ssapi
+from tests.test_state_cache import ClusterBackend
+
+
+class WaitingBackend( ClusterBackend ):
+    """
+    A ClusterBackend that, once waiting is set, holds every command until release
+    is set.  waited records whether each command was released or timed out.
+    """
+    def __init__( self ):
+        ClusterBackend.__init__( self )
+        self.waiting = False
+        self.release = threading.Event()
+        self.waited = []
+
+
+    def run( self, shellCommand ):
+        if self.waiting:
+           self.waited.append( self.release.wait( 2 ) )
+        return ClusterBackend.run( self, shellCommand )
+
+
+@unittest.skipIf( sys.version_info < ( 3, 7 ), 'ssapi_async needs Python 3.7' )
+class AsyncBlockingTest( unittest.TestCase ):
+    def setUp( self ):
+        import asyncio
+        import ssapi_async
+        self.ssapi_async = ssapi_async
+        self.backend = WaitingBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.loop = asyncio.new_event_loop()
+
+
+    def tearDown( self ):
+        self.loop.close()
+        ssapi.set_command_backend( self.previous )
+
+
+    def run_released( self, coroutine ):
+        """
+        Run coroutine while the event loop releases the held commands.  If the
+        coroutine blocked the loop, the commands would time out instead.
+        """
+        self.backend.waiting = True
+        self.loop.call_later( 0.01, self.backend.release.set )
+        result = self.loop.run_until_complete( coroutine )
+        self.assertTrue( self.backend.waited )
+        self.assertTrue( all( self.backend.waited ) )
+        return result
+
+
+    def test_filesystem_refresh( self ):
+        filesystem = self.loop.run_until_complete( self.ssapi_async.Filesystem.load( 'fs0' ) )
+        changes = self.run_released( filesystem.refresh( 'filesets' ) )
+        self.assertTrue( 'filesets' in changes )
+
+
+    def test_cluster_refresh( self ):
+        cluster = self.loop.run_until_complete( self.ssapi_async.Cluster.load() )
+        self.run_released( cluster.refresh( 'cluster_info' ) )
+        self.assertEqual( self.backend.commands[-1], 'mmlscluster' )
+
+
+    def test_pool_refresh( self ):
+        pools = self.loop.run_until_complete( self.ssapi_async.StoragePool.load( 'fs0' ) )
+        self.run_released( pools.refresh() )
+
+
+    def test_rotate_snapshots( self ):
+        filesystem = self.loop.run_until_complete( self.ssapi_async.Filesystem.load( 'fs0' ) )
+        report = self.run_released( filesystem.rotate_snapshots( 2, DryRun=True ) )
+        self.assertTrue( report )
+
+
+    def test_delete_snapshots( self ):
+        snaps = self.loop.run_until_complete( self.ssapi_async.Snapshots.load( 'fs0', '' ) )
+        report = self.run_released( snaps.delete_snapshots( snaps.snaplist[:2], retries=0 ) )
+        self.assertEqual( sorted( report ), sorted( snaps.snaplist[:2] ) )
+
+
+if __name__ == '__main__':
+   unittest.main()
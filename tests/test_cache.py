@@ -0,0 +1,104 @@
+import unittest
+
+import ssapi
+
+
+class CountingBackend( ssapi.CommandBackend ):
+    """
+    Returns the same output for every command, and keeps the commands it ran.
+    """
+    def __init__( self ):
+        self.calls = []
+
+
+    def run( self, shellCommand ):
+        self.calls.append( ' '.join( shellCommand ) )
+        return ( 0, 'output {}\n'.format( len( self.calls ) ), '' )
+
+
+class CommandDeviceTest( unittest.TestCase ):
+    def test_devices( self ):
+        cases = [ ( 'mmlsfileset fs0 -Y', 'fs0' ),
+                  ( 'mmrepquota -u -g -j fs0 -Y', 'fs0' ),
+                  ( 'mmsetquota fs0:proj1 --block 1T:2T', 'fs0' ),
+                  ( 'mmlssnapshot fs0 -j proj1 -Y', 'fs0' ),
+                  ( 'mmlinkfileset fs0 proj1 -J /gpfs/fs0/proj1', 'fs0' ),
+                  ( 'mmlsnsd -f fs0', 'fs0' ),
+                  ( 'mmlsnsd', None ),
+                  ( 'mmlsmgr -c', None ),
+                  ( 'mmcrnsd -F /tmp/stanzas', None ),
+                  ( 'mmlsnsd -d nsd1', None ),
+                ]
+        for ( command, device ) in cases:
+            self.assertEqual( ssapi.command_device( command.split() ), device, command )
+
+
+class CommandCacheTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = CountingBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.cache = ssapi.enable_command_cache( default_ttl=60 )
+
+
+    def tearDown( self ):
+        ssapi.disable_command_cache()
+        ssapi.set_command_backend( self.previous )
+
+
+    def run_twice( self, command ):
+        first = ssapi.execute_command( command )
+        second = ssapi.execute_command( command )
+        return ( first, second )
+
+
+    def test_reporting_commands_are_cached( self ):
+        ( first, second ) = self.run_twice( 'mmlsfileset fs0 -Y' )
+        self.assertEqual( first, second )
+        self.assertEqual( len( self.backend.calls ), 1 )
+        self.assertEqual( self.cache.stats()['hits'], 1 )
+
+
+    def test_changing_commands_are_not_cached( self ):
+        for command in ( 'mmchconfig pagepool=4G', 'mmmount fs0 -a', 'mmumount fs0 -a',
+                         'mmchpolicy fs0 /tmp/policy', 'mmapplypolicy fs0 -P /tmp/policy', 'mmstartup -a' ):
+            self.run_twice( command )
+        self.assertEqual( len( self.backend.calls ), 12 )
+        self.assertEqual( self.cache.stats(), { 'entries': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0 } )
+
+
+    def test_setquota_drops_repquota( self ):
+        ssapi.execute_command( 'mmrepquota -u -g -j fs0 -Y' )
+        ssapi.execute_command( 'mmrepquota -u -g -j fs1 -Y' )
+        ssapi.execute_command( 'mmsetquota fs0:proj1 --block 1T:2T' )
+        self.assertEqual( self.cache.stats()['invalidations'], 1 )
+
+        self.run_twice( 'mmrepquota -u -g -j fs0 -Y' )
+        ssapi.execute_command( 'mmrepquota -u -g -j fs1 -Y' )
+        self.assertEqual( self.backend.calls.count( 'mmrepquota -u -g -j fs0 -Y' ), 2 )
+        self.assertEqual( self.backend.calls.count( 'mmrepquota -u -g -j fs1 -Y' ), 1 )
+
+
+    def test_device_change_drops_every_device_entries( self ):
+        ssapi.execute_command( 'mmlsmgr -c' )
+        ssapi.execute_command( 'mmlsnsd' )
+        ssapi.execute_command( 'mmchmgr fs0 node2' )
+        ssapi.execute_command( 'mmadddisk fs0 -F /tmp/stanzas' )
+        ssapi.execute_command( 'mmlsmgr -c' )
+        ssapi.execute_command( 'mmlsnsd' )
+        self.assertEqual( self.backend.calls.count( 'mmlsmgr -c' ), 2 )
+        self.assertEqual( self.backend.calls.count( 'mmlsnsd' ), 2 )
+
+
+    def test_session_drops_stale_results( self ):
+        ssapi.disable_command_cache()
+        session = ssapi.Session()
+        ssapi.execute_command( 'mmrepquota -u -g -j fs0 -Y', Session=session )
+        ssapi.execute_command( 'mmrepquota -u -g -j fs0 -Y', Session=session )
+        ssapi.execute_command( 'mmsetquota fs0:proj1 --files 1M:2M', Session=session )
+        ssapi.execute_command( 'mmrepquota -u -g -j fs0 -Y', Session=session )
+        self.assertEqual( self.backend.calls.count( 'mmrepquota -u -g -j fs0 -Y' ), 2 )
+        self.assertEqual( session.stats()['invalidations'], 1 )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+import ssapi
+from tests.test_filesets import JunctionBackend, filesets
+from tests.test_snapshots import SnapshotBackend
+
+
+class Subscriber:
+    def __init__( self ):
+        self.calls = []
+
+
+    def __call__( self, obj, group, changes ):
+        self.calls.append( ( obj, group, changes ) )
+
+
+class MergeRecordsTest( unittest.TestCase ):
+    def test_change_set( self ):
+        current = { 'a': { 'x': '1', 'y': '2' }, 'b': { 'x': '1' }, 'c': { 'x': '1' } }
+        record = current['a']
+        new = { 'a': { 'x': '1', 'y': '3' }, 'b': { 'x': '1' }, 'd': { 'x': '4' } }
+        ( merged, changes ) = ssapi.merge_records( current, new )
+
+        self.assertEqual( changes, { 'added': { 'd': { 'x': '4' } },
+                                     'removed': [ 'c' ],
+                                     'modified': { 'a': { 'y': ( '2', '3' ) } } } )
+        self.assertTrue( merged is current )
+        # The record is updated in place, so references to it stay current.
+        self.assertTrue( merged['a'] is record )
+        self.assertEqual( merged, new )
+
+
+    def test_removed_field_and_plain_values( self ):
+        ( merged, changes ) = ssapi.merge_records( { 'a': { 'x': '1', 'y': '2' }, 'v': 'old' },
+                                                   { 'a': { 'x': '1' }, 'v': 'new' } )
+        self.assertEqual( changes['modified'], { 'a': { 'y': ( '2', None ) }, 'v': ( 'old', 'new' ) } )
+        self.assertEqual( merged, { 'a': { 'x': '1' }, 'v': 'new' } )
+
+
+    def test_no_changes( self ):
+        ( merged, changes ) = ssapi.merge_records( { 'a': { 'x': '1' } }, { 'a': { 'x': '1' } } )
+        self.assertFalse( ssapi.has_changes( changes ) )
+
+
+class FilesystemRefreshTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = JunctionBackend( list( filesets ) )
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.filesystem = ssapi.Filesystem( 'fs0', Lazy=True )
+        self.filesystem.filesets
+        self.subscriber = Subscriber()
+        self.filesystem.subscribe( self.subscriber )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_added_removed_and_changed( self ):
+        self.backend.filesets.remove( ( 'parked', '5', None, '0', '3' ) )
+        self.backend.filesets.append( ( 'c', '6', '/gpfs/fs0/projects/c', '1', '1' ) )
+        self.backend.filesets[4] = ( 'b', '4', '/gpfs/fs0/b', '1', '1' )
+        changes = self.filesystem.refresh()
+
+        self.assertEqual( list( changes.keys() ), [ 'filesets' ] )
+        filesets_changes = changes['filesets']
+        self.assertEqual( list( filesets_changes['added'].keys() ), [ 'c' ] )
+        self.assertEqual( filesets_changes['removed'], [ 'parked' ] )
+        self.assertEqual( filesets_changes['modified'], { 'b': { 'path': ( '/gpfs/fs0/projects/b', '/gpfs/fs0/b' ) } } )
+        self.assertEqual( self.filesystem.filesets['b']['path'], '/gpfs/fs0/b' )
+        self.assertFalse( 'parked' in self.filesystem.filesets )
+
+        self.assertEqual( len( self.subscriber.calls ), 1 )
+        ( obj, group, notified ) = self.subscriber.calls[0]
+        self.assertTrue( obj is self.filesystem )
+        self.assertEqual( group, 'filesets' )
+        self.assertTrue( notified is filesets_changes )
+
+
+    def test_unchanged_refresh_notifies_no_one( self ):
+        changes = self.filesystem.refresh( 'filesets' )
+        self.assertFalse( ssapi.has_changes( changes['filesets'] ) )
+        self.assertEqual( self.subscriber.calls, [] )
+
+
+    def test_unsubscribe( self ):
+        self.filesystem.unsubscribe( self.subscriber )
+        self.backend.filesets.pop()
+        self.assertTrue( ssapi.has_changes( self.filesystem.refresh( 'filesets' )['filesets'] ) )
+        self.assertEqual( self.subscriber.calls, [] )
+
+
+    def test_groups_not_loaded_are_not_fetched( self ):
+        self.assertEqual( self.filesystem.refresh(), { 'filesets': { 'added': {}, 'removed': [], 'modified': {} } } )
+        self.assertFalse( 'filesys' in self.filesystem.__dict__ )
+
+
+class SnapshotsRefreshTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = SnapshotBackend( { 'proj1': [ 'proj1_0', 'proj1_1' ] } )
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.snaps = ssapi.Snapshots( 'fs0', 'proj1' )
+        self.subscriber = Subscriber()
+        self.snaps.subscribe( self.subscriber )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_refresh( self ):
+        self.backend.snapshots['proj1'] = [ 'proj1_1', 'proj1_2' ]
+        changes = self.snaps.refresh()
+
+        self.assertEqual( list( changes['added'].keys() ), [ 'proj1_2' ] )
+        self.assertEqual( changes['removed'], [ 'proj1_0' ] )
+        self.assertEqual( self.snaps.snaplist, [ 'proj1_1', 'proj1_2' ] )
+        self.assertEqual( [ ( group, notified ) for ( obj, group, notified ) in self.subscriber.calls ], [ ( 'snapshots', changes ) ] )
+
+        self.assertFalse( ssapi.has_changes( self.snaps.refresh() ) )
+        self.assertEqual( len( self.subscriber.calls ), 1 )
+
+
+if __name__ == '__main__':
+   unittest.main()
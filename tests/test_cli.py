@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+   from StringIO import StringIO
+except ImportError:
+   from io import StringIO
+
+import ssapi
+import ssapi_cli
+from tests.test_state_cache import ClusterBackend
+
+
+class CommandLineTest( unittest.TestCase ):
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.environ = os.environ.get( 'XDG_CACHE_HOME' )
+        os.environ['XDG_CACHE_HOME'] = self.directory
+        self.backend = ClusterBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+        if self.environ is None:
+           del os.environ['XDG_CACHE_HOME']
+        else:
+           os.environ['XDG_CACHE_HOME'] = self.environ
+        shutil.rmtree( self.directory )
+
+
+    def run_cli( self, *argv ):
+        out = StringIO()
+        self.assertEqual( ssapi_cli.main( list( argv ), out ), 0 )
+        return json.loads( out.getvalue() )
+
+
+    def test_state_cache_is_written_and_used( self ):
+        first = self.run_cli( 'cluster', '--state-cache', '--fields', 'gpfsdevs' )
+        self.assertTrue( os.path.exists( ssapi.default_state_path() ) )
+        self.assertEqual( list( first.keys() ), [ 'gpfsdevs' ] )
+
+        del self.backend.commands[:]
+        second = self.run_cli( 'cluster', '--state-cache', '--fields', 'gpfsdevs,cluster_name' )
+        self.assertEqual( second['gpfsdevs'], first['gpfsdevs'] )
+        self.assertEqual( self.backend.commands, [] )
+
+
+    def test_fields_limit_the_commands( self ):
+        self.run_cli( 'cluster', '--fields', 'nodename' )
+        self.assertEqual( self.backend.commands, [] )
+        self.run_cli( 'cluster', '--fields', 'gpfsdevs' )
+        self.assertEqual( self.backend.commands, [ 'mmlsnsd' ] )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,77 @@
+import os
+import unittest
+
+import ssapi
+from tests.test_state_cache import ClusterBackend
+
+
+class FailingBackend( ClusterBackend ):
+    """
+    A ClusterBackend where the ( command, device ) pairs in failing return rc 1.
+    """
+    def __init__( self, failing ):
+        ClusterBackend.__init__( self )
+        self.failing = failing
+
+
+    def run( self, shellCommand ):
+        for ( command, device ) in self.failing:
+            if os.path.basename( shellCommand[0] ) == command and device in shellCommand[1:]:
+               return ( 1, '', 'mmcommon: File system {} is not known to the GPFS cluster.'.format( device ) )
+        return ClusterBackend.run( self, shellCommand )
+
+
+class ClusterTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = ClusterBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_lazy_attributes_run_only_their_commands( self ):
+        cluster = ssapi.Cluster( Lazy=True )
+        self.assertEqual( self.backend.commands, [] )
+        cluster.cluster_manager
+        cluster.is_cluster_manager
+        self.assertEqual( self.backend.commands, [ 'mmlsmgr' ] )
+        cluster.gpfsdevs
+        self.assertEqual( self.backend.commands, [ 'mmlsmgr', 'mmlsnsd' ] )
+
+
+    def test_refresh_runs_each_command_once( self ):
+        cluster = ssapi.Cluster()
+        self.assertEqual( sorted( self.backend.commands ), [ 'mmlscluster', 'mmlsmgr', 'mmlsnsd' ] )
+        del self.backend.commands[:]
+        cluster.refresh()
+        self.assertEqual( sorted( self.backend.commands ), [ 'mmlscluster', 'mmlsmgr', 'mmlsnsd' ] )
+
+
+    def test_refresh_is_cluster_manager_fetches_the_manager( self ):
+        cluster = ssapi.Cluster( Lazy=True )
+        cluster.is_cluster_manager
+        cluster.refresh( 'is_cluster_manager' )
+        self.assertEqual( self.backend.commands, [ 'mmlsmgr', 'mmlsmgr' ] )
+        self.assertEqual( cluster.is_cluster_manager, cluster.nodename in cluster.cluster_manager['node'] )
+
+
+    def test_load_filesystems_records_a_failing_device( self ):
+        for command in ( 'mmlsfs', 'mmlsfileset', 'mmlspool' ):
+            ssapi.set_command_backend( FailingBackend( set( [ ( command, 'fs1' ) ] ) ) )
+            cluster = ssapi.Cluster()
+            filesystems = cluster.load_filesystems()
+            self.assertEqual( list( filesystems.keys() ), [ 'fs0' ] )
+            self.assertTrue( filesystems['fs0'].filesets )
+            self.assertEqual( list( cluster.filesystem_errors.keys() ), [ 'fs1' ] )
+            self.assertTrue( isinstance( cluster.filesystem_errors['fs1'], ValueError ) )
+            self.assertTrue( command in str( cluster.filesystem_errors['fs1'] ) )
+
+
+    def test_unknown_group( self ):
+        self.assertRaises( ValueError, ssapi.Cluster( Lazy=True ).refresh, 'nope' )
+
+
+if __name__ == '__main__':
+   unittest.main()
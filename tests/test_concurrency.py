@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+import ssapi
+from tests.test_state_cache import ClusterBackend
+
+
+class Interrupted( BaseException ):
+    pass
+
+
+class OverlapBackend( ClusterBackend ):
+    """
+    Holds each command until wanted commands are running at the same time, or a
+    second has passed, and keeps the most that ran at once.
+    """
+    def __init__( self, wanted ):
+        ClusterBackend.__init__( self )
+        self.wanted = wanted
+        self.running = 0
+        self.most = 0
+        self.condition = threading.Condition()
+
+
+    def run( self, shellCommand ):
+        with self.condition:
+           self.running = self.running + 1
+           self.most = max( self.most, self.running )
+           self.condition.notify_all()
+           deadline = time.time() + 1
+           while self.running < self.wanted and time.time() < deadline:
+               self.condition.wait( 0.05 )
+        try:
+           return ClusterBackend.run( self, shellCommand )
+        finally:
+           with self.condition:
+              self.running = self.running - 1
+
+
+class ConcurrentLoadTest( unittest.TestCase ):
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def load( self, wanted, **kwargs ):
+        self.backend = OverlapBackend( wanted )
+        self.previous = ssapi.set_command_backend( self.backend )
+        return ssapi.Filesystem( 'fs0', **kwargs )
+
+
+    def test_commands_run_at_the_same_time( self ):
+        filesystem = self.load( 3 )
+        self.assertEqual( self.backend.most, 3 )
+        self.assertEqual( sorted( set( self.backend.commands ) ), [ 'mmlsfileset', 'mmlsfs', 'mmlspool' ] )
+        self.assertIn( 'root', filesystem.filesets )
+
+
+    def test_one_at_a_time( self ):
+        filesystem = self.load( 1, Concurrent=False )
+        self.assertEqual( self.backend.most, 1 )
+        self.assertTrue( filesystem.pools.pools )
+
+
+class RunBoundedTest( unittest.TestCase ):
+    def test_results_and_errors( self ):
+        def function( item ):
+            if item == 3:
+               raise ValueError( 'three' )
+            if item == 5:
+               raise Interrupted()
+            return item * 2
+
+        results = dict( ( item, ( result, error ) ) for ( item, result, error ) in ssapi.run_bounded( function, range( 8 ), 3 ) )
+        self.assertEqual( sorted( results ), list( range( 8 ) ) )
+        self.assertEqual( results[2], ( 4, None ) )
+        self.assertTrue( isinstance( results[3][1], ValueError ) )
+        self.assertTrue( isinstance( results[5][1], Interrupted ) )
+
+
+    def test_bounded( self ):
+        lock = threading.Lock()
+        state = { 'running': 0, 'most': 0 }
+
+        def function( item ):
+            with lock:
+               state['running'] = state['running'] + 1
+               state['most'] = max( state['most'], state['running'] )
+            time.sleep( 0.01 )
+            with lock:
+               state['running'] = state['running'] - 1
+
+        list( ssapi.run_bounded( function, range( 20 ), 4 ) )
+        self.assertEqual( state['most'], 4 )
+
+
+    def test_run_concurrently_reraises( self ):
+        def fails():
+            raise Interrupted()
+        self.assertRaises( Interrupted, ssapi.run_concurrently, lambda: None, fails )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import unittest
+
+import ssapi
+import ssapi_exporter
+from tests.test_cluster import FailingBackend
+from tests.test_state_cache import ClusterBackend
+
+try:
+   from StringIO import StringIO
+except ImportError:
+   from io import StringIO
+
+
+class PriorityBackend( ClusterBackend ):
+    """
+    Keeps the priority class and thread of every command.
+    """
+    def __init__( self ):
+        ClusterBackend.__init__( self )
+        self.priorities = []
+
+
+    def run( self, shellCommand ):
+        self.priorities.append( ( os.path.basename( shellCommand[0] ), getattr( ssapi.scheduler_state, 'priority', None ),
+                                  threading.current_thread().name ) )
+        return ClusterBackend.run( self, shellCommand )
+
+
+class ExporterTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = PriorityBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_every_dataset_runs_in_bulk( self ):
+        exporter = ssapi_exporter.Exporter( devices=[ 'fs0', 'fs1' ], max_workers=2 )
+        for ( name, interval, per_device, collect, render ) in ssapi_exporter.datasets:
+            self.assertTrue( exporter.refresh( name ), exporter.status[name] )
+
+        commands = set( command for ( command, priority, thread ) in self.backend.priorities )
+        self.assertTrue( set( [ 'mmlspool', 'mmlsfileset', 'mmlssnapshot', 'mmlsnsd' ] ) <= commands, commands )
+        workers = set( thread for ( command, priority, thread ) in self.backend.priorities )
+        self.assertTrue( len( workers ) > 1 )
+        for ( command, priority, thread ) in self.backend.priorities:
+            self.assertEqual( priority, 'bulk', command )
+        self.assertEqual( getattr( ssapi.scheduler_state, 'priority', None ), None )
+
+
+    def test_metrics_are_published( self ):
+        exporter = ssapi_exporter.Exporter( devices=[ 'fs0' ] )
+        exporter.refresh( 'pools' )
+        ( content_type, body ) = exporter.responses['/metrics']
+        self.assertIn( b'fs0', body )
+
+
+class ExporterErrorTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = FailingBackend( set() )
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.exporter = ssapi_exporter.Exporter( devices=[ 'fs0', 'fs1' ] )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_failed_command_keeps_the_last_good_data( self ):
+        for ( name, command ) in ( ( 'pools', 'mmlspool' ), ( 'filesets', 'mmlsfileset' ), ( 'snapshots', 'mmlssnapshot' ) ):
+            self.backend.failing.clear()
+            self.assertTrue( self.exporter.refresh( name ) )
+            good = self.exporter.data[name]['fs1']
+            self.assertTrue( good, name )
+            self.assertEqual( self.exporter.status[name]['errors'], 0 )
+
+            self.backend.failing.add( ( command, 'fs1' ) )
+            ( stdout, sys.stdout ) = ( sys.stdout, StringIO() )
+            try:
+               self.assertTrue( self.exporter.refresh( name ) )
+               printed = sys.stdout.getvalue()
+            finally:
+               sys.stdout = stdout
+
+            self.assertEqual( printed, '', name )
+            status = self.exporter.status[name]
+            self.assertEqual( list( status['device_errors'] ), [ 'fs1' ], name )
+            self.assertTrue( command in status['device_errors']['fs1'], status['device_errors'] )
+            self.assertEqual( status['errors'], 1, name )
+            self.assertTrue( self.exporter.data[name]['fs1'] is good, name )
+            self.assertTrue( self.exporter.data[name]['fs0'], name )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,104 @@
+import os
+import unittest
+
+import ssapi
+
+
+class JunctionBackend( ssapi.CommandBackend ):
+    """
+    Serves mmlsfileset for fs0 from filesets, a list of ( name, id, path, parent id,
+    inode space ), where a path of None is an unlinked fileset.
+    """
+    def __init__( self, filesets ):
+        self.filesets = filesets
+
+
+    def run( self, shellCommand ):
+        if os.path.basename( shellCommand[0] ) != 'mmlsfileset':
+           return ( 1, '', 'JunctionBackend: {} is not supported\n'.format( shellCommand[0] ) )
+        lines = [ 'mmlsfileset::HEADER:version:reserved:reserved:filesystemName:filesetName:id:status:path:parentId:inodeSpace:' ]
+        for ( name, fid, path, parent, inode_space ) in self.filesets:
+            lines.append( 'mmlsfileset::0:1:::fs0:{}:{}:{}:{}:{}:{}:'.format( name, fid, 'Linked' if path else 'Unlinked',
+                                                                            ( path or '--' ).replace( '/', '%2F' ), parent, inode_space ) )
+        return ( 0, '\n'.join( lines ) + '\n', '' )
+
+
+filesets = [ ( 'root', '0', '/gpfs/fs0', '--', '0' ),
+             ( 'projects', '1', '/gpfs/fs0/projects', '0', '1' ),
+             ( 'a', '2', '/gpfs/fs0/projects/a', '1', '1' ),
+             ( 'a_scratch', '3', '/gpfs/fs0/projects/a/scratch', '2', '2' ),
+             ( 'b', '4', '/gpfs/fs0/projects/b', '1', '1' ),
+             ( 'parked', '5', None, '0', '3' ) ]
+
+
+class FilesetPathTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = JunctionBackend( list( filesets ) )
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.filesystem = ssapi.Filesystem( 'fs0', Lazy=True )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_longest_junction_wins( self ):
+        owner = self.filesystem.fileset_for_path
+        self.assertEqual( owner( '/gpfs/fs0' ), 'root' )
+        self.assertEqual( owner( '/gpfs/fs0/home/user/file' ), 'root' )
+        self.assertEqual( owner( '/gpfs/fs0/projects' ), 'projects' )
+        self.assertEqual( owner( '/gpfs/fs0/projects/c/file' ), 'projects' )
+        self.assertEqual( owner( '/gpfs/fs0/projects/a/file' ), 'a' )
+        self.assertEqual( owner( '/gpfs/fs0/projects/a/scratch/deep/file' ), 'a_scratch' )
+        self.assertEqual( owner( '/gpfs/fs0/projects/b/scratch' ), 'b' )
+
+
+    def test_components_not_string_prefixes( self ):
+        owner = self.filesystem.fileset_for_path
+        self.assertEqual( owner( '/gpfs/fs0/projects/ab' ), 'projects' )
+        self.assertEqual( owner( '/gpfs/fs0/projects/a/scratch2' ), 'a' )
+
+
+    def test_paths_outside_the_filesystem( self ):
+        owner = self.filesystem.fileset_for_path
+        self.assertEqual( owner( '/gpfs' ), None )
+        self.assertEqual( owner( '/gpfs/fs1/projects/a' ), None )
+        self.assertEqual( owner( '/home/user' ), None )
+        self.assertEqual( owner( '/' ), None )
+
+
+    def test_trailing_and_repeated_slashes( self ):
+        owner = self.filesystem.fileset_for_path
+        self.assertEqual( owner( '/gpfs/fs0/projects/a/' ), 'a' )
+        self.assertEqual( owner( '/gpfs/fs0//projects//a/scratch/' ), 'a_scratch' )
+
+
+    def test_unlinked_filesets_own_no_paths( self ):
+        self.assertEqual( self.filesystem.fileset_for_path( '/gpfs/fs0/parked' ), 'root' )
+        self.assertFalse( 'parked' in self.filesystem.junctions.get( 'gpfs', {} ).get( 'fs0', {} ) )
+
+
+    def test_resolve_paths( self ):
+        lines = [ '/gpfs/fs0/projects/a/x\n', '/gpfs/fs0/projects/b/y\n', '/tmp/z' ]
+        self.assertEqual( list( self.filesystem.resolve_paths( lines ) ),
+                          [ ( '/gpfs/fs0/projects/a/x', 'a' ), ( '/gpfs/fs0/projects/b/y', 'b' ), ( '/tmp/z', None ) ] )
+
+
+    def test_indexes( self ):
+        self.assertEqual( self.filesystem.filesets_by_id['3'], 'a_scratch' )
+        self.assertEqual( self.filesystem.filesets_by_id['5'], 'parked' )
+        self.assertEqual( sorted( self.filesystem.filesets_by_inode_space['1'] ), [ 'a', 'b', 'projects' ] )
+        self.assertEqual( sorted( self.filesystem.filesets_by_parent['1'] ), [ 'a', 'b' ] )
+        self.assertEqual( self.filesystem.filesets_by_parent['--'], [ 'root' ] )
+
+
+    def test_indexes_follow_a_refresh( self ):
+        self.assertEqual( self.filesystem.fileset_for_path( '/gpfs/fs0/projects/b/c' ), 'b' )
+        self.backend.filesets.append( ( 'b_c', '6', '/gpfs/fs0/projects/b/c', '4', '4' ) )
+        self.filesystem.refresh( 'filesets' )
+        self.assertEqual( self.filesystem.fileset_for_path( '/gpfs/fs0/projects/b/c' ), 'b_c' )
+        self.assertEqual( self.filesystem.filesets_by_id['6'], 'b_c' )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,156 @@
+import sys
+import unittest
+
+import ssapi
+from tests.test_state_cache import ClusterBackend
+
+try:
+   from StringIO import StringIO
+except ImportError:
+   from io import StringIO
+
+
+class Recorder:
+    def __init__( self ):
+        self.events = []
+
+
+    def __call__( self, event ):
+        self.events.append( event )
+
+
+    def kinds( self ):
+        return [ event['event'] for event in self.events ]
+
+
+def broken_hook( event ):
+    raise RuntimeError( 'broken hook' )
+
+
+class HookTest( unittest.TestCase ):
+    def setUp( self ):
+        self.previous = ssapi.set_command_backend( ClusterBackend() )
+        self.recorder = Recorder()
+        ssapi.add_hook( self.recorder )
+
+
+    def tearDown( self ):
+        ssapi.remove_hook( self.recorder )
+        ssapi.remove_hook( broken_hook )
+        ssapi.disable_command_cache()
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_command_events( self ):
+        ( rc, cmd_out, cmd_err ) = ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )
+        self.assertEqual( self.recorder.kinds(), [ 'command_start', 'command_end' ] )
+        end = self.recorder.events[1]
+        self.assertEqual( end['command'], '/usr/lpp/mmfs/bin/mmlsnsd' )
+        self.assertEqual( ( end['rc'], end['stdout_bytes'], end['stderr_bytes'], end['cached'] ), ( 0, len( cmd_out ), 0, False ) )
+        self.assertTrue( end['seconds'] >= 0 )
+
+
+    def test_cached_and_parse_events( self ):
+        ssapi.enable_command_cache()
+        ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )
+        ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )
+        ends = [ event for event in self.recorder.events if event['event'] == 'command_end' ]
+        self.assertEqual( [ event['cached'] for event in ends ], [ False, True ] )
+
+        del self.recorder.events[:]
+        ssapi.parse_mmlsnsd( ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )[1] )
+        self.assertEqual( self.recorder.events[-1]['event'], 'parse' )
+        self.assertEqual( self.recorder.events[-1]['parser'], 'parse_mmlsnsd' )
+
+
+    def test_removed_hook_is_not_called( self ):
+        ssapi.remove_hook( self.recorder )
+        ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )
+        self.assertEqual( self.recorder.events, [] )
+
+
+    def test_hook_errors_do_not_propagate( self ):
+        ssapi.remove_hook( self.recorder )
+        ssapi.add_hook( broken_hook )
+        ssapi.add_hook( self.recorder )
+        ( rc, cmd_out, cmd_err ) = ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )
+        self.assertEqual( rc, 0 )
+        # The hooks after the broken one still see every event.
+        self.assertEqual( self.recorder.kinds(), [ 'command_start', 'command_end' ] )
+        filesystem = ssapi.Filesystem( 'fs0' )
+        self.assertTrue( filesystem.filesets )
+
+
+    def test_hook_errors_are_printed_with_debug( self ):
+        ssapi.add_hook( broken_hook )
+        ( stdout, sys.stdout ) = ( sys.stdout, StringIO() )
+        try:
+           ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd' )
+           quiet = sys.stdout.getvalue()
+           ssapi.execute_command( '/usr/lpp/mmfs/bin/mmlsnsd', Debug=True )
+           printed = sys.stdout.getvalue()
+        finally:
+           sys.stdout = stdout
+        self.assertEqual( quiet, '' )
+        self.assertTrue( 'DEBUG: Hook' in printed and 'failed on command_start: broken hook' in printed, printed )
+        self.assertTrue( 'failed on command_end: broken hook' in printed, printed )
+
+
+class LatencyHistogramTest( unittest.TestCase ):
+    def setUp( self ):
+        self.histogram = ssapi.LatencyHistogram( buckets=( 0.1, 1.0, 10.0 ) )
+
+
+    def command( self, seconds, command='/usr/lpp/mmfs/bin/mmlsfileset fs0 -Y', cached=False ):
+        self.histogram( { 'event': 'command_end', 'command': command, 'seconds': seconds, 'rc': 0,
+                          'stdout_bytes': 0, 'stderr_bytes': 0, 'cached': cached } )
+
+
+    def test_buckets_and_statistics( self ):
+        for seconds in ( 0.05, 0.1, 0.5, 0.5, 2.0, 20.0 ):
+            self.command( seconds )
+        entry = self.histogram.summary()['commands']['mmlsfileset']
+
+        # A sample equal to a bound is in that bucket.
+        self.assertEqual( entry['buckets'], [ 2, 2, 1, 1 ] )
+        self.assertEqual( ( entry['count'], entry['min'], entry['max'] ), ( 6, 0.05, 20.0 ) )
+        self.assertAlmostEqual( entry['mean'], 23.15 / 6 )
+        self.assertEqual( entry['p50'], 1.0 )
+        self.assertEqual( entry['p90'], None )
+        self.assertEqual( self.histogram.percentile( self.histogram.commands['mmlsfileset'], 0.3 ), 0.1 )
+
+
+    def test_commands_parsers_and_cached_are_separate( self ):
+        self.command( 0.2 )
+        self.command( 0.2, command='/usr/lpp/mmfs/bin/mmlsnsd' )
+        self.command( 0.0, cached=True )
+        self.histogram( { 'event': 'parse', 'parser': 'parse_mmlsfileset', 'seconds': 0.01 } )
+        self.histogram( { 'event': 'command_start', 'command': 'mmlsnsd', 'time': 0 } )
+        summary = self.histogram.summary()
+
+        self.assertEqual( sorted( summary['commands'] ), [ 'mmlsfileset', 'mmlsnsd' ] )
+        self.assertEqual( summary['commands']['mmlsfileset']['count'], 1 )
+        self.assertEqual( summary['cached'], { 'mmlsfileset': 1 } )
+        self.assertEqual( summary['parsers']['parse_mmlsfileset']['buckets'], [ 1, 0, 0, 0 ] )
+        self.assertEqual( summary['buckets'], ( 0.1, 1.0, 10.0 ) )
+
+        self.histogram.reset()
+        self.assertEqual( self.histogram.summary()['commands'], {} )
+
+
+    def test_as_a_hook( self ):
+        previous = ssapi.set_command_backend( ClusterBackend() )
+        histogram = ssapi.LatencyHistogram()
+        ssapi.add_hook( histogram )
+        try:
+           ssapi.Filesystem( 'fs0' )
+        finally:
+           ssapi.remove_hook( histogram )
+           ssapi.set_command_backend( previous )
+        summary = histogram.summary()
+        self.assertEqual( sorted( summary['commands'] ), [ 'mmlsfileset', 'mmlsfs', 'mmlspool' ] )
+        self.assertTrue( 'parse_mmlsfileset' in summary['parsers'] )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import ssapi
+
+
+def nsd( usage, *servers ):
+    return { 'usage': usage, 'servers': list( servers ) }
+
+
+# Three NSD servers sharing most disks, a few single-server NSDs, and a local read
+# only cache disk on a client.
+nsds = { 'd1': nsd( 'fs0', 'n1', 'n2' ),
+         'd2': nsd( 'fs0', 'n2', 'n1' ),
+         'd3': nsd( 'fs0', 'n1' ),
+         'd4': nsd( 'fs1', 'n3', 'n1', 'n2' ),
+         'd5': nsd( 'fs1', 'n3' ),
+         'm1': nsd( 'free', 'n2', 'n3' ),
+         'c1': nsd( 'lroc', 'n4' ) }
+
+
+class NsdsTest( unittest.TestCase ):
+    def setUp( self ):
+        self.nsds = ssapi.Nsds( State=( nsds, [ 'fs0', 'fs1' ] ) )
+
+
+    def test_indexes( self ):
+        by_server = dict( ( server, sorted( names ) ) for ( server, names ) in self.nsds.nsds_by_server.items() )
+        self.assertEqual( by_server, { 'n1': [ 'd1', 'd2', 'd3', 'd4' ], 'n2': [ 'd1', 'd2', 'd4', 'm1' ],
+                                       'n3': [ 'd4', 'd5', 'm1' ], 'n4': [ 'c1' ] } )
+        self.assertEqual( sorted( self.nsds.nsds_by_filesystem['fs1'] ), [ 'd4', 'd5' ] )
+        self.assertEqual( self.nsds.nsds_by_filesystem['lroc'], [ 'c1' ] )
+        self.assertEqual( len( self.nsds.nsds_by_position ), 3 )
+        self.assertEqual( sorted( self.nsds.nsds_by_position[0]['n1'] ), [ 'd1', 'd3' ] )
+        self.assertEqual( sorted( self.nsds.nsds_by_position[1]['n1'] ), [ 'd2', 'd4' ] )
+        self.assertEqual( self.nsds.nsds_by_position[2], { 'n2': [ 'd4' ] } )
+
+
+    def test_indexes_are_dropped( self ):
+        self.nsds.nsds_by_server
+        self.nsds.drop_server_indexes()
+        self.assertFalse( 'nsds_by_server' in self.nsds.__dict__ )
+        self.assertEqual( sorted( self.nsds.nsds_by_server['n4'] ), [ 'c1' ] )
+        self.assertRaises( AttributeError, getattr, self.nsds, 'nope' )
+
+
+    def test_one_server_down( self ):
+        impact = self.nsds.failure_impact( 'n1' )
+        self.assertEqual( impact['lost'], [ 'd3' ] )
+        self.assertEqual( impact['failover'], { 'd1': 'n2' } )
+        # d4 is served by n1 as a backup, so it is affected but nothing changes.
+        self.assertEqual( impact['filesystems'], { 'fs0': { 'lost': [ 'd3' ], 'failover': [ 'd1' ] },
+                                                   'fs1': { 'lost': [], 'failover': [] } } )
+
+
+    def test_several_servers_down( self ):
+        impact = self.nsds.failure_impact( [ 'n1', 'n2' ] )
+        self.assertEqual( impact['lost'], [ 'd1', 'd2', 'd3' ] )
+        # The next server in the list that is still up takes over.
+        self.assertEqual( impact['failover'], { 'm1': 'n3' } )
+        self.assertEqual( impact['filesystems']['fs0'], { 'lost': [ 'd1', 'd2', 'd3' ], 'failover': [] } )
+        self.assertEqual( impact['filesystems']['free'], { 'lost': [], 'failover': [ 'm1' ] } )
+
+        impact = self.nsds.failure_impact( [ 'n1', 'n3' ] )
+        self.assertEqual( impact['lost'], [ 'd3', 'd5' ] )
+        self.assertEqual( impact['failover'], { 'd1': 'n2', 'd4': 'n2' } )
+
+
+    def test_unknown_server_down( self ):
+        self.assertEqual( self.nsds.failure_impact( 'n9' ), { 'lost': [], 'failover': {}, 'filesystems': {} } )
+
+
+    def test_server_load( self ):
+        self.assertEqual( self.nsds.server_load(), { 'n1': { 'primary': 2, 'backup': 2, 'total': 4 },
+                                                     'n2': { 'primary': 2, 'backup': 2, 'total': 4 },
+                                                     'n3': { 'primary': 2, 'backup': 1, 'total': 3 },
+                                                     'n4': { 'primary': 1, 'backup': 0, 'total': 1 } } )
+
+
+    def test_single_points_of_failure( self ):
+        self.assertEqual( self.nsds.single_points_of_failure(), [ 'd3', 'd5' ] )
+        self.assertEqual( self.nsds.single_points_of_failure( Local=True ), [ 'c1', 'd3', 'd5' ] )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import unittest
+
+import ssapi
+
+
+fixtures = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'fixtures' )
+
+
+def load_expected():
+    f = open( os.path.join( fixtures, 'expected.json' ), 'r' )
+    try:
+       return json.load( f )
+    finally:
+       f.close()
+
+
+def normalize( value ):
+    """
+    Return value as it reads back from JSON, ie: tuples become lists.
+    """
+    return json.loads( json.dumps( value, sort_keys=True ) )
+
+
+def records( table ):
+    return dict( ( name, dict( record ) ) for ( name, record ) in table.items() )
+
+
+class ReplayTest( unittest.TestCase ):
+    """
+    The classes are built from recorded mm output, served by a ReplayBackend, and
+    compared with what they returned before the parsers were rewritten.
+    """
+    def setUp( self ):
+        self.previous = ssapi.set_command_backend( ssapi.ReplayBackend( fixtures ) )
+        self.expected = load_expected()
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def check( self, key, value ):
+        self.assertEqual( normalize( value ), self.expected[key], key )
+
+
+    def test_cluster( self ):
+        cluster = ssapi.Cluster()
+        self.check( 'ci', cluster.cluster_info )
+        self.check( 'cm', cluster.cluster_manager )
+        self.check( 'nn', cluster.nodename )
+        self.check( 'icm', cluster.is_cluster_manager )
+        self.check( 'devs', sorted( cluster.gpfsdevs ) )
+        self.check( 'nsds', cluster.nsds.nsds )
+
+
+    def test_lazy_cluster( self ):
+        cluster = ssapi.Cluster( Lazy=True )
+        self.check( 'devs', sorted( cluster.gpfsdevs ) )
+        self.check( 'ci', cluster.cluster_info )
+
+
+    def test_filesystem( self ):
+        filesystem = ssapi.Filesystem( 'fs0' )
+        self.check( 'filesys', filesystem.filesys )
+        self.check( 'filesets', records( filesystem.filesets ) )
+        self.check( 'pools', filesystem.pools.pools )
+
+
+    def test_compact_filesystem( self ):
+        compact = ssapi.Filesystem( 'fs0', Compact=True )
+        self.assertTrue( isinstance( compact.filesets, ssapi.RecordTable ) )
+        # The numeric fields are integers in a RecordTable.
+        converted = dict( ( name, dict( ( key, str( value ) ) for ( key, value ) in record.items() ) )
+                          for ( name, record ) in compact.filesets.items() )
+        self.check( 'filesets', converted )
+        self.assertEqual( compact.filesets['proj1']['maxInodes'], 100000 )
+
+
+    def test_snapshots( self ):
+        fileset = ssapi.Snapshots( 'fs0', 'proj1' )
+        self.check( 's1', records( fileset.snapshots ) )
+        self.check( 's1l', list( fileset.snaplist ) )
+        every = ssapi.Snapshots( 'fs0', '' )
+        self.check( 's2', records( every.snapshots ) )
+        self.check( 's2l', list( every.snaplist ) )
+
+
+    def test_quotas( self ):
+        quotas = list( ssapi.Quotas( 'fs0' ) )
+        self.assertEqual( len( quotas ), 10 )
+        self.assertEqual( quotas[0]['filesystemName'], 'fs0' )
+        self.assertEqual( quotas[0]['name'], 'user0' )
+        self.assertEqual( quotas[1]['blockUsage'], 300 )
+        compact = ssapi.Quotas( 'fs0', Compact=True )
+        self.assertEqual( len( compact.table ), 10 )
+
+
+    def test_missing_fixture( self ):
+        self.assertRaises( ValueError, ssapi.Filesystem, 'fs9' )
+
+
+    @unittest.skipIf( sys.version_info < ( 3, 7 ), 'ssapi_async needs Python 3.7' )
+    def test_async_parity( self ):
+        import asyncio
+        import ssapi_async
+        loop = asyncio.new_event_loop()
+        try:
+           filesystem = loop.run_until_complete( ssapi_async.Filesystem.load( 'fs0' ) )
+           cluster = loop.run_until_complete( ssapi_async.Cluster.load() )
+        finally:
+           loop.close()
+        self.check( 'filesets', records( filesystem.filesets ) )
+        self.check( 'pools', filesystem.pools.pools )
+        self.check( 'ci', cluster.cluster_info )
+        self.check( 'devs', sorted( cluster.gpfsdevs ) )
+
+
+class EncodedStringTest( unittest.TestCase ):
+    def test_ascii( self ):
+        self.assertEqual( ssapi.replace_encoded_strings( 'a%3Ab%20c%25' ), 'a:b c%' )
+        self.assertEqual( ssapi.replace_encoded_strings( 'plain' ), 'plain' )
+
+
+    def test_non_ascii( self ):
+        # The escapes are the UTF-8 bytes of each character, not code points.
+        ( cafe, nihon ) = ( u'caf\u00e9', u'\u65e5\u672c' )
+        if str is bytes:
+           ( cafe, nihon ) = ( cafe.encode( 'utf-8' ), nihon.encode( 'utf-8' ) )
+        self.assertEqual( ssapi.replace_encoded_strings( 'caf%C3%A9' ), cafe )
+        self.assertEqual( ssapi.replace_encoded_strings( '%E6%97%A5%E6%9C%AC' ), nihon )
+        record = next( ssapi.iter_mm_records( [ 'mmlsfileset::HEADER:version:reserved:reserved:comment:',
+                                                'mmlsfileset::0:1:::caf%C3%A9:' ] ) )
+        self.assertEqual( record['comment'], cafe )
+
+
+    @unittest.skipIf( str is bytes, 'Python 2 returns the bytes' )
+    def test_invalid_utf8_is_kept( self ):
+        value = ssapi.replace_encoded_strings( 'x%FFy' )
+        self.assertEqual( value.encode( 'utf-8', 'surrogateescape' ), b'x\xffy' )
+
+
+if __name__ == '__main__':
+   unittest.main()
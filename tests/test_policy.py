@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import ssapi
+
+
+def list_lines( count ):
+    """
+    Lines of a list file that show ssapi.policy_show_attributes, of varying length.
+    """
+    lines = []
+    for idx in range( count ):
+        fileset = 'root' if idx % 5 == 0 else 'proj{}'.format( idx % 3 )
+        path = '/gpfs/fs0/{}/dir%20{}/{}'.format( fileset, idx % 7, 'f' * ( idx % 11 ) )
+        lines.append( '{} {} 0  {} {} {} {} {} -- {}'.format( idx + 3, idx * 31, fileset, 1000 + idx % 4, 100,
+                                                              idx * 3, idx * 3072, path ).encode( 'ascii' ) )
+    return lines
+
+
+class PolicyListTest( unittest.TestCase ):
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.lines = list_lines( 60 )
+        self.path = self.write( 'scan.list.ssapi', b'\n'.join( self.lines ) + b'\n' )
+
+
+    def tearDown( self ):
+        shutil.rmtree( self.directory, ignore_errors=True )
+
+
+    def write( self, name, data ):
+        path = os.path.join( self.directory, name )
+        f = open( path, 'wb' )
+        try:
+           f.write( data )
+        finally:
+           f.close()
+        return path
+
+
+    def expected( self, group_by, value ):
+        totals = dict( ( name, {} ) for name in group_by )
+        for ( inode, generation, snapid, attributes, path ) in ssapi.PolicyList( self.path ):
+            for name in group_by:
+                key = attributes[ssapi.policy_show_attributes.index( name )]
+                entry = totals[name].setdefault( key, { 'count': 0, 'total': 0 } )
+                entry['count'] = entry['count'] + 1
+                if value is not None:
+                   entry['total'] = entry['total'] + int( attributes[ssapi.policy_show_attributes.index( value )] )
+        return totals
+
+
+    def test_every_split_reads_each_line_once( self ):
+        size = os.path.getsize( self.path )
+        for split in range( size + 1 ):
+            lines = []
+            for ( start, end ) in ( ( 0, split ), ( split, size ) ):
+                for chunk in ssapi.iter_policy_chunks( self.path, start, end, chunk_bytes=17 ):
+                    lines.extend( chunk )
+            self.assertEqual( lines, self.lines, split )
+
+
+    def test_no_trailing_newline( self ):
+        path = self.write( 'partial.list.ssapi', b'\n'.join( self.lines ) )
+        size = os.path.getsize( path )
+        for split in ( 1, size // 2, size - 1 ):
+            lines = []
+            for ( start, end ) in ( ( 0, split ), ( split, size ) ):
+                for chunk in ssapi.iter_policy_chunks( path, start, end ):
+                    lines.extend( chunk )
+            self.assertEqual( lines, self.lines, split )
+
+
+    def test_aggregate_over_small_ranges( self ):
+        scan = ssapi.PolicyList( self.path )
+        for ( group_by, value ) in ( ( ( 'FILESET_NAME', 'USER_ID' ), 'KB_ALLOCATED' ),
+                                     ( ( 'GROUP_ID', ), None ),
+                                     ( ( 'USER_ID', ), 'FILE_SIZE' ) ):
+            expected = self.expected( group_by, value )
+            for range_bytes in ( 1, 7, 64, 1000, 1 << 20 ):
+                self.assertEqual( scan.aggregate( group_by, value, workers=1, range_bytes=range_bytes ), expected,
+                                  ( group_by, range_bytes ) )
+            self.assertEqual( scan.aggregate( group_by, value, workers=3, range_bytes=50 ), expected, group_by )
+
+
+    def test_aggregate_several_files( self ):
+        other = self.write( 'other.list.ssapi', b'\n'.join( list_lines( 9 ) ) + b'\n' )
+        totals = ssapi.PolicyList( [ self.path, other ] ).aggregate( ( 'FILESET_NAME', ), None, workers=1, range_bytes=40 )
+        self.assertEqual( sum( entry['count'] for entry in totals['FILESET_NAME'].values() ), 69 )
+
+
+    def test_aggregate_errors( self ):
+        scan = ssapi.PolicyList( self.path )
+        self.assertRaises( ValueError, scan.aggregate, () )
+        self.assertRaises( ValueError, scan.aggregate, ( 'MODE', ) )
+        self.assertEqual( ssapi.PolicyList( [] ).aggregate( ( 'USER_ID', ) ), { 'USER_ID': {} } )
+
+
+    def test_records( self ):
+        path = self.write( 'escaped.list.ssapi', b'5 1 0  proj1 1000 100 4 4096 -- /gpfs/fs0/a%20b/c%25d/caf%C3%A9/x%FFy\n' )
+        records = list( ssapi.PolicyList( path ) )
+        self.assertEqual( len( records ), 1 )
+        ( inode, generation, snapid, attributes, name ) = records[0]
+        self.assertEqual( ( inode, generation, snapid ), ( 5, 1, 0 ) )
+        self.assertEqual( attributes, [ 'proj1', '1000', '100', '4', '4096' ] )
+        if str is bytes:
+           self.assertEqual( name, '/gpfs/fs0/a b/c%d/caf\xc3\xa9/x\xffy' )
+        else:
+           self.assertEqual( name, u'/gpfs/fs0/a b/c%d/café/x\udcffy' )
+
+
+    def test_policy_rules( self ):
+        rules = ssapi.policy_rules( ( 'FILESET_NAME', 'KB_ALLOCATED' ), "FILE_SIZE > 0" )
+        self.assertEqual( rules, "RULE EXTERNAL LIST 'ssapi' EXEC '' ESCAPE '%'\n"
+                                 "RULE 'ssapi_files' LIST 'ssapi' SHOW( VARCHAR(FILESET_NAME) || ' ' || VARCHAR(KB_ALLOCATED) )"
+                                 " WHERE FILE_SIZE > 0\n" )
+
+
+    def test_remove( self ):
+        workdir = tempfile.mkdtemp( dir=self.directory )
+        path = os.path.join( workdir, 'ssapi.list.ssapi' )
+        shutil.copy( self.path, path )
+        ssapi.PolicyList( path, workdir=workdir ).remove()
+        self.assertFalse( os.path.exists( workdir ) )
+
+
+if __name__ == '__main__':
+   unittest.main()
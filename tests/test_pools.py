@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+import unittest
+
+import ssapi
+
+
+class PoolBackend( ssapi.CommandBackend ):
+    """
+    Runs mmlspool for the devices in sizes, a dictionary of device -> data size in
+    KB.  Every mmlspool of a device takes step KB more of its data pool, and the
+    devices in failing fail.  samples counts the mmlspool runs of each device.
+    """
+    def __init__( self, sizes, step=1000 ):
+        self.sizes = sizes
+        self.step = step
+        self.failing = set()
+        self.samples = {}
+        self.lock = threading.Lock()
+
+
+    def run( self, shellCommand ):
+        if os.path.basename( shellCommand[0] ) != 'mmlspool':
+           return ( 1, '', 'PoolBackend: {} is not supported\n'.format( shellCommand[0] ) )
+        device = shellCommand[1]
+        with self.lock:
+           if device in self.failing or device not in self.sizes:
+              return ( 1, '', 'mmlspool: File system {} is not known to the GPFS cluster.\n'.format( device ) )
+           count = self.samples[device] = self.samples.get( device, 0 ) + 1
+        size = self.sizes[device]
+        free = size // 2 - count * self.step
+        lines = [ "Storage pools in file system at '/gpfs/{}':".format( device ),
+                  'Name                    Id   BlkSize Data Meta Total Data in (KB)   Free Data in (KB)   Total Meta in (KB)    Free Meta in (KB)',
+                  'system                   0    4 MB  yes  yes  {} {} ( 50%) 10000 5000 ( 50%)'.format( size, free ) ]
+        return ( 0, '\n'.join( lines ) + '\n', '' )
+
+
+    def count( self, device ):
+        with self.lock:
+           return self.samples.get( device, 0 )
+
+
+def wait_for( condition, timeout=5.0 ):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep( 0.005 )
+    return condition()
+
+
+def pool( used, free ):
+    return { 'datasize': str( used + free ), 'datafree': str( free ), 'metasize': '1000', 'metafree': '500' }
+
+
+class PoolSeriesTest( unittest.TestCase ):
+    def test_bad_sample_keeps_buffers_aligned( self ):
+        series = ssapi.PoolSeries( 8 )
+        series.append( 0.0, pool( 100, 900 ) )
+        bad = pool( 150, 850 )
+        bad['metafree'] = 'n/a'
+        self.assertRaises( ValueError, series.append, 60.0, bad )
+        series.append( 120.0, pool( 200, 800 ) )
+
+        ( times, values ) = series.window( 0 )
+        self.assertEqual( list( times ), [ 0.0, 120.0 ] )
+        for field in series.fields:
+            self.assertEqual( len( values[field] ), 2, field )
+        self.assertEqual( list( values['datafree'] ), [ 900.0, 800.0 ] )
+
+
+    def test_forecast( self ):
+        series = ssapi.PoolSeries( 4 )
+        for idx in range( 6 ):
+            series.append( idx * 10.0, pool( 100 + idx * 10, 900 - idx * 10 ) )
+        forecast = series.forecast( 0 )
+        self.assertEqual( forecast['samples'], 4 )
+        self.assertAlmostEqual( forecast['data_fill_rate'], 1.0 )
+        self.assertAlmostEqual( forecast['data_time_to_full'], 850.0 )
+        self.assertEqual( forecast['meta_time_to_full'], None )
+
+
+class PoolSamplerTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = PoolBackend( { 'fs0': 1000000, 'fs1': 2000000 } )
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.sampler = None
+
+
+    def tearDown( self ):
+        if self.sampler is not None:
+           self.sampler.stop( 5 )
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_sample_and_forecast( self ):
+        self.sampler = ssapi.PoolSampler( [ 'fs0', 'fs1' ] )
+        self.sampler.sample()
+        time.sleep( 0.01 )
+        self.sampler.sample()
+
+        self.assertEqual( sorted( self.sampler.pools ), [ ( 'fs0', 'system' ), ( 'fs1', 'system' ) ] )
+        forecast = self.sampler.forecast()
+        self.assertEqual( sorted( forecast ), [ 'fs0', 'fs1' ] )
+        self.assertEqual( forecast['fs0']['system']['samples'], 2 )
+        self.assertTrue( forecast['fs0']['system']['data_fill_rate'] > 0 )
+        self.assertEqual( list( self.sampler.forecast( 'fs1' ).keys() ), [ 'fs1' ] )
+        filling = self.sampler.filling( 1e9 )
+        self.assertEqual( sorted( ( device, kind ) for ( device, name, kind, seconds ) in filling ), [ ( 'fs0', 'data' ), ( 'fs1', 'data' ) ] )
+        # fs0 is half the size, so it fills up first.
+        self.assertEqual( filling[0][0], 'fs0' )
+
+
+    def test_failing_sample( self ):
+        self.backend.failing.add( 'fs1' )
+        self.sampler = ssapi.PoolSampler( [ 'fs0', 'fs1' ] )
+        self.sampler.sample()
+
+        self.assertEqual( list( self.sampler.errors.keys() ), [ 'fs1' ] )
+        self.assertTrue( 'mmlspool' in str( self.sampler.errors['fs1'] ) )
+        self.assertEqual( sorted( self.sampler.pools ), [ ( 'fs0', 'system' ) ] )
+
+        self.backend.failing.discard( 'fs1' )
+        self.sampler.sample()
+        self.assertEqual( self.sampler.errors, {} )
+        self.assertEqual( sorted( self.sampler.pools ), [ ( 'fs0', 'system' ), ( 'fs1', 'system' ) ] )
+
+
+    def test_start_and_stop( self ):
+        self.sampler = ssapi.PoolSampler( 'fs0', interval=0.01 )
+        self.sampler.start()
+        thread = self.sampler.thread
+        self.sampler.start()
+        self.assertTrue( self.sampler.thread is thread )
+        self.assertTrue( wait_for( lambda: self.backend.count( 'fs0' ) >= 3 ) )
+
+        self.sampler.stop( 5 )
+        self.assertEqual( self.sampler.thread, None )
+        self.assertFalse( thread.is_alive() )
+        count = self.backend.count( 'fs0' )
+        time.sleep( 0.05 )
+        self.assertEqual( self.backend.count( 'fs0' ), count )
+
+        # It can be started again.
+        self.sampler.start()
+        self.assertTrue( wait_for( lambda: self.backend.count( 'fs0' ) > count ) )
+
+
+    def test_interval( self ):
+        self.sampler = ssapi.PoolSampler( 'fs0', interval=30 )
+        self.sampler.start()
+        self.assertTrue( wait_for( lambda: self.backend.count( 'fs0' ) == 1 ) )
+        time.sleep( 0.1 )
+        self.assertEqual( self.backend.count( 'fs0' ), 1 )
+
+        # stop() does not wait for the rest of the interval.
+        start = time.time()
+        self.sampler.stop( 5 )
+        self.assertTrue( time.time() - start < 1.0 )
+
+
+def without_numpy( function, *args ):
+    """
+    Call function with the capacity report using its plain Python path.
+    """
+    previous = ssapi.numpy
+    ssapi.numpy = None
+    try:
+       return function( *args )
+    finally:
+       ssapi.numpy = previous
+
+
+def summary_of( pools_by_device, threshold=90.0 ):
+    return ssapi.capacity_summary( ssapi.capacity_table( pools_by_device ), threshold )
+
+
+capacity_pools = { 'fs0': { 'system': pool( 900, 100 ), 'data1': pool( 500, 500 ) },
+                   'fs1': { 'system': pool( 950, 50 ), 'data1': pool( 0, 4000 ) } }
+capacity_pools['fs1']['data1']['metasize'] = '0'
+capacity_pools['fs1']['data1']['metafree'] = '0'
+
+
+class CapacityReportTest( unittest.TestCase ):
+    def test_plain_summary( self ):
+        table = without_numpy( ssapi.capacity_table, capacity_pools )
+        self.assertTrue( isinstance( table, ssapi.CapacityTable ) )
+        self.assertEqual( list( table['device'] ), [ 'fs0', 'fs0', 'fs1', 'fs1' ] )
+        self.assertEqual( list( table['pool'] ), [ 'data1', 'system', 'data1', 'system' ] )
+
+        summary = without_numpy( summary_of, capacity_pools )
+        self.assertEqual( summary['pools'], 4 )
+        self.assertEqual( summary['totals']['datasize'], 7000.0 )
+        self.assertEqual( summary['totals']['datafree'], 4650.0 )
+        self.assertEqual( summary['devices']['fs1']['metasize'], 1000.0 )
+        self.assertEqual( summary['devices']['fs0']['datapctused'], 70.0 )
+        self.assertEqual( summary['breaches'], [ ( 'fs1', 'system', 'data', 95.0 ), ( 'fs0', 'system', 'data', 90.0 ) ] )
+        self.assertEqual( summary['datapctused'], { 'p50': 90.0, 'p90': 95.0, 'p99': 95.0, 'max': 95.0 } )
+        # The pool without metadata is left out of the metadata percentiles.
+        self.assertEqual( summary['metapctused']['max'], 50.0 )
+
+
+    def test_plain_empty( self ):
+        summary = without_numpy( summary_of, {} )
+        self.assertEqual( summary['pools'], 0 )
+        self.assertEqual( summary['devices'], {} )
+        self.assertEqual( summary['breaches'], [] )
+        for field in ssapi.capacity_size_fields:
+            self.assertTrue( isinstance( summary['totals'][field], float ), field )
+            self.assertEqual( summary['totals'][field], 0.0 )
+        self.assertEqual( summary['totals']['datapctused'], None )
+        self.assertEqual( summary['datapctused'], { 'p50': None, 'p90': None, 'p99': None, 'max': None } )
+
+
+    @unittest.skipIf( ssapi.import_numpy() is None, 'NumPy is not installed' )
+    def test_numpy_and_plain_match( self ):
+        for pools_by_device in ( capacity_pools, {}, { 'fs0': { 'system': pool( 10, 90 ) } } ):
+            expected = without_numpy( summary_of, pools_by_device )
+            summary = summary_of( pools_by_device )
+            self.assertEqual( summary, expected )
+            for field in ssapi.capacity_size_fields:
+                self.assertEqual( type( summary['totals'][field] ), type( expected['totals'][field] ) )
+        table = ssapi.capacity_table( capacity_pools )
+        self.assertEqual( list( table['datapctused'] )[:3], list( without_numpy( ssapi.capacity_table, capacity_pools )['datapctused'] )[:3] )
+
+
+    def test_report_records_failing_devices( self ):
+        backend = PoolBackend( { 'fs0': 1000000, 'fs1': 2000000 } )
+        backend.failing.add( 'fs1' )
+        previous = ssapi.set_command_backend( backend )
+        try:
+           ( table, summary ) = ssapi.Cluster( Lazy=True ).capacity_report( devices=[ 'fs0', 'fs1', 'fs9' ] )
+        finally:
+           ssapi.set_command_backend( previous )
+
+        self.assertEqual( sorted( summary['errors'] ), [ 'fs1', 'fs9' ] )
+        self.assertTrue( 'mmlspool' in str( summary['errors']['fs1'] ) )
+        self.assertEqual( list( table['device'] ), [ 'fs0' ] )
+        self.assertEqual( list( summary['devices'] ), [ 'fs0' ] )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,126 @@
+import os
+import threading
+import unittest
+
+import ssapi
+
+
+class FilesetBackend( ssapi.CommandBackend ):
+    """
+    Keeps the filesets of fs0 and runs mmcrfileset, mmlinkfileset, mmsetquota and
+    mmlsfileset against them.  A junction can only be linked in a directory that
+    exists.  failures[( command, fileset )] is the number of times that command
+    fails as busy before it works.
+    """
+    def __init__( self ):
+        self.filesets = { 'root': '/gpfs/fs0' }
+        self.failures = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+
+    def run( self, shellCommand ):
+        command = os.path.basename( shellCommand[0] )
+        args = shellCommand[1:]
+        with self.lock:
+           self.calls.append( ( command, args ) )
+           if command == 'mmlsfileset':
+              return ( 0, self.mmlsfileset(), '' )
+
+           name = args[1] if command != 'mmsetquota' else args[0].split(':')[1]
+           if self.failures.get( ( command, name ), 0 ):
+              self.failures[( command, name )] -= 1
+              return ( 1, '', '{}: Another mm command is running.\n'.format( command ) )
+
+           if command == 'mmcrfileset':
+              if name in self.filesets:
+                 return ( 1, '', 'Fileset {} already exists.\n'.format( name ) )
+              self.filesets[name] = None
+           elif command == 'mmlinkfileset':
+              junction = args[args.index( '-J' ) + 1].rstrip( '/' )
+              if os.path.dirname( junction ) not in [ path for path in self.filesets.values() if path ]:
+                 return ( 1, '', 'No such directory: {}\n'.format( os.path.dirname( junction ) ) )
+              self.filesets[name] = junction
+           return ( 0, '', '' )
+
+
+    def mmlsfileset( self ):
+        lines = [ 'mmlsfileset::HEADER:version:reserved:reserved:filesystemName:filesetName:id:status:path:inodeSpace:' ]
+        for ( idx, name ) in enumerate( sorted( self.filesets ) ):
+            path = self.filesets[name]
+            lines.append( 'mmlsfileset::0:1:::fs0:{}:{}:{}:{}:0:'.format( name, idx, 'Linked' if path else 'Unlinked',
+                                                                        ( path or '--' ).replace( '/', '%2F' ) ) )
+        return '\n'.join( lines ) + '\n'
+
+
+    def sequence( self, command, name ):
+        for ( idx, ( called, args ) ) in enumerate( self.calls ):
+            if called == command and name in args:
+               return idx
+        return None
+
+
+class ProvisionTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = FilesetBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.filesystem = ssapi.Filesystem( 'fs0', Lazy=True )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_nested_junctions_are_linked_parent_first( self ):
+        specs = [ { 'name': 'child', 'junction': '/gpfs/fs0/parent/child', 'files': '1M:2M' },
+                  { 'name': 'parent', 'junction': '/gpfs/fs0/parent/', 'inode_space': 'new' },
+                  { 'name': 'other', 'junction': '/gpfs/fs0/other' } ]
+        report = self.filesystem.provision_filesets( specs, max_workers=4, backoff=0 )
+
+        self.assertEqual( list( report.keys() ), [ 'child', 'parent', 'other' ] )
+        for name in report:
+            self.assertTrue( report[name]['ok'], report[name] )
+        self.assertTrue( self.backend.sequence( 'mmlinkfileset', 'parent' ) < self.backend.sequence( 'mmcrfileset', 'child' ) )
+        self.assertEqual( report['child']['quota']['rc'], 0 )
+        self.assertEqual( report['parent']['quota'], None )
+        self.assertEqual( [ call[0] for call in self.backend.calls ].count( 'mmlsfileset' ), 1 )
+
+
+    def test_busy_commands_are_retried( self ):
+        self.backend.failures[( 'mmcrfileset', 'busy' )] = 2
+        self.backend.failures[( 'mmsetquota', 'busy' )] = 1
+        report = self.filesystem.provision_filesets( [ { 'name': 'busy', 'junction': '/gpfs/fs0/busy', 'block': '1T:2T' } ],
+                                                     backoff=0 )
+        self.assertEqual( report['busy']['create']['attempts'], 3 )
+        self.assertEqual( report['busy']['link']['attempts'], 1 )
+        self.assertEqual( report['busy']['quota']['attempts'], 2 )
+        self.assertTrue( report['busy']['ok'] )
+
+
+    def test_failed_step_stops_the_fileset( self ):
+        self.backend.failures[( 'mmcrfileset', 'late' )] = 3
+        specs = [ { 'name': 'orphan', 'junction': '/gpfs/fs0/missing/orphan', 'block': '1T:2T' },
+                  { 'name': 'late', 'junction': '/gpfs/fs0/late' } ]
+        report = self.filesystem.provision_filesets( specs, retries=2, backoff=0 )
+
+        self.assertEqual( report['orphan']['create']['rc'], 0 )
+        self.assertEqual( report['orphan']['link']['rc'], 1 )
+        self.assertEqual( report['orphan']['quota'], None )
+        self.assertFalse( report['orphan']['ok'] )
+        self.assertEqual( report['late']['create']['attempts'], 3 )
+        self.assertEqual( report['late']['link'], None )
+        self.assertFalse( report['late']['ok'] )
+
+
+    def test_dry_run_and_duplicates( self ):
+        report = self.filesystem.provision_filesets( [ { 'name': 'a b', 'junction': '/gpfs/fs0/a b', 'comment': "it's" } ],
+                                                     DryRun=True )
+        self.assertEqual( report['a b']['commands'],
+                          [ "/usr/lpp/mmfs/bin/mmcrfileset fs0 'a b' -t 'it'\"'\"'s'",
+                            "/usr/lpp/mmfs/bin/mmlinkfileset fs0 'a b' -J '/gpfs/fs0/a b'" ] )
+        self.assertEqual( self.backend.calls, [] )
+        self.assertRaises( ValueError, self.filesystem.provision_filesets, [ { 'name': 'x' }, { 'name': 'x' } ] )
+
+
+if __name__ == '__main__':
+   unittest.main()
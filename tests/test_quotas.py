@@ -0,0 +1,119 @@
+import os
+import unittest
+
+import ssapi
+
+
+quota_header = ( 'mmrepquota::HEADER:version:reserved:reserved:filesystemName:quotaType:id:name:blockUsage:blockQuota:'
+                 'blockLimit:blockInDoubt:blockGrace:filesUsage:filesQuota:filesLimit:filesInDoubt:filesGrace:remarks:'
+                 'quota:defQuota:fid:filesetname:' )
+
+# ( quotaType, name, blockUsage, blockQuota, blockGrace, filesUsage, filesQuota, filesGrace, filesetname )
+quotas = [ ( 'USR', 'at_quota', 1000, 1000, 'none', 10, 10, 'none', 'proj1' ),
+           ( 'USR', 'over', 1001, 1000, '6 days', 1, 10, 'none', 'proj1' ),
+           ( 'USR', 'no_quota', 5000, 0, 'none', 1, 0, 'none', 'proj2' ),
+           ( 'USR', 'expired', 3000, 1000, 'expired', 1, 10, 'none', 'proj2' ),
+           ( 'USR', 'hour', 1500, 1000, '1 hour', 11, 10, '2 minutes', 'proj1' ),
+           ( 'GRP', 'staff', 2000, 1000, '3 days', 20, 0, 'none', 'proj1' ),
+           ( 'FILESET', 'proj1', 7000, 10000, 'none', 50, 100, 'none', '' ),
+           ( 'FILESET', 'proj2', 8000, 6000, '2 hours', 60, 0, 'none', '' ) ]
+
+
+class QuotaBackend( ssapi.CommandBackend ):
+    """
+    Runs mmrepquota for the quotas above, and mmlsfileset for root, proj1, proj2
+    and proj3, which has no quota entries.
+    """
+    def run( self, shellCommand ):
+        command = os.path.basename( shellCommand[0] )
+        if command == 'mmrepquota':
+           lines = [ quota_header ]
+           for ( idx, ( kind, name, busage, bquota, bgrace, fusage, fquota, fgrace, fileset ) ) in enumerate( quotas ):
+               lines.append( 'mmrepquota::0:1:::fs0:{}:{}:{}:{}:{}:{}:0:{}:{}:{}:{}:0:{}:i:on:off:{}:{}:'.format(
+                             kind, idx, name, busage, bquota, bquota * 2, bgrace, fusage, fquota, fquota * 2, fgrace, idx, fileset ) )
+           return ( 0, '\n'.join( lines ) + '\n', '' )
+        if command == 'mmlsfileset':
+           lines = [ 'mmlsfileset::HEADER:version:reserved:reserved:filesystemName:filesetName:id:status:path:inodeSpace:maxInodes:' ]
+           for ( idx, name ) in enumerate( [ 'root', 'proj1', 'proj2', 'proj3' ] ):
+               lines.append( 'mmlsfileset::0:1:::fs0:{}:{}:Linked:%2Fgpfs%2Ffs0%2F{}:{}:1000:'.format( name, idx, name, idx ) )
+           return ( 0, '\n'.join( lines ) + '\n', '' )
+        return ( 1, '', 'QuotaBackend: {} is not supported\n'.format( command ) )
+
+
+def names( entries ):
+    return [ entry['name'] for entry in entries ]
+
+
+class QuotasTest( unittest.TestCase ):
+    """
+    Every query is checked on the streamed report and on a QuotaTable.
+    """
+    def setUp( self ):
+        self.previous = ssapi.set_command_backend( QuotaBackend() )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def each( self ):
+        return [ ssapi.Quotas( 'fs0' ), ssapi.Quotas( 'fs0', Compact=True ) ]
+
+
+    def test_top( self ):
+        for quota in self.each():
+            self.assertEqual( names( quota.top( 3 ) ), [ 'proj2', 'proj1', 'no_quota' ] )
+            self.assertEqual( names( quota.top( 3, quotaType='USR' ) ), [ 'no_quota', 'expired', 'hour' ] )
+            self.assertEqual( names( quota.top( 2, 'filesUsage' ) ), [ 'proj2', 'proj1' ] )
+            self.assertEqual( names( quota.top( 100, quotaType='GRP' ) ), [ 'staff' ] )
+            self.assertEqual( quota.top( 5, quotaType='NONE' ), [] )
+            self.assertEqual( len( quota.top( 100 ) ), len( quotas ) )
+
+
+    def test_over_soft_limit( self ):
+        for quota in self.each():
+            # Usage equal to the soft limit is not over it, and a zero soft limit
+            # means there is none.
+            self.assertEqual( names( quota.over_soft_limit() ), [ 'over', 'expired', 'hour', 'staff', 'proj2' ] )
+            self.assertEqual( names( quota.over_soft_limit( quotaType='USR' ) ), [ 'over', 'expired', 'hour' ] )
+            self.assertEqual( names( quota.over_soft_limit( 'files' ) ), [ 'hour' ] )
+
+
+    def test_grace_expiring( self ):
+        for quota in self.each():
+            expiring = quota.grace_expiring( 3600 )
+            self.assertEqual( [ ( seconds, entry['name'] ) for ( seconds, entry ) in expiring ], [ ( 0, 'expired' ), ( 3600, 'hour' ) ] )
+            # 'none' never expires, and the boundary is inclusive.
+            self.assertEqual( names( entry for ( seconds, entry ) in quota.grace_expiring( 3599 ) ), [ 'expired' ] )
+            self.assertEqual( names( entry for ( seconds, entry ) in quota.grace_expiring( 0 ) ), [ 'expired' ] )
+            self.assertEqual( names( entry for ( seconds, entry ) in quota.grace_expiring( 7 * 86400 ) ),
+                              [ 'expired', 'hour', 'proj2', 'staff', 'over' ] )
+            self.assertEqual( names( entry for ( seconds, entry ) in quota.grace_expiring( 86400, quotaType='FILESET' ) ), [ 'proj2' ] )
+            self.assertEqual( [ ( seconds, entry['name'] ) for ( seconds, entry ) in quota.grace_expiring( 86400, 'files' ) ], [ ( 120, 'hour' ) ] )
+
+
+    def test_grace_seconds( self ):
+        self.assertEqual( ssapi.quota_grace_seconds( 'none' ), None )
+        self.assertEqual( ssapi.quota_grace_seconds( '' ), None )
+        self.assertEqual( ssapi.quota_grace_seconds( 'expired' ), 0 )
+        self.assertEqual( ssapi.quota_grace_seconds( '1 day' ), 86400 )
+        self.assertEqual( ssapi.quota_grace_seconds( '6 days' ), 6 * 86400 )
+        self.assertEqual( ssapi.quota_grace_seconds( 'soon' ), None )
+
+
+    def test_by_fileset( self ):
+        for quota in self.each():
+            totals = quota.by_fileset()
+            self.assertEqual( sorted( totals ), [ 'proj1', 'proj2', 'proj3', 'root' ] )
+            proj1 = totals['proj1']
+            self.assertEqual( ( proj1['blockUsage'], proj1['blockQuota'], proj1['blockLimit'] ), ( 7000, 10000, 20000 ) )
+            self.assertEqual( ( proj1['users'], proj1['userBlockUsage'] ), ( 3, 3501 ) )
+            self.assertEqual( ( proj1['groups'], proj1['groupBlockUsage'] ), ( 1, 2000 ) )
+            self.assertEqual( ( proj1['path'], proj1['fstype'] ), ( '/gpfs/fs0/proj1', 'Independent' ) )
+            self.assertEqual( ( totals['proj2']['users'], totals['proj2']['userBlockUsage'] ), ( 2, 8000 ) )
+            self.assertEqual( ( totals['proj3']['blockUsage'], totals['proj3']['users'], totals['proj3']['path'] ),
+                              ( 0, 0, '/gpfs/fs0/proj3' ) )
+
+
+if __name__ == '__main__':
+   unittest.main()
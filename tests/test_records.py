@@ -0,0 +1,49 @@
+import unittest
+
+import ssapi
+
+
+def fileset_table():
+    table = ssapi.RecordTable( ( 'id', 'inodes' ) )
+    keys = [ 'filesetName', 'id', 'inodes', 'path' ]
+    for ( idx, name ) in enumerate( ( 'root', 'a', 'b' ) ):
+        table.add( keys, [ name, str( idx ), str( idx * 1000 ), '/gpfs/fs0/' + name ], 'filesetName' )
+    table.finish()
+    return table
+
+
+class RecordTableTest( unittest.TestCase ):
+    def test_numeric_fields( self ):
+        table = fileset_table()
+        self.assertEqual( table['a']['id'], 1 )
+        self.assertEqual( table['b']['path'], '/gpfs/fs0/b' )
+
+
+    def test_copy_record_with_int_values( self ):
+        table = fileset_table()
+        table['c2'] = table['a']
+        self.assertEqual( table['c2'], table['a'] )
+        self.assertEqual( table['c2']['inodes'], 1000 )
+        self.assertEqual( sorted( table.keys() ), [ 'a', 'b', 'c2', 'root' ] )
+
+
+    def test_compact_drops_dead_rows( self ):
+        table = fileset_table()
+        expected = table.to_dict()
+        del expected['a']
+        del table['a']
+        table['b'] = table['b']
+        self.assertEqual( table.length, 4 )
+
+        table.compact()
+        self.assertEqual( table.length, 2 )
+        self.assertEqual( table, expected )
+        self.assertEqual( len( table.columns[table.index['path']].values ), 3 )
+
+        table['d'] = { 'filesetName': 'd', 'id': '4', 'inodes': 7 }
+        self.assertEqual( table['d']['id'], 4 )
+        self.assertNotIn( 'path', table['d'] )
+
+
+if __name__ == '__main__':
+   unittest.main()
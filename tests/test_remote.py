@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import unittest
+
+import ssapi
+
+
+fake_rsh = [ sys.executable, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'fake_rsh.py' ) ]
+
+
+class RemoteShellsTest( unittest.TestCase ):
+    def setUp( self ):
+        self.shells = ssapi.RemoteShells( fake_rsh )
+
+
+    def tearDown( self ):
+        self.shells.close()
+
+
+    def test_return_code_and_output( self ):
+        self.assertEqual( self.shells.run( 'node1', 'echo hi' ), ( 0, 'hi\n', '' ) )
+        self.assertEqual( self.shells.run( 'node1', 'printf no-newline; exit 3' ), ( 3, 'no-newline', '' ) )
+
+
+    def test_stderr( self ):
+        ( rc, out, err ) = self.shells.run( 'node1', 'echo out; echo oops >&2; false' )
+        self.assertEqual( ( rc, out, err ), ( 1, 'out\n', 'oops\n' ) )
+
+
+    def test_shell_is_reused( self ):
+        first = self.shells.run( 'node1', 'echo $PPID' )[1]
+        self.shells.run( 'node1', 'exit 4' )
+        self.assertEqual( self.shells.run( 'node1', 'echo $PPID' )[1], first )
+
+
+    def test_split_marker( self ):
+        for command in ( 'echo hi', 'printf x', 'echo err >&2; exit 12' ):
+            expected = self.shells.run( 'node1', command )
+            self.assertEqual( self.shells.run( 'split-node1', command, timeout=10 ), expected )
+
+
+    def test_large_output( self ):
+        ( rc, out, err ) = self.shells.run( 'node1', "head -c 4000000 /dev/zero | tr '\\0' x; echo; echo err >&2" )
+        self.assertEqual( ( rc, len( out ), out.count( 'x' ), err ), ( 0, 4000001, 4000000, 'err\n' ) )
+        self.assertEqual( self.shells.run( 'node1', 'echo hi' ), ( 0, 'hi\n', '' ) )
+
+
+    def test_timeout( self ):
+        start = time.time()
+        try:
+           self.shells.run( 'node1', 'sleep 30', timeout=0.5 )
+        except ValueError as error:
+           self.assertTrue( str( error ).startswith( 'Timeout: sleep 30 on node1' ), error )
+        else:
+           self.fail( 'no timeout' )
+        self.assertTrue( time.time() - start < 10 )
+        self.assertEqual( self.shells.run( 'node1', 'echo again' ), ( 0, 'again\n', '' ) )
+
+
+    def test_connection_refused( self ):
+        try:
+           self.shells.run( 'down', 'echo hi', timeout=10 )
+        except ValueError as error:
+           self.assertTrue( str( error ).startswith( 'ConnectionClosed: down' ), error )
+        else:
+           self.fail( 'no error' )
+
+
+    def test_shell_killed( self ):
+        self.assertRaises( ValueError, self.shells.run, 'node1', 'kill -9 $$', 10 )
+        self.assertEqual( self.shells.run( 'node1', 'echo back' ), ( 0, 'back\n', '' ) )
+
+
+class ClusterRunOnNodesTest( unittest.TestCase ):
+    def test_run_on_nodes( self ):
+        cluster = ssapi.Cluster( Lazy=True )
+        cluster.cluster_info = { 'rsh': ' '.join( fake_rsh ),
+                                 'nodes': { '1': { 'daemon_name': 'd1', 'admin_name': 'node1' },
+                                            '2': { 'daemon_name': 'd2', 'admin_name': 'split-node2' },
+                                            '3': { 'daemon_name': 'd3', 'admin_name': 'down' } } }
+        try:
+           results = dict( ( node, ( result, error ) ) for ( node, result, error ) in cluster.run_on_nodes( 'echo up', timeout=10 ) )
+           self.assertEqual( results['node1'], ( ( 0, 'up\n', '' ), None ) )
+           self.assertEqual( results['split-node2'], ( ( 0, 'up\n', '' ), None ) )
+           self.assertTrue( isinstance( results['down'][1], ValueError ) )
+
+           self.assertEqual( sorted( node for ( node, result, error ) in cluster.run_on_nodes( 'true', nodes=[ 1, 'd2' ] ) ),
+                             [ 'node1', 'split-node2' ] )
+        finally:
+           cluster.close_remote_shells()
+
+
+if __name__ == '__main__':
+   unittest.main()
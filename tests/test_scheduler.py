@@ -0,0 +1,52 @@
+import threading
+import time
+import unittest
+
+import ssapi
+
+
+class CommandSchedulerTest( unittest.TestCase ):
+    def tearDown( self ):
+        ssapi.disable_command_scheduler()
+
+
+    def test_timeout_kills_the_process_group( self ):
+        scheduler = ssapi.enable_command_scheduler( timeout=0.5 )
+        start = time.time()
+        try:
+           ssapi.execute_command( "/bin/sh -c 'sleep 30 & sleep 30'" )
+        except ValueError as error:
+           self.assertTrue( str( error ).startswith( 'Timeout' ), error )
+        else:
+           self.fail( 'no timeout' )
+        self.assertTrue( time.time() - start < 10 )
+        self.assertEqual( scheduler.stats()['timed_out'], 1 )
+
+
+    def test_per_device_limit( self ):
+        scheduler = ssapi.CommandScheduler( max_running=8, max_per_device=1 )
+        first = scheduler.enter( 'mmrepquota -u -g -j fs0 -Y'.split() )
+        self.assertEqual( first.device, 'fs0' )
+
+        tickets = []
+        waiter = threading.Thread( target=lambda: tickets.append( scheduler.enter( 'mmsetquota fs0:proj1 --files 1M:2M'.split() ) ) )
+        waiter.daemon = True
+        waiter.start()
+        other = scheduler.enter( 'mmlsfileset fs1 -Y'.split() )
+
+        deadline = time.time() + 5
+        while scheduler.stats()['queued'] != 1 and time.time() < deadline:
+            time.sleep( 0.01 )
+        self.assertEqual( scheduler.stats()['running_by_device'], { 'fs0': 1, 'fs1': 1 } )
+        self.assertEqual( scheduler.stats()['queued'], 1 )
+
+        scheduler.leave( first )
+        waiter.join( 5 )
+        self.assertEqual( tickets[0].device, 'fs0' )
+        scheduler.leave( tickets[0] )
+        scheduler.leave( other )
+        self.assertEqual( scheduler.stats()['completed'], 3 )
+
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+import unittest
+
+import ssapi
+
+
+class SnapshotBackend( ssapi.CommandBackend ):
+    """
+    Keeps the snapshots of fs0, a dictionary of fileset -> list of snapshot names,
+    and runs mmlssnapshot, mmcrsnapshot and mmdelsnapshot against them.  Global
+    snapshots are under ''.  busy[( command, snapshot or fileset )] is the number
+    of times that command fails as busy before it works.  A ( command, snapshot )
+    or ( command, fileset ) in broken always fails.
+    delay is how long mmcrsnapshot and mmdelsnapshot take, and max_active is the
+    most of them that ran at the same time.
+    """
+    def __init__( self, snapshots ):
+        self.snapshots = snapshots
+        self.busy = {}
+        self.broken = set()
+        self.calls = []
+        self.delay = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+
+    def read_file( self, path ):
+        return "%%home%%:20_MEMBER_NODE::1:1:node1:10.0.0.1:node1:manager::::::node1:node1:\n"
+
+
+    def run( self, shellCommand ):
+        command = os.path.basename( shellCommand[0] )
+        args = shellCommand[1:]
+        fileset = args[args.index( '-j' ) + 1] if '-j' in args else ''
+        with self.lock:
+           self.calls.append( ( command, tuple( args ) ) )
+           if command == 'mmlssnapshot':
+              return ( 0, self.mmlssnapshot( fileset if '-j' in args else None ), '' )
+           if command == 'mmlsfileset':
+              return ( 0, self.mmlsfileset(), '' )
+           name = args[1]
+           if ( command, name ) in self.broken or ( command, fileset ) in self.broken:
+              return ( 2, '', '{}: Snapshot {} is not valid.\n'.format( command, name ) )
+           for key in ( ( command, name ), ( command, fileset ) ):
+               if self.busy.get( key, 0 ):
+                  self.busy[key] -= 1
+                  return ( 1, '', '{}: Another mm command is running.\n'.format( command ) )
+           self.active = self.active + 1
+           self.max_active = max( self.max_active, self.active )
+
+        time.sleep( self.delay )
+
+        with self.lock:
+           self.active = self.active - 1
+           if command == 'mmcrsnapshot':
+              self.snapshots.setdefault( fileset, [] ).append( name )
+           elif command == 'mmdelsnapshot':
+              self.snapshots[fileset].remove( name )
+           return ( 0, '', '' )
+
+
+    def mmlssnapshot( self, fileset ):
+        lines = [ 'mmlssnapshot::HEADER:version:reserved:reserved:filesystemName:directory:snapID:status:created:fileset:' ]
+        for ( owner, names ) in sorted( self.snapshots.items() ):
+            if fileset is not None and owner != fileset:
+               continue
+            for name in names:
+                lines.append( 'mmlssnapshot::0:1:::fs0:{}:{}:Valid:now:{}:'.format( name, len( lines ), owner ) )
+        return '\n'.join( lines ) + '\n'
+
+
+    def mmlsfileset( self ):
+        """
+        Every fileset with snapshots is independent, and there is a dependent one.
+        """
+        lines = [ 'mmlsfileset::HEADER:version:reserved:reserved:filesystemName:filesetName:id:path:inodeSpace:' ]
+        for ( idx, name ) in enumerate( sorted( self.snapshots ) + [ 'dependent' ] ):
+            inode_space = 0 if name == 'dependent' else idx + 1
+            lines.append( 'mmlsfileset::0:1:::fs0:{}:{}:%2Fgpfs%2Ffs0%2F{}:{}:'.format( name, idx + 1, name, inode_space ) )
+        return '\n'.join( lines ) + '\n'
+
+
+    def commands( self, command ):
+        return [ args for ( called, args ) in self.calls if called == command ]
+
+
+class DeleteSnapshotsTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = SnapshotBackend( { 'proj1': [ 'proj1_{}'.format( idx ) for idx in range( 8 ) ],
+                                          'proj2': [ 'proj2_0', 'proj2_1' ] } )
+        self.previous = ssapi.set_command_backend( self.backend )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def test_report_per_snapshot( self ):
+        self.backend.broken.add( ( 'mmdelsnapshot', 'proj1_1' ) )
+        snaps = ssapi.Snapshots( 'fs0', 'proj1' )
+        report = snaps.delete_snapshots( [ 'proj1_0', 'proj1_1', 'proj1_2' ], backoff=0 )
+
+        self.assertEqual( sorted( report ), [ 'proj1_0', 'proj1_1', 'proj1_2' ] )
+        self.assertEqual( report['proj1_0'], { 'rc': 0, 'stdout': '', 'stderr': '', 'attempts': 1 } )
+        self.assertEqual( report['proj1_1']['rc'], 2 )
+        self.assertTrue( 'not valid' in report['proj1_1']['stderr'] )
+        self.assertEqual( report['proj1_1']['attempts'], 1 )
+        # The snapshot list is fetched again afterwards.
+        self.assertEqual( snaps.snaplist, sorted( [ 'proj1_1' ] + [ 'proj1_{}'.format( idx ) for idx in range( 3, 8 ) ] ) )
+
+
+    def test_busy_deletions_are_retried( self ):
+        self.backend.busy[( 'mmdelsnapshot', 'proj1_0' )] = 2
+        self.backend.busy[( 'mmdelsnapshot', 'proj1_1' )] = 5
+        snaps = ssapi.Snapshots( 'fs0', 'proj1' )
+        report = snaps.delete_snapshots( [ 'proj1_0', 'proj1_1' ], retries=3, backoff=0 )
+
+        self.assertEqual( ( report['proj1_0']['rc'], report['proj1_0']['attempts'] ), ( 0, 3 ) )
+        # Still busy once the retries are used up.
+        self.assertEqual( ( report['proj1_1']['rc'], report['proj1_1']['attempts'] ), ( 1, 4 ) )
+        self.assertTrue( 'proj1_1' in self.backend.snapshots['proj1'] )
+
+
+    def test_other_filesets_from_a_device_list( self ):
+        snaps = ssapi.Snapshots( 'fs0', '' )
+        report = snaps.delete_snapshots( [ 'proj2_0', ( 'proj1', 'proj1_7' ) ], Refresh=False )
+
+        self.assertEqual( report['proj2_0']['rc'], 0 )
+        self.assertEqual( report[( 'proj1', 'proj1_7' )]['rc'], 0 )
+        self.assertEqual( sorted( self.backend.commands( 'mmdelsnapshot' ) ),
+                          [ ( 'fs0', 'proj1_7', '-j', 'proj1' ), ( 'fs0', 'proj2_0', '-j', 'proj2' ) ] )
+        self.assertEqual( len( self.backend.commands( 'mmlssnapshot' ) ), 1 )
+
+
+    def test_bounded_concurrency( self ):
+        self.backend.delay = 0.05
+        snaps = ssapi.Snapshots( 'fs0', 'proj1' )
+        report = snaps.delete_snapshots( list( snaps.snaplist ), max_workers=3 )
+
+        self.assertEqual( len( report ), 8 )
+        self.assertEqual( self.backend.snapshots['proj1'], [] )
+        self.assertTrue( 1 < self.backend.max_active <= 3, self.backend.max_active )
+
+
+class RotateSnapshotsTest( unittest.TestCase ):
+    def setUp( self ):
+        self.backend = SnapshotBackend( { 'proj1': [ 'proj1_{}'.format( idx ) for idx in range( 5 ) ],
+                                          'proj2': [ 'proj2_0', 'proj2_1' ] } )
+        self.previous = ssapi.set_command_backend( self.backend )
+        self.filesystem = ssapi.Filesystem( 'fs0', Lazy=True )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+
+
+    def position( self, command, name ):
+        for ( idx, ( called, args ) ) in enumerate( self.backend.calls ):
+            if called == command and name in args:
+               return idx
+        return None
+
+
+    def test_purge_after_create( self ):
+        report = self.filesystem.rotate_snapshots( 3, backoff=0 )
+
+        self.assertEqual( sorted( report ), [ 'proj1', 'proj2' ] )
+        self.assertEqual( sorted( report['proj1']['delete'] ), [ 'proj1_0', 'proj1_1', 'proj1_2' ] )
+        self.assertEqual( report['proj2']['delete'], {} )
+        self.assertEqual( report['proj1']['create']['rc'], 0 )
+        for sname in report['proj1']['delete']:
+            self.assertEqual( report['proj1']['delete'][sname]['rc'], 0 )
+            self.assertTrue( self.position( 'mmcrsnapshot', report['proj1']['snapshot'] ) < self.position( 'mmdelsnapshot', sname ) )
+
+        self.assertEqual( self.backend.snapshots['proj1'], [ 'proj1_3', 'proj1_4', report['proj1']['snapshot'] ] )
+        self.assertEqual( self.backend.snapshots['proj2'], [ 'proj2_0', 'proj2_1', report['proj2']['snapshot'] ] )
+        # One mmlssnapshot of the whole device, and the dependent fileset is left alone.
+        self.assertEqual( self.backend.commands( 'mmlssnapshot' ), [ ( 'fs0', '-Y' ) ] )
+        self.assertFalse( 'dependent' in report )
+
+
+    def test_failed_create_purges_nothing( self ):
+        self.backend.broken.add( ( 'mmcrsnapshot', 'proj1' ) )
+        report = self.filesystem.rotate_snapshots( 2, backoff=0 )
+
+        self.assertEqual( report['proj1']['create']['rc'], 2 )
+        self.assertEqual( report['proj1']['delete'], dict( ( 'proj1_{}'.format( idx ), None ) for idx in range( 4 ) ) )
+        self.assertEqual( len( self.backend.snapshots['proj1'] ), 5 )
+        self.assertEqual( [ args for args in self.backend.commands( 'mmdelsnapshot' ) if 'proj1' in args ], [] )
+        # The other filesets are still rotated.
+        self.assertEqual( self.backend.snapshots['proj2'], [ 'proj2_1', report['proj2']['snapshot'] ] )
+
+
+    def test_busy_create_is_retried( self ):
+        self.backend.busy[( 'mmcrsnapshot', 'proj2' )] = 1
+        report = self.filesystem.rotate_snapshots( 2, filesets=[ 'proj2' ], backoff=0 )
+
+        self.assertEqual( report['proj2']['create']['attempts'], 2 )
+        self.assertEqual( report['proj2']['delete']['proj2_0']['rc'], 0 )
+
+
+    def test_dry_run_runs_no_commands( self ):
+        report = self.filesystem.rotate_snapshots( 3, DryRun=True )
+
+        self.assertEqual( report['proj1']['create'], None )
+        self.assertEqual( report['proj1']['delete'], { 'proj1_0': None, 'proj1_1': None, 'proj1_2': None } )
+        self.assertEqual( self.backend.commands( 'mmcrsnapshot' ), [] )
+        self.assertEqual( self.backend.commands( 'mmdelsnapshot' ), [] )
+        self.assertEqual( len( self.backend.snapshots['proj1'] ), 5 )
+
+
+if __name__ == '__main__':
+   unittest.main()
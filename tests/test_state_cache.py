@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import ssapi
+import ssapi_bench
+
+
+class ClusterBackend( ssapi_bench.SyntheticBackend ):
+    """
+    A small synthetic cluster that counts the commands it runs, with an mmsdrfs
+    whose version line gives the configuration generation.
+    """
+    def __init__( self ):
+        ssapi_bench.SyntheticBackend.__init__( self, nsds=4, nodes=4, filesystems=2 )
+        self.generation = '7'
+        self.commands = []
+        self.sdrfs_lines = 0
+
+
+    def run( self, shellCommand ):
+        self.commands.append( os.path.basename( shellCommand[0] ) )
+        return ssapi_bench.SyntheticBackend.run( self, shellCommand )
+
+
+    def read_lines( self, path ):
+        if not path.endswith( 'mmsdrfs' ):
+           for line in ssapi.CommandBackend.read_lines( self, path ):
+               yield line
+           return
+        lines = [ '%%9999%%:00_VERSION_LINE::{}:3:::'.format( self.generation ) ]
+        lines.extend( '%%home%%:20_MEMBER_NODE::{}:::'.format( idx ) for idx in range( 1000 ) )
+        for line in lines:
+            self.sdrfs_lines = self.sdrfs_lines + 1
+            yield line
+
+
+class ClusterStateCacheTest( unittest.TestCase ):
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join( self.directory, 'state.json' )
+        self.backend = ClusterBackend()
+        self.previous = ssapi.set_command_backend( self.backend )
+
+
+    def tearDown( self ):
+        ssapi.set_command_backend( self.previous )
+        shutil.rmtree( self.directory )
+
+
+    def cluster( self, **kwargs ):
+        return ssapi.Cluster( StateCache=ssapi.ClusterStateCache( self.path ), **kwargs )
+
+
+    def test_generation_reads_only_the_version_line( self ):
+        self.assertEqual( ssapi.read_config_generation(), '7' )
+        self.assertEqual( self.backend.sdrfs_lines, 1 )
+
+
+    def test_lazy_cluster_saves_state( self ):
+        cluster = self.cluster( Lazy=True )
+        info = cluster.cluster_info
+        self.assertFalse( os.path.exists( self.path ) )
+        gpfsdevs = cluster.gpfsdevs
+        self.assertTrue( os.path.exists( self.path ) )
+
+        del self.backend.commands[:]
+        cluster = self.cluster( Lazy=True )
+        self.assertEqual( cluster.cluster_info, info )
+        self.assertEqual( cluster.gpfsdevs, gpfsdevs )
+        self.assertEqual( self.backend.commands, [] )
+
+
+    def test_new_generation_fetches_again( self ):
+        self.cluster()
+        self.backend.generation = '8'
+        del self.backend.commands[:]
+        self.cluster()
+        self.assertIn( 'mmlscluster', self.backend.commands )
+        self.assertIn( 'mmlsnsd', self.backend.commands )
+
+
+if __name__ == '__main__':
+   unittest.main()